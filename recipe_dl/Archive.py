@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import struct
+import threading
+import time
+import zipfile
+import zlib
+
+from . import JsonCodec
+
+INDEX_NAME = 'index.json'
+
+# Zip extra field holding the index entry (url, title, format) of each
+# entry.  It is in the local header too, so the index can be rebuilt from an
+# archive whose run was killed before the central directory was written.
+INDEX_EXTRA_ID = 0x7264
+
+_LOCAL_HEADER = struct.Struct('<4s5H3I2H')
+_LOCAL_SIGNATURE = b'PK\x03\x04'
+_EXTRA_HEADER = struct.Struct('<HH')
+
+_archive = None
+
+def index_extra(url, title, format):
+    """ Returns the zip extra field recording url, title and format """
+
+    data = JsonCodec.dumps({'url': url, 'title': title, 'format': format}).encode('utf-8')
+    return _EXTRA_HEADER.pack(INDEX_EXTRA_ID, len(data)) + data
+
+def extra_index_entry(name, extra):
+    """ Returns the index entry recorded in the zip extra field of entry
+        name, or None
+    """
+
+    while len(extra) >= _EXTRA_HEADER.size:
+        header_id, size = _EXTRA_HEADER.unpack(extra[:_EXTRA_HEADER.size])
+        if header_id == INDEX_EXTRA_ID:
+            entry = JsonCodec.loads(extra[_EXTRA_HEADER.size:_EXTRA_HEADER.size + size])
+            entry['name'] = name
+            return entry
+        extra = extra[_EXTRA_HEADER.size + size:]
+    return None
+
+def recover_entries(filename):
+    """ Yields (ZipInfo, data) of each complete entry of the zip archive
+        filename by reading the local headers in turn, so it works on
+        archives missing their central directory.  Stops at the central
+        directory or at the first damaged entry.
+    """
+
+    with open(filename, 'rb') as zip_file:
+        while True:
+            header = zip_file.read(_LOCAL_HEADER.size)
+            if len(header) < _LOCAL_HEADER.size:
+                return
+            signature, _, flags, method, mod_time, mod_date, crc, compressed_size, _, name_length, extra_length = _LOCAL_HEADER.unpack(header)
+            # Entries with a data descriptor (0x08) have no sizes here
+            if signature != _LOCAL_SIGNATURE or flags & 0x08:
+                return
+            name = zip_file.read(name_length).decode('utf-8' if flags & 0x800 else 'cp437')
+            extra = zip_file.read(extra_length)
+            data = zip_file.read(compressed_size)
+            if len(data) < compressed_size:
+                return
+            try:
+                if method == zipfile.ZIP_DEFLATED:
+                    data = zlib.decompress(data, -15)
+                elif method != zipfile.ZIP_STORED:
+                    return
+            except zlib.error:
+                return
+            if zlib.crc32(data) != crc:
+                return
+            try:
+                info = zipfile.ZipInfo(name, ((mod_date >> 9) + 1980, (mod_date >> 5) & 0xf, mod_date & 0x1f, mod_time >> 11, (mod_time >> 5) & 0x3f, (mod_time & 0x1f) * 2))
+            except ValueError:
+                info = zipfile.ZipInfo(name)
+            info.extra = extra
+            yield info, data
+
+class RecipeArchive:
+    """ Zip archive of rendered recipes.  Entries are compressed and written
+        as they are added; index.json listing the url, title and format of
+        every entry is added when the archive is closed.  Any entry can be
+        read back without unpacking the rest.
+
+        Mode 'a' keeps the entries of an existing archive, including one
+        left without its central directory by a killed run.
+    """
+
+    def __init__(self, filename, mode='r'):
+        self.filename = filename
+        self.mode = mode
+        self.lock = threading.Lock()
+        self.entries = {}
+        if mode == 'a':
+            self._reopen()
+            return
+        self.zip_file = zipfile.ZipFile(filename, mode, compression=zipfile.ZIP_DEFLATED)
+        if mode == 'r':
+            if INDEX_NAME in self.zip_file.namelist():
+                for entry in JsonCodec.loads(self.zip_file.read(INDEX_NAME)):
+                    self.entries[entry['name']] = entry
+            else:
+                for info in self.zip_file.infolist():
+                    entry = extra_index_entry(info.filename, info.extra)
+                    if not entry is None:
+                        self.entries[info.filename] = entry
+
+    def _reopen(self):
+        """ Rewrites the entries of the existing archive (but its index) into
+            a new archive that further entries are added to
+        """
+
+        # An .old file left behind is from a rewrite that did not finish
+        old_filename = self.filename + '.old'
+        if not os.path.exists(old_filename):
+            if not os.path.exists(self.filename):
+                self.zip_file = zipfile.ZipFile(self.filename, 'w', compression=zipfile.ZIP_DEFLATED)
+                return
+            os.replace(self.filename, old_filename)
+
+        self.zip_file = zipfile.ZipFile(self.filename, 'w', compression=zipfile.ZIP_DEFLATED)
+        old_index = {}
+        for info, data in recover_entries(old_filename):
+            if info.filename == INDEX_NAME:
+                old_index = dict((entry['name'], entry) for entry in JsonCodec.loads(data))
+                continue
+            entry = extra_index_entry(info.filename, info.extra)
+            info.compress_type = zipfile.ZIP_DEFLATED
+            info.external_attr = 0o644 << 16
+            self.zip_file.writestr(info, data)
+            self.entries[info.filename] = entry or {'name': info.filename, 'url': '', 'title': '', 'format': os.path.splitext(info.filename)[1][1:]}
+        # Entries written before the index was kept in the extra field
+        for name, entry in old_index.items():
+            if name in self.entries and self.entries[name]['url'] == '':
+                self.entries[name] = entry
+        self.zip_file.fp.flush()
+        os.unlink(old_filename)
+
+    def add(self, name, text, url='', title='', format=''):
+        """ Compresses text into the archive as name, or as name-2, name-3...
+            if the archive already holds name.  Returns the name used.
+        """
+
+        with self.lock:
+            base, ext = os.path.splitext(name)
+            number = 1
+            while name in self.entries:
+                number += 1
+                name = '%s-%d%s' % (base, number, ext)
+            info = zipfile.ZipInfo(name, time.localtime()[:6])
+            info.compress_type = zipfile.ZIP_DEFLATED
+            info.external_attr = 0o644 << 16
+            info.extra = index_extra(url, title, format)
+            self.zip_file.writestr(info, text.encode('utf-8'))
+            # Written through to the file, so a killed run loses no entry
+            self.zip_file.fp.flush()
+            self.entries[name] = {'name': name, 'url': url, 'title': title, 'format': format}
+        return name
+
+    def index(self):
+        """ Returns the index entries (name, url, title, format) """
+
+        return list(self.entries.values())
+
+    def read(self, name):
+        """ Returns the text of the entry name """
+
+        with self.lock:
+            return self.zip_file.read(name).decode('utf-8')
+
+    def find(self, url):
+        """ Returns {format: text} of the entries for url """
+
+        return dict((entry['format'], self.read(entry['name'])) for entry in self.index() if entry['url'] == url)
+
+    def close(self):
+        with self.lock:
+            if self.mode != 'r':
+                self.zip_file.writestr(INDEX_NAME, JsonCodec.dumps(list(self.entries.values()), indent=1))
+            self.zip_file.close()
+
+def archive_init(filename, resume=False):
+    """ Starts the archive all saved output goes to.  When resuming a run
+        the entries already in filename are kept.
+    """
+
+    global _archive
+
+    _archive = RecipeArchive(filename, 'a' if resume else 'w')
+
+def get_archive():
+    """ Returns the archive started by archive_init or None """
+
+    return _archive
+
+def archive_close():
+    """ Writes the index and closes the archive """
+
+    global _archive
+
+    if not _archive is None:
+        _archive.close()
+        _archive = None
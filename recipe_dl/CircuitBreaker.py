@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+
+from contextlib import contextmanager
+
+from .RecipeLog import print_debug, print_warning
+
+from .CustomExceptions import UrlError, UnsupportedError, NotModifiedError, SkippedError
+from .UtilityFunctions import url2domain
+
+# Seconds a failed URL is skipped for, by the kind of failure.  Unsupported
+# pages rarely change, an extraction or parse error may be fixed by the site
+# or by a new release and a network error is often gone within minutes.
+UNSUPPORTED_FAILURE_TTL = 7 * 24 * 3600
+PARSE_FAILURE_TTL = 24 * 3600
+NETWORK_FAILURE_TTL = 15 * 60
+
+# httpx transport errors, which unlike the requests ones are not OSErrors
+NETWORK_ERRORS = ('ConnectError', 'ConnectTimeout', 'ReadError', 'ReadTimeout', 'WriteError', 'WriteTimeout', 'PoolTimeout', 'RemoteProtocolError')
+
+_breaker = None
+
+class CircuitBreaker:
+    """ Per domain circuit breaker.  After threshold URLs of a domain fail
+        in a row the rest are skipped for cooldown seconds, then a single URL
+        is let through: success closes the breaker, failure opens it again.
+    """
+
+    def __init__(self, threshold=5, cooldown=300.0):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.lock = threading.Lock()
+        self.domains = {}
+
+    def check(self, url):
+        """ Raises SkippedError if url's domain is not to be tried now """
+
+        if self.threshold <= 0:
+            return
+
+        domain = url2domain(url)
+        with self.lock:
+            state = self.domains.get(domain)
+            if state is None or state['failures'] < self.threshold:
+                return
+            wait = state['opened'] + self.cooldown - time.monotonic()
+            if wait <= 0 and not state['probing']:
+                state['probing'] = True
+                print_debug ("Circuit breaker for %s half open, trying %s" % (domain, url))
+                return
+        raise SkippedError(url, '%s failed %d times in a row, not retrying for %d seconds.' % (domain, state['failures'], max(wait, 0)))
+
+    def success(self, url):
+        with self.lock:
+            self.domains.pop(url2domain(url), None)
+
+    def neutral(self, url):
+        """ Records an answer that says nothing about the site's health: the
+            failures in a row stand, but a half open breaker lets another
+            URL through
+        """
+
+        with self.lock:
+            state = self.domains.get(url2domain(url))
+            if not state is None:
+                state['probing'] = False
+
+    def failure(self, url):
+        domain = url2domain(url)
+        with self.lock:
+            state = self.domains.setdefault(domain, {'failures': 0, 'opened': 0.0, 'probing': False})
+            state['failures'] += 1
+            if state['failures'] >= self.threshold > 0:
+                if state['failures'] == self.threshold:
+                    print_warning ("%s failed %d times in a row, skipping its URLs for %d seconds." % (domain, self.threshold, self.cooldown))
+                state['opened'] = time.monotonic()
+                state['probing'] = False
+
+def breaker_init(threshold=5, cooldown=300.0):
+    """ Configures the circuit breaker used by failure_guard """
+
+    global _breaker
+
+    _breaker = CircuitBreaker(threshold, cooldown)
+
+def get_breaker():
+    """ Returns the circuit breaker (created with defaults on first use) """
+
+    global _breaker
+
+    if _breaker is None:
+        _breaker = CircuitBreaker()
+    return _breaker
+
+def failure_ttl(err):
+    """ Seconds to skip a URL for after it failed with err """
+
+    if isinstance(err, UnsupportedError):
+        return UNSUPPORTED_FAILURE_TTL
+    if isinstance(err, OSError) or type(err).__name__ in NETWORK_ERRORS:
+        return NETWORK_FAILURE_TTL
+    return PARSE_FAILURE_TTL
+
+@contextmanager
+def failure_guard(url, store=None, retry_failed=False):
+    """ Runs the block for url unless its domain's circuit breaker is open
+        or (with a store) url failed recently, raising SkippedError instead.
+        Failures of the block are recorded in the store's negative cache,
+        network, extraction and parse errors are also counted by the breaker
+        (a 4xx or a page no scraper supports says nothing about the site's
+        health, while recipes no longer found are what a layout change looks
+        like).
+    """
+
+    if not store is None and not retry_failed:
+        failure = store.get_failure(url)
+        if not failure is None:
+            raise SkippedError(url, 'Failed %s (%s: %s), not retrying until %s.' % (
+                time.strftime('%Y-%m-%d %H:%M', time.localtime(failure['failed'])),
+                failure['error_class'],
+                failure['message'],
+                time.strftime('%Y-%m-%d %H:%M', time.localtime(failure['expires']))
+            ))
+
+    breaker = get_breaker()
+    breaker.check(url)
+    try:
+        yield
+    except NotModifiedError:
+        breaker.success(url)
+        raise
+    except Exception as err:
+        if isinstance(err, UnsupportedError):
+            # The site answered, the page is just not one we can use
+            breaker.neutral(url)
+        else:
+            breaker.failure(url)
+        if not store is None:
+            store.save_failure(url, type(err).__name__, str(getattr(err, 'message', err)), failure_ttl(err))
+        raise
+    breaker.success(url)
+    if not store is None:
+        store.clear_failure(url)
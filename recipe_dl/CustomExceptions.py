@@ -14,5 +14,46 @@ class UrlError(Error):
     """
 
     def __init__(self, url, message):
+        Error.__init__(self, url, message)
+        self.url = url
+        self.message = message
+
+class UnsupportedError(UrlError):
+    """Exception raised for a URL recipe-dl cannot use at all (the site
+    answers 4xx, no scraper handles it or it needs a sign in there are no
+    credentials for), as opposed to a page whose recipe could not be
+    extracted.
+
+    Attributes:
+        url -- url for which the error occurred
+        message -- explanation of the error
+    """
+
+    pass
+
+class NotModifiedError(Error):
+    """Exception raised when an incremental run finds a page unchanged.
+
+    Attributes:
+        url -- url of the unchanged page
+        message -- explanation of why the page was skipped
+    """
+
+    def __init__(self, url, message):
+        Error.__init__(self, url, message)
+        self.url = url
+        self.message = message
+
+class SkippedError(Error):
+    """Exception raised when a URL is not attempted because its site keeps
+    failing or the URL failed recently.
+
+    Attributes:
+        url -- url that was skipped
+        message -- explanation of why the url was skipped
+    """
+
+    def __init__(self, url, message):
+        Error.__init__(self, url, message)
         self.url = url
         self.message = message
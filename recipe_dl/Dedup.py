@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import hashlib
+import random
+import re
+import threading
+
+from .IngredientParser import parse_ingredients
+
+NUM_PERMUTATIONS = 64
+BANDS = 16
+MERSENNE_PRIME = (1 << 61) - 1
+
+# Fixed seed so signatures are comparable between runs
+_random = random.Random(0x5eed)
+_PERMUTATIONS = [(_random.randrange(1, MERSENNE_PRIME), _random.randrange(0, MERSENNE_PRIME)) for _ in range(NUM_PERMUTATIONS)]
+
+_WORD_RE = re.compile(r'[a-z0-9]+')
+
+_index = None
+_index_lock = threading.Lock()
+
+def recipe_shingles(recipe_json):
+    """ Returns the set of shingles describing a recipe: each normalized
+        ingredient item plus every three word run of the directions
+    """
+
+    shingles = set()
+    for group in recipe_json.get('ingredient_groups') or []:
+        parsed_ingredients = group.get('ingredients_parsed')
+        if parsed_ingredients is None:
+            parsed_ingredients = parse_ingredients(group.get('ingredients') or [])
+        for ingredient in parsed_ingredients:
+            item = ' '.join(_WORD_RE.findall(ingredient['item'].lower()))
+            if item != '':
+                shingles.add('i:' + item)
+
+    for group in recipe_json.get('direction_groups') or []:
+        for direction in group.get('directions') or []:
+            words = _WORD_RE.findall(str(direction).lower())
+            for index in range(len(words) - 2):
+                shingles.add('d:' + ' '.join(words[index:index + 3]))
+
+    return shingles
+
+def minhash(shingles):
+    """ Returns the MinHash signature (tuple of NUM_PERMUTATIONS ints) of a
+        set of shingles
+    """
+
+    hashes = [int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest(), 'little') for shingle in shingles]
+    if not hashes:
+        return None
+    return tuple(min((a * value + b) % MERSENNE_PRIME for value in hashes) for a, b in _PERMUTATIONS)
+
+def similarity(signature, other):
+    """ Estimated Jaccard similarity of the two signatures """
+
+    return sum(1 for left, right in zip(signature, other) if left == right) / float(NUM_PERMUTATIONS)
+
+class DuplicateIndex:
+    """ Locality sensitive hashing index over MinHash signatures.  Each
+        signature is split into BANDS bands and only recipes sharing a band
+        are compared, so a lookup does not scan the whole batch.
+    """
+
+    def __init__(self, threshold=0.8):
+        self.threshold = threshold
+        self.rows = NUM_PERMUTATIONS // BANDS
+        self.buckets = {}
+        self.signatures = {}
+
+    def _bands(self, signature):
+        for band in range(BANDS):
+            yield (band,) + signature[band * self.rows:(band + 1) * self.rows]
+
+    def find(self, signature, url=None):
+        """ Returns (url, similarity) of the closest indexed recipe other
+            than url at or over the threshold, or None
+        """
+
+        candidates = set()
+        for band in self._bands(signature):
+            candidates.update(self.buckets.get(band, ()))
+        # A URL output again (retried, or listed twice) is not its own duplicate
+        candidates.discard(url)
+
+        best = None
+        for url in candidates:
+            score = similarity(signature, self.signatures[url])
+            if score >= self.threshold and (best is None or score > best[1]):
+                best = (url, score)
+        return best
+
+    def add(self, url, signature):
+        if url in self.signatures:
+            return
+        self.signatures[url] = signature
+        for band in self._bands(signature):
+            self.buckets.setdefault(band, []).append(url)
+
+def find_duplicate(recipe_json, threshold=0.8):
+    """ Returns (url, similarity) of an earlier recipe in this run that
+        recipe_json duplicates, or adds recipe_json to the index and returns
+        None
+    """
+
+    global _index
+
+    signature = minhash(recipe_shingles(recipe_json))
+    if signature is None:
+        return None
+
+    with _index_lock:
+        if _index is None:
+            _index = DuplicateIndex(threshold)
+        duplicate = _index.find(signature, recipe_json.get('url', ''))
+        if duplicate is None:
+            _index.add(recipe_json.get('url', ''), signature)
+    return duplicate
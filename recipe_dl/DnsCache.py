@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import socket
+import threading
+import time
+
+from collections import OrderedDict
+
+_lock = threading.Lock()
+_getaddrinfo = socket.getaddrinfo
+_ttl = 0
+_max_entries = 1024
+_cache = OrderedDict()
+
+def dns_cache_init(ttl=300, max_entries=1024):
+    """ Caches up to max_entries host name lookups made by this process for
+        ttl seconds.  A ttl of 0 turns the cache off again.
+    """
+
+    global _ttl, _max_entries
+
+    with _lock:
+        _ttl = ttl
+        _max_entries = max_entries
+        _cache.clear()
+    # Every client (requests, httpx) resolves through socket.getaddrinfo
+    socket.getaddrinfo = cached_getaddrinfo if ttl > 0 else _getaddrinfo
+
+def cached_getaddrinfo(host, port, family=0, type=0, proto=0, flags=0):
+    """ socket.getaddrinfo answering from the cache while the entry is
+        younger than the ttl.  Failed lookups are not cached.
+    """
+
+    key = (host, port, family, type, proto, flags)
+    now = time.monotonic()
+    with _lock:
+        entry = _cache.get(key)
+    if not entry is None and entry[0] > now:
+        return list(entry[1])
+
+    result = _getaddrinfo(host, port, family, type, proto, flags)
+    with _lock:
+        _cache[key] = (now + _ttl, result)
+        _cache.move_to_end(key)
+        # Entries are added in expiry order, the oldest go first
+        while len(_cache) > _max_entries:
+            _cache.popitem(last=False)
+    return list(result)
+
+def dns_cache_clear():
+    """ Forgets every cached lookup """
+
+    with _lock:
+        _cache.clear()
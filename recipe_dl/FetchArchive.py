@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import gzip
+import os
+import threading
+import time
+
+import requests
+
+from . import JsonCodec
+
+from .CustomExceptions import UnsupportedError
+
+class FetchArchive:
+    """ Archive of raw fetched responses for replaying runs offline.
+
+        The data file is a series of gzip members, one per response, each
+        holding a JSON header line (url, status, headers) followed by the
+        body.  FILE.idx holds one JSON line (url, type, offset, length) per
+        record, so any response can be read without scanning the data file.
+        Recording appends; the last record of a URL wins.
+    """
+
+    def __init__(self, filename, mode='r'):
+        self.filename = filename
+        self.index_filename = filename + '.idx'
+        self.mode = mode
+        self.lock = threading.Lock()
+        self.index = {}
+
+        if os.path.isfile(self.index_filename):
+            with open(self.index_filename) as index_file:
+                for line in index_file:
+                    try:
+                        entry = JsonCodec.loads(line)
+                    except ValueError:
+                        # Crashed part way through an index line
+                        continue
+                    self.index[entry['url']] = (entry['offset'], entry['length'], entry['type'])
+
+        if mode == 'a':
+            self.data_file = open(filename, 'ab')
+            self.index_file = open(self.index_filename, 'a')
+        else:
+            self.data_file = open(filename, 'rb')
+            self.index_file = None
+
+    def record(self, url, response):
+        """ Appends the response fetched for url """
+
+        header = {
+            'url': url,
+            'status': response.status_code,
+            'headers': dict(response.headers),
+            'time': round(time.time(), 3),
+        }
+        content_type = response.headers.get('Content-Type', '').split(';')[0].strip().lower()
+        member = gzip.compress(JsonCodec.dumps(header).encode('utf-8') + b'\n' + response.content, compresslevel=6)
+
+        with self.lock:
+            offset = self.data_file.tell()
+            self.data_file.write(member)
+            self.data_file.flush()
+            self.index_file.write(JsonCodec.dumps({'url': url, 'type': content_type, 'offset': offset, 'length': len(member)}) + '\n')
+            self.index_file.flush()
+            self.index[url] = (offset, len(member), content_type)
+
+    def read(self, url):
+        """ Returns the (header, body) recorded for url """
+
+        entry = self.index.get(url)
+        if entry is None:
+            raise UnsupportedError(url, 'Not in fetch archive %s.' % self.filename)
+        # pread does not move the file position, so reads need no lock
+        record = gzip.decompress(os.pread(self.data_file.fileno(), entry[1], entry[0]))
+        header, _, body = record.partition(b'\n')
+        return JsonCodec.loads(header), body
+
+    def response(self, url):
+        """ Returns the recorded response for url as a requests Response """
+
+        header, body = self.read(url)
+        response = requests.models.Response()
+        response.url = url
+        response.status_code = header['status']
+        response.headers = requests.structures.CaseInsensitiveDict(header['headers'])
+        response._content = body
+        response._content_consumed = True
+        return response
+
+    def urls(self, content_type=None):
+        """ Returns the recorded URLs (of content_type if given) in the
+            order first recorded
+        """
+
+        return [url for url, entry in self.index.items() if content_type is None or entry[2] == content_type]
+
+    def close(self):
+        with self.lock:
+            self.data_file.close()
+            if not self.index_file is None:
+                self.index_file.close()
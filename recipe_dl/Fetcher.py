@@ -0,0 +1,303 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import codecs
+import io
+import re
+import requests
+
+from contextlib import contextmanager
+
+from .RecipeLog import print_debug, print_warning
+
+from .CustomExceptions import UrlError, UnsupportedError
+from .Profiler import profile_stage
+from .Scheduler import DomainScheduler, retry_after_seconds
+from .FetchArchive import FetchArchive
+from .DnsCache import dns_cache_init
+
+# httpx (with h2) is optional, only needed for the http2 transport
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+USER_AGENT = {'User-agent': 'Mozilla/5.0'}
+RETRY_STATUS_CODES = (429, 503)
+TRANSPORTS = ('http1', 'http2')
+
+# Seconds to wait for a http2 connection or read, httpx does not wait
+# forever the way requests does
+HTTP2_TIMEOUT = 30.0
+
+# Bytes searched for a <meta> charset when the headers do not give one
+SNIFF_BYTES = 4096
+
+# Charsets browsers read as a superset, as the HTML spec requires
+CHARSET_OVERRIDES = {
+    'iso-8859-1': 'cp1252',
+    'latin1': 'cp1252',
+    'latin-1': 'cp1252',
+    'us-ascii': 'cp1252',
+    'ascii': 'cp1252',
+}
+
+_META_CHARSET_RE = re.compile(br'<meta[^>]+charset\s*=\s*["\']?\s*([A-Za-z0-9_:.-]+)', re.IGNORECASE)
+
+_session = None
+_client = None
+_transport = 'http1'
+_scheduler = None
+_retries = 3
+_pool_size = 10
+_max_page_size = None
+_recorder = None
+_replay = None
+
+def fetch_init(rate_limit=1.0, burst=2, domain_concurrency=2, retries=3, pool_size=10, max_page_size=None, record=None, replay=None, transport='http1', dns_ttl=None):
+    """ Configures the politeness scheduler, connection pool and page size
+        limit used by fetch.  With record every response is also written to
+        that fetch archive; with replay responses come from that archive
+        instead of the network.  transport 'http2' fetches with httpx so
+        requests to a site share one connection.  With dns_ttl host lookups
+        are cached for that many seconds, until fetch_close.
+    """
+
+    global _session, _scheduler, _retries, _pool_size, _max_page_size, _recorder, _replay, _transport
+
+    if not transport in TRANSPORTS:
+        raise ValueError("Unknown transport '%s', expected one of %s" % (transport, ', '.join(TRANSPORTS)))
+    if transport == 'http2' and httpx is None:
+        print_warning ("httpx is not installed, fetching over HTTP/1.1.")
+        transport = 'http1'
+
+    _scheduler = DomainScheduler(rate=rate_limit, burst=burst, concurrency=domain_concurrency)
+    _retries = retries
+    _pool_size = pool_size
+    _max_page_size = max_page_size
+    _transport = transport
+    fetch_close()
+    if dns_ttl:
+        dns_cache_init(dns_ttl)
+    if not record is None:
+        _recorder = FetchArchive(record, 'a')
+    if not replay is None:
+        _replay = FetchArchive(replay)
+
+def fetch_close():
+    """ Closes the requests session, the http2 client and the record/replay
+        fetch archive and stops caching host lookups
+    """
+
+    global _session, _client, _recorder, _replay
+
+    if not _session is None:
+        _session.close()
+    if not _client is None:
+        _client.close()
+    for archive in (_recorder, _replay):
+        if not archive is None:
+            archive.close()
+    _session = None
+    _client = None
+    _recorder = None
+    _replay = None
+    dns_cache_init(0)
+
+def get_session():
+    """ Returns the shared requests session (created on first use) """
+
+    global _session
+
+    if _session is None:
+        _session = requests.session()
+        _session.headers.update(USER_AGENT)
+        adapter = requests.adapters.HTTPAdapter(pool_connections=_pool_size, pool_maxsize=_pool_size)
+        _session.mount('http://', adapter)
+        _session.mount('https://', adapter)
+    return _session
+
+def get_client():
+    """ Returns the shared httpx client of the http2 transport (created on
+        first use)
+    """
+
+    global _client
+
+    if _client is None:
+        limits = httpx.Limits(max_connections=_pool_size, max_keepalive_connections=_pool_size)
+        _client = httpx.Client(http2=True, headers=USER_AGENT, limits=limits, timeout=HTTP2_TIMEOUT, follow_redirects=True)
+    return _client
+
+def get_scheduler():
+    """ Returns the politeness scheduler (created with defaults on first use) """
+
+    global _scheduler
+
+    if _scheduler is None:
+        _scheduler = DomainScheduler()
+    return _scheduler
+
+def fetch(url, headers=None, cookies=None):
+    """ Fetches url through the shared session and returns the response.
+
+        Requests are paced per domain by the scheduler and retried with
+        backoff when the site answers 429 or 503.
+    """
+
+    if not _replay is None:
+        response = _replay.response(url)
+        response.encoding = response_charset(response)
+        return response
+
+    scheduler = get_scheduler()
+    for attempt in range(_retries + 1):
+        with scheduler.slot(url):
+            with profile_stage('fetch'):
+                if _transport == 'http2':
+                    response = http2_get(url, headers, cookies)
+                else:
+                    response = get_session().get(url, headers=headers, cookies=cookies, stream=True)
+                    read_body(url, response)
+
+        if not response.status_code in RETRY_STATUS_CODES:
+            scheduler.success(url)
+            break
+        if attempt < _retries:
+            delay = scheduler.backoff(url, retry_after_seconds(response.headers.get('Retry-After')))
+            print_debug("HTTP %s from %s, backing off %.1f seconds..." % (response.status_code, url, delay))
+
+    if not _recorder is None:
+        _recorder.record(url, response)
+
+    # Decode .text with the declared charset rather than letting requests
+    # guess it from the whole body
+    response.encoding = response_charset(response)
+    return response
+
+def response_charset(response):
+    """ Returns the charset of the response from its Content-Type header,
+        a byte order mark or a <meta> charset in the first SNIFF_BYTES of the
+        body, defaulting to utf-8
+    """
+
+    charset = None
+    for parameter in response.headers.get('Content-Type', '').split(';')[1:]:
+        name, _, value = parameter.partition('=')
+        if name.strip().lower() == 'charset':
+            charset = value.strip().strip('"\'')
+
+    if not charset:
+        head = response.content[:SNIFF_BYTES]
+        if head.startswith(codecs.BOM_UTF8):
+            charset = 'utf-8-sig'
+        elif head.startswith(codecs.BOM_UTF16_LE) or head.startswith(codecs.BOM_UTF16_BE):
+            charset = 'utf-16'
+        else:
+            match = _META_CHARSET_RE.search(head)
+            if match:
+                charset = match.group(1).decode('ascii')
+
+    if not charset:
+        return 'utf-8'
+    charset = CHARSET_OVERRIDES.get(charset.lower(), charset)
+    try:
+        codecs.lookup(charset)
+    except LookupError:
+        return 'utf-8'
+    return charset
+
+def read_body(url, response):
+    """ Reads the response body, giving up on pages over the size limit
+        without holding more than the limit in memory
+    """
+
+    if _max_page_size is None:
+        return response.content
+
+    try:
+        body = read_chunks(url, response.headers.get('Content-Length', ''), response.iter_content(65536))
+    except UrlError:
+        response.close()
+        raise
+
+    response._content = body
+    response._content_consumed = True
+    return response._content
+
+def read_chunks(url, content_length, chunks):
+    """ Joins the body chunks, raising UnsupportedError as soon as the body is
+        known to be over the page size limit
+    """
+
+    if content_length.isdigit() and int(content_length) > _max_page_size:
+        raise UnsupportedError(url, 'Page is larger than %d bytes.' % _max_page_size)
+
+    body = bytearray()
+    for chunk in chunks:
+        body += chunk
+        if len(body) > _max_page_size:
+            raise UnsupportedError(url, 'Page is larger than %d bytes.' % _max_page_size)
+    return bytes(body)
+
+def http2_get(url, headers=None, cookies=None):
+    """ Fetches url with the httpx client and returns it as a requests
+        Response, so callers see the same object whichever transport is used
+    """
+
+    if not cookies is None:
+        # httpx takes cookies per client, not per request
+        headers = dict(headers or {})
+        cookie_header = requests.cookies.get_cookie_header(cookies, requests.Request('GET', url))
+        if not cookie_header is None:
+            headers['Cookie'] = cookie_header
+
+    with get_client().stream('GET', url, headers=headers) as http2_response:
+        if _max_page_size is None:
+            body = http2_response.read()
+        else:
+            body = read_chunks(url, http2_response.headers.get('Content-Length', ''), http2_response.iter_bytes(65536))
+
+    response = requests.models.Response()
+    response.url = str(http2_response.url)
+    response.status_code = http2_response.status_code
+    response.reason = http2_response.reason_phrase
+    response.headers = requests.structures.CaseInsensitiveDict(http2_response.headers)
+    response._content = body
+    response._content_consumed = True
+    print_debug ("%s %s %d" % (http2_response.http_version, url, response.status_code))
+    return response
+
+def fetch_html(url, headers=None, cookies=None):
+    """ Fetches url and returns the page html """
+
+    return fetch(url, headers=headers, cookies=cookies).text
+
+@contextmanager
+def fetch_stream(url):
+    """ Fetches url and yields its body as a file object that is read as it
+        arrives, for documents too large to hold in memory.  Raises UrlError
+        unless the site answers 200.
+    """
+
+    if not _replay is None:
+        response = _replay.response(url)
+        if response.status_code != 200:
+            raise UrlError(url, 'HTTP status %d.' % response.status_code)
+        yield io.BufferedReader(io.BytesIO(response.content))
+        return
+
+    # Streams stay on requests whatever the transport, one long download
+    # gains nothing from sharing a connection
+    with get_scheduler().slot(url):
+        with profile_stage('fetch'):
+            response = get_session().get(url, stream=True)
+    try:
+        if response.status_code != 200:
+            raise UrlError(url, 'HTTP status %d.' % response.status_code)
+        response.raw.decode_content = True
+        # Keep the raw stream readable at EOF, the buffer still reads it
+        response.raw.auto_close = False
+        yield io.BufferedReader(response.raw)
+    finally:
+        response.close()
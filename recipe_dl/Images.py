@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import hashlib
+import multiprocessing
+import os
+import threading
+
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from .RecipeLog import print_debug, print_warning
+
+from .Fetcher import fetch
+from .OutputWriter import write_text
+from .CustomExceptions import UrlError
+
+# Pillow is optional, only needed for thumbnails
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+IMAGE_EXTENSIONS = {
+    'image/jpeg': '.jpg',
+    'image/png': '.png',
+    'image/gif': '.gif',
+    'image/webp': '.webp',
+    'image/avif': '.avif',
+    'image/svg+xml': '.svg',
+}
+
+_lock = threading.Lock()
+_directory = None
+_thumbnail_size = None
+_workers = 8
+_downloads = None
+_thumbnails = None
+_images = {}
+
+def images_init(directory, thumbnail_size=None, workers=8):
+    """ Saves recipe images under directory, named by a hash of their
+        content, with JPEG thumbnails of at most thumbnail_size pixels
+        when Pillow is installed
+    """
+
+    global _directory, _thumbnail_size, _workers
+
+    _directory = directory
+    _thumbnail_size = thumbnail_size
+    _workers = workers
+    if not thumbnail_size is None and Image is None:
+        print_warning ("Pillow is not installed, thumbnails will not be made.")
+        _thumbnail_size = None
+
+def image_extension(url, content_type):
+    """ File extension for an image from its Content-Type or URL """
+
+    extension = IMAGE_EXTENSIONS.get(content_type.split(';')[0].strip().lower())
+    if extension is None:
+        extension = os.path.splitext(url.split('?')[0])[1].lower()
+        if not extension in IMAGE_EXTENSIONS.values() and extension != '.jpeg':
+            extension = '.img'
+    return extension
+
+def make_thumbnail(source, destination, size):
+    """ Writes a JPEG thumbnail of source no larger than size pixels
+        (run in the thumbnail process pool)
+    """
+
+    temp_destination = destination + '.tmp'
+    with Image.open(source) as image:
+        image.thumbnail((size, size))
+        image.convert('RGB').save(temp_destination, 'JPEG', quality=85)
+    os.replace(temp_destination, destination)
+    return destination
+
+def _thumbnail_pool():
+    global _thumbnails
+
+    with _lock:
+        if _thumbnails is None:
+            # spawn rather than fork, the process has threads running
+            _thumbnails = ProcessPoolExecutor(max_workers=os.cpu_count(), mp_context=multiprocessing.get_context('spawn'))
+        return _thumbnails
+
+def download_image(url):
+    """ Downloads url and returns the path it is stored at.  An image
+        already stored (by this or an earlier run) is not written again.
+    """
+
+    response = fetch(url)
+    if response.status_code != 200:
+        raise UrlError(url, 'HTTP status %d.' % response.status_code)
+
+    digest = hashlib.sha256(response.content).hexdigest()
+    path = os.path.join(_directory, digest[:2], digest + image_extension(url, response.headers.get('Content-Type', '')))
+    if os.path.isfile(path):
+        print_debug ("Image %s already stored as %s" % (url, path))
+    else:
+        write_text(path, response.content)
+
+    if not _thumbnail_size is None:
+        thumbnail = os.path.join(_directory, digest[:2], '%s.thumb-%d.jpg' % (digest, _thumbnail_size))
+        if not os.path.isfile(thumbnail):
+            _thumbnail_pool().submit(make_thumbnail, path, thumbnail, _thumbnail_size).add_done_callback(_thumbnail_done)
+    return path
+
+def _thumbnail_done(future):
+    if not future.exception() is None:
+        print_warning ("Unable to make thumbnail: %s" % future.exception())
+
+def fetch_image(url):
+    """ Returns a future for the stored path of the image at url.  Each url
+        is downloaded once per run.
+    """
+
+    global _downloads
+
+    with _lock:
+        future = _images.get(url)
+        if future is None:
+            if _downloads is None:
+                _downloads = ThreadPoolExecutor(max_workers=_workers, thread_name_prefix='image')
+            future = _downloads.submit(download_image, url)
+            _images[url] = future
+    return future
+
+def start_image(recipe_json):
+    """ Starts downloading the image of recipe_json in the background """
+
+    url = recipe_json.get('image', '')
+    if not _directory is None and url != '':
+        fetch_image(url)
+
+def add_image_file(recipe_json):
+    """ Records where the image of recipe_json is stored as 'image_file',
+        waiting for its download (started by start_image, or now)
+    """
+
+    url = recipe_json.get('image', '')
+    if _directory is None or url == '':
+        return recipe_json
+    try:
+        recipe_json['image_file'] = fetch_image(url).result()
+    except Exception as err:
+        print_warning ("Unable to download image %s: %s" % (url, getattr(err, 'message', err)))
+    return recipe_json
+
+def images_close():
+    """ Waits for downloads and thumbnails to finish """
+
+    global _downloads, _thumbnails
+
+    with _lock:
+        downloads, _downloads = _downloads, None
+    if not downloads is None:
+        downloads.shutdown()
+    # Only now, as the downloads still running submit their thumbnails
+    with _lock:
+        thumbnails, _thumbnails = _thumbnails, None
+    if not thumbnails is None:
+        thumbnails.shutdown()
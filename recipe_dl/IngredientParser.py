@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import re
+
+from functools import lru_cache
+
+from .UtilityFunctions import UNICODE_FRACTIONS
+
+# Fields of a parsed ingredient, in the order they are written
+INGREDIENT_FIELDS = ('quantity', 'unit', 'size', 'item', 'modifier')
+
+# Unicode fractions beyond the ones strip_tags already converts
+EXTRA_UNICODE_FRACTIONS = [
+    (u"⅛", u"1/8"),
+    (u"⅜", u"3/8"),
+    (u"⅝", u"5/8"),
+    (u"⅞", u"7/8"),
+    (u"⅕", u"1/5"),
+    (u"⅙", u"1/6"),
+    (u"⅚", u"5/6"),
+    (u"⅐", u"1/7"),
+    (u"⅑", u"1/9"),
+    (u"⅒", u"1/10"),
+]
+
+# Canonical unit for each spelling found in ingredient lines
+UNITS = {
+    'teaspoon': 'teaspoon', 'teaspoons': 'teaspoon', 'tsp': 'teaspoon', 'tsps': 'teaspoon',
+    'tablespoon': 'tablespoon', 'tablespoons': 'tablespoon', 'tbsp': 'tablespoon', 'tbsps': 'tablespoon', 'tbs': 'tablespoon', 'tbl': 'tablespoon',
+    'cup': 'cup', 'cups': 'cup', 'c': 'cup',
+    'fluid ounce': 'fluid ounce', 'fluid ounces': 'fluid ounce', 'fl oz': 'fluid ounce', 'fl. oz': 'fluid ounce',
+    'pint': 'pint', 'pints': 'pint', 'pt': 'pint',
+    'quart': 'quart', 'quarts': 'quart', 'qt': 'quart', 'qts': 'quart',
+    'gallon': 'gallon', 'gallons': 'gallon', 'gal': 'gallon',
+    'ounce': 'ounce', 'ounces': 'ounce', 'oz': 'ounce',
+    'pound': 'pound', 'pounds': 'pound', 'lb': 'pound', 'lbs': 'pound',
+    'milligram': 'milligram', 'milligrams': 'milligram', 'mg': 'milligram',
+    'gram': 'gram', 'grams': 'gram', 'g': 'gram', 'gr': 'gram',
+    'kilogram': 'kilogram', 'kilograms': 'kilogram', 'kg': 'kilogram',
+    'milliliter': 'milliliter', 'milliliters': 'milliliter', 'millilitre': 'milliliter', 'millilitres': 'milliliter', 'ml': 'milliliter',
+    'centiliter': 'centiliter', 'centiliters': 'centiliter', 'cl': 'centiliter',
+    'deciliter': 'deciliter', 'deciliters': 'deciliter', 'dl': 'deciliter',
+    'liter': 'liter', 'liters': 'liter', 'litre': 'liter', 'litres': 'liter', 'l': 'liter',
+    'inch': 'inch', 'inches': 'inch',
+    'pinch': 'pinch', 'pinches': 'pinch',
+    'dash': 'dash', 'dashes': 'dash',
+    'clove': 'clove', 'cloves': 'clove',
+    'can': 'can', 'cans': 'can',
+    'jar': 'jar', 'jars': 'jar',
+    'package': 'package', 'packages': 'package', 'pkg': 'package',
+    'stick': 'stick', 'sticks': 'stick',
+    'sprig': 'sprig', 'sprigs': 'sprig',
+    'bunch': 'bunch', 'bunches': 'bunch',
+    'head': 'head', 'heads': 'head',
+    'slice': 'slice', 'slices': 'slice',
+    'piece': 'piece', 'pieces': 'piece',
+    'handful': 'handful', 'handfuls': 'handful',
+}
+
+_FRACTION_TABLE = str.maketrans(dict((character, u" " + fraction + u" ") for character, fraction in UNICODE_FRACTIONS + EXTRA_UNICODE_FRACTIONS))
+
+_NUMBER = r'(?:\d+\s+\d+/\d+|\d+/\d+|\d+(?:\.\d+)?)'
+_UNIT = '|'.join(re.escape(unit).replace(r'\ ', r'\s+') for unit in sorted(UNITS, key=len, reverse=True))
+
+_INGREDIENT_RE = re.compile(
+    r'^\s*'
+    r'(?P<quantity>' + _NUMBER + r'(?:\s*(?:-|–|to)\s*' + _NUMBER + r')?)?\s*'
+    r'(?P<size>\([^)]*\))?\s*'
+    r'(?:(?P<unit>' + _UNIT + r')\.?(?![\w-]))?\s*'
+    r'(?P<unit_size>\([^)]*\))?\s*'
+    r'(?:of\s+)?(?P<rest>.*?)\s*$',
+    re.IGNORECASE
+)
+_MODIFIER_RE = re.compile(r'^(?P<item>.*?)\s*(?:,\s*(?P<comma>.+)|\s+(?P<taste>(?:to taste|as needed|for serving|for garnish|optional)\b.*)|\s*(?P<paren>\([^)]*\)))$', re.IGNORECASE)
+_SPACES_RE = re.compile(r'\s+')
+_RANGE_RE = re.compile(r'\s*(?:-|–|to)\s*')
+_QUANTITY_RE = re.compile(r'^' + _NUMBER + r'(?:\s*(?:-|–|to)\s*' + _NUMBER + r')?$')
+
+@lru_cache(maxsize=65536)
+def _parse_ingredient(line):
+    """ Returns the INGREDIENT_FIELDS of line as a tuple (cached, lines such
+        as 'salt' repeat across most recipes)
+    """
+
+    text = _SPACES_RE.sub(' ', line.translate(_FRACTION_TABLE)).strip()
+    match = _INGREDIENT_RE.match(text)
+
+    quantity = match.group('quantity') or ''
+    size = match.group('size') or match.group('unit_size') or ''
+    unit = match.group('unit') or ''
+    item = match.group('rest')
+    if quantity == '' and size == '' and len(unit) <= 2:
+        # Without a quantity short units are more likely the start of a word
+        unit = ''
+        item = text
+    if quantity != '':
+        quantity = _RANGE_RE.sub('-', _SPACES_RE.sub(' ', quantity))
+    if unit != '':
+        unit = UNITS[_SPACES_RE.sub(' ', unit.lower())]
+
+    modifier = ''
+    match = _MODIFIER_RE.match(item)
+    if match and match.group('item') != '':
+        item = match.group('item')
+        modifier = match.group('comma') or match.group('taste') or match.group('paren')
+
+    return (quantity, unit, size, item, modifier)
+
+def normalize_quantity(text):
+    """ Returns a quantity written by a site ('2 to 3', '½–¾') the way the
+        parser writes them ('2-3', '1/2-3/4'), or '' if it is not a number
+        or a range of numbers ('a few')
+    """
+
+    text = _SPACES_RE.sub(' ', text.translate(_FRACTION_TABLE)).strip()
+    if not _QUANTITY_RE.match(text):
+        return ''
+    return _RANGE_RE.sub('-', text)
+
+def canonical_unit(unit):
+    """ Returns the canonical name of unit (unchanged if it is not known) """
+
+    return UNITS.get(_SPACES_RE.sub(' ', unit.strip().lower()).rstrip('.'), unit)
+
+def parse_ingredient(line):
+    """ Parses an ingredient line into quantity, unit, size, item and modifier """
+
+    return dict(zip(INGREDIENT_FIELDS, _parse_ingredient(line)))
+
+def parse_ingredients(lines):
+    """ Parses a list of ingredient lines """
+
+    fields = INGREDIENT_FIELDS
+    parse = _parse_ingredient
+    return [dict(zip(fields, parse(str(line)))) for line in lines]
+
+def add_parsed_ingredients(recipe_json):
+    """ Adds 'ingredients_parsed' to each ingredient group of recipe_json
+        that does not already have it
+    """
+
+    for group in recipe_json.get('ingredient_groups') or []:
+        if not 'ingredients_parsed' in group:
+            group['ingredients_parsed'] = parse_ingredients(group.get('ingredients') or [])
+    return recipe_json
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import time
+
+from . import JsonCodec
+
+class BatchJournal:
+    """ Append-only journal of the URLs in a batch run.
+
+        Each line is a JSON record of a URL becoming pending, done (with the
+        files written) or failed (with the error).  The last record for a URL
+        wins when the journal is loaded to resume a run.
+    """
+
+    def __init__(self, filename, resume=False, sync_every=50):
+        self.filename = filename
+        self.sync_every = sync_every
+        self.unsynced = 0
+        self.state = {}
+
+        if resume and os.path.isfile(filename):
+            self.state = self.load(filename)
+            self.file = open(filename, 'a+')
+            self.file.seek(0, os.SEEK_END)
+            if self.file.tell() > 0:
+                self.file.seek(self.file.tell() - 1)
+                if self.file.read(1) != '\n':
+                    # Crashed part way through a record
+                    self.file.write('\n')
+        else:
+            self.file = open(filename, 'w')
+
+    @staticmethod
+    def load(filename):
+        """ Returns the last known status of each URL in the journal """
+
+        state = {}
+        with open(filename) as journal_file:
+            for line in journal_file:
+                try:
+                    record = JsonCodec.loads(line)
+                except ValueError:
+                    continue
+                state[record['url']] = record['status']
+        return state
+
+    def _append(self, record):
+        record['time'] = round(time.time(), 3)
+        self.file.write(JsonCodec.dumps(record) + '\n')
+        self.unsynced += 1
+        if self.unsynced >= self.sync_every:
+            self.sync()
+
+    def sync(self):
+        """ Flushes journal records to disk """
+
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.unsynced = 0
+
+    def pending(self, url):
+        self._append({'url': url, 'status': 'pending'})
+
+    def done(self, url, outputs=None):
+        self._append({'url': url, 'status': 'done', 'outputs': outputs or []})
+
+    def failed(self, url, error):
+        self._append({'url': url, 'status': 'failed', 'error': '%s: %s' % (type(error).__name__, getattr(error, 'message', error))})
+
+    def close(self):
+        self.sync()
+        self.file.close()
@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+
+# orjson is optional, the standard library json module is used without it
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+JSONDecodeError = json.JSONDecodeError
+
+def backend():
+    """ Name of the JSON library in use """
+
+    return 'stdlib' if orjson is None else 'orjson'
+
+def loads(text):
+    """ Decodes a JSON str or bytes document.  Documents orjson refuses but
+        the standard library accepts (NaN, lone surrogates) are decoded by
+        the standard library.
+    """
+
+    if not orjson is None:
+        try:
+            return orjson.loads(text)
+        except orjson.JSONDecodeError:
+            pass
+    return json.loads(text)
+
+def load(json_file):
+    """ Decodes the JSON document in an open file """
+
+    return loads(json_file.read())
+
+def dumps(value, indent=None, sort_keys=False):
+    """ Encodes value as a JSON str.
+
+        Indented output always comes from the standard library so saved
+        files are identical whichever library is installed.  Compact output
+        is written without whitespace and with non-ASCII characters as is.
+    """
+
+    if indent is None:
+        if not orjson is None:
+            try:
+                return orjson.dumps(value, option=orjson.OPT_SORT_KEYS if sort_keys else 0).decode('utf-8')
+            except TypeError:
+                pass
+        return json.dumps(value, separators=(',', ':'), ensure_ascii=False, sort_keys=sort_keys)
+    return json.dumps(value, indent=indent, sort_keys=sort_keys)
@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import hashlib
+import os
+import tempfile
+import threading
+
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+
+_lock = threading.Lock()
+_executor = None
+_slots = None
+_output_dir = None
+_workers = 4
+_max_pending = 64
+_max_claims = 100000
+_claimed = OrderedDict()
+_pending = set()
+
+# mkstemp creates files readable only by the owner, output files get the
+# usual permissions
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+def writer_init(output_dir=None, workers=4, max_pending=64, max_claims=100000):
+    """ Configures where output files go and how many are written in the
+        background at once.  With an output_dir files are sharded into
+        subdirectories named by a hash of the file name.  The owners of the
+        last max_claims file names are remembered to tell recipes with the
+        same title apart.
+    """
+
+    global _output_dir, _workers, _max_pending, _max_claims
+
+    _output_dir = output_dir
+    _workers = workers
+    _max_pending = max_pending
+    _max_claims = max_claims
+
+def _get_executor():
+    global _executor, _slots
+
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=_workers, thread_name_prefix='output')
+            _slots = threading.BoundedSemaphore(_max_pending)
+        return _executor
+
+def url_suffix(url):
+    """ Short, stable suffix identifying url """
+
+    return hashlib.blake2b(url.encode('utf-8'), digest_size=4).hexdigest()
+
+def _claim(filename, url):
+    """ Claims filename for url.  Returns the url_suffix of the url holding
+        the claim.
+    """
+
+    key = hashlib.blake2b(filename.encode('utf-8'), digest_size=8).digest()
+    owner = _claimed.setdefault(key, url_suffix(url))
+    _claimed.move_to_end(key)
+    while len(_claimed) > _max_claims:
+        _claimed.popitem(last=False)
+    return owner
+
+def output_path(filename, url=''):
+    """ Returns the path filename is written to.  A name already claimed by a
+        different url in this run gets a suffix derived from url, so the same
+        recipe always lands on the same file.  Names are claimed in the order
+        the recipes are output (the input order).
+    """
+
+    if not _output_dir is None and os.path.dirname(filename) == '':
+        shard = hashlib.blake2b(filename.lower().encode('utf-8'), digest_size=1).hexdigest()
+        filename = os.path.join(_output_dir, shard, filename)
+
+    with _lock:
+        if _claim(filename, url) != url_suffix(url):
+            base, ext = os.path.splitext(filename)
+            filename = '%s-%s%s' % (base, url_suffix(url), ext)
+            _claim(filename, url)
+    return filename
+
+def write_text(path, text):
+    """ Writes text (str or bytes) to path through a temporary file renamed
+        over it, so path never holds a partial file
+    """
+
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    handle, temp_path = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(path) + '.', suffix='.tmp')
+    try:
+        with os.fdopen(handle, 'wb' if isinstance(text, bytes) else 'w') as temp_file:
+            temp_file.write(text)
+        os.chmod(temp_path, 0o666 & ~_UMASK)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+def write_file(path, text):
+    """ Queues text to be written to path by the background writer threads.
+        Returns a future whose result is path once the file is written (or
+        which raises the error of the write).
+    """
+
+    executor = _get_executor()
+    _slots.acquire()
+
+    def write():
+        try:
+            write_text(path, text)
+        finally:
+            _slots.release()
+        return path
+
+    future = executor.submit(write)
+    with _lock:
+        _pending.add(future)
+    future.add_done_callback(_finished)
+    return future
+
+def when_written(results, callback=None):
+    """ Returns a future whose result is results, with each future in it
+        (see write_file) replaced by its result, once they are all done.
+        callback(paths) runs first, in the writer thread that finished
+        last.  The future raises the error of a failed write or of callback
+        instead.  writer_flush waits for it as for the writes.
+    """
+
+    future = Future()
+    with _lock:
+        _pending.add(future)
+    future.add_done_callback(_finished)
+
+    writes = [result for result in results if isinstance(result, Future)]
+    remaining = [len(writes)]
+    remaining_lock = threading.Lock()
+
+    def settle(_=None):
+        with remaining_lock:
+            remaining[0] -= 1
+            if remaining[0] > 0:
+                return
+        try:
+            paths = [result.result() if isinstance(result, Future) else result for result in results]
+            if not callback is None:
+                callback(paths)
+        except BaseException as err:
+            future.set_exception(err)
+        else:
+            future.set_result(paths)
+
+    if not writes:
+        remaining[0] = 1
+        settle()
+    for write in writes:
+        write.add_done_callback(settle)
+    return future
+
+def _finished(future):
+    with _lock:
+        _pending.discard(future)
+
+def writer_flush():
+    """ Waits for all queued writes (and when_written futures) """
+
+    while True:
+        with _lock:
+            pending = list(_pending)
+        if not pending:
+            break
+        wait(pending)
+
+def writer_close():
+    """ Flushes and stops the writer threads """
+
+    global _executor
+
+    writer_flush()
+    with _lock:
+        executor, _executor = _executor, None
+    if not executor is None:
+        executor.shutdown()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import cProfile
+import pstats
+import sys
+import threading
+import time
+
+from contextlib import contextmanager
+from functools import wraps
+
+_lock = threading.Lock()
+_enabled = False
+_profilers = []
+_stage_totals = {}
+
+def profile_start():
+    """ Enables profiling and starts a cProfile profiler on the calling thread """
+
+    global _enabled
+
+    _enabled = True
+    profile_thread_start()
+
+def profile_thread_start():
+    """ Starts a cProfile profiler for the calling thread (no-op when disabled).
+
+        From Python 3.12 a single profiler sees every thread, so only the
+        first call creates one.
+    """
+
+    if not _enabled or (sys.version_info >= (3, 12) and _profilers):
+        return None
+
+    profiler = cProfile.Profile()
+    with _lock:
+        _profilers.append(profiler)
+    profiler.enable()
+    return profiler
+
+def profile_stop():
+    """ Stops all running profilers """
+
+    global _enabled
+
+    _enabled = False
+    with _lock:
+        for profiler in _profilers:
+            profiler.disable()
+
+@contextmanager
+def profile_stage(name):
+    """ Attributes wall clock time spent inside the block to the named stage """
+
+    if not _enabled:
+        yield
+        return
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        with _lock:
+            count, total = _stage_totals.get(name, (0, 0.0))
+            _stage_totals[name] = (count + 1, total + elapsed)
+
+def profiled_stage(name):
+    """ Decorator version of profile_stage """
+
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with profile_stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def profile_report(prefix, sort_by='cumulative', limit=50):
+    """ Writes <prefix>.prof (pstats dump for snakeviz, gprof2dot, etc.) and
+        <prefix>.txt (stage summary followed by the sorted profile)
+    """
+
+    stats_filename = prefix + '.prof'
+    report_filename = prefix + '.txt'
+
+    with _lock:
+        profilers = list(_profilers)
+        stages = sorted(_stage_totals.items(), key=lambda stage: stage[1][1], reverse=True)
+
+    with open(report_filename, 'w') as report_file:
+        report_file.write('Scraper stages (wall clock, inclusive)\n')
+        report_file.write('%-32s %8s %12s %12s\n' % ('stage', 'calls', 'total (s)', 'mean (ms)'))
+        for name, (count, total) in stages:
+            report_file.write('%-32s %8d %12.3f %12.3f\n' % (name, count, total, (total / count) * 1000))
+        report_file.write('\n')
+
+        if profilers:
+            stats = pstats.Stats(profilers[0], stream=report_file)
+            for profiler in profilers[1:]:
+                stats.add(profiler)
+            stats.dump_stats(stats_filename)
+            stats.sort_stats(sort_by).print_stats(limit)
+
+    return stats_filename, report_filename
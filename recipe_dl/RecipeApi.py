@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import logging
+
+from .RecipeLog import log_to
+from .Scrapers import url2recipe_json
+from .RecipeOutput import recipe_json2text
+from .RecipeConversion import convert_recipe
+from .UtilityFunctions import json_clean_value
+
+FORMATS = ('json', 'md', 'rst')
+
+DEFAULT_LOGGER = logging.getLogger('recipe_dl')
+
+class RecipeOptions:
+    """ Per-call options for fetch_recipe and render.  The names match the
+        recipe-dl command line options, so the argparse Namespace of the
+        command line can be passed in their place.
+    """
+
+    def __init__(self, **options):
+        self.authorize_ci = False
+        self.interactive = False
+        self.force_recipe_scraper = False
+        self.incremental = False
+        self.store = None
+        self.retry_failed = False
+        self.scale = 1
+        self.units = None
+        self.compact_json = False
+        self.debug = False
+        self.quiet = True
+        self.logger = DEFAULT_LOGGER
+
+        for name, value in options.items():
+            if not hasattr(self, name):
+                raise TypeError("Unknown recipe option '%s'" % name)
+            setattr(self, name, value)
+
+    def __repr__(self):
+        return 'RecipeOptions(%s)' % ', '.join('%s=%r' % item for item in sorted(vars(self).items()))
+
+class Recipe(dict):
+    """ Recipe JSON document as returned by fetch_recipe """
+
+    @property
+    def title(self):
+        return json_clean_value(self, 'title')
+
+    @property
+    def url(self):
+        return json_clean_value(self, 'url')
+
+    def render(self, format='rst', options=None, stream=None):
+        return render(self, format, options, stream)
+
+def _options(options, overrides):
+    if options is None:
+        return RecipeOptions(**overrides)
+    if overrides:
+        raise TypeError('Pass options or keyword options, not both')
+    return options
+
+def fetch_recipe(url, options=None, **overrides):
+    """ Scrapes the recipe at url.  Options are a RecipeOptions (or
+        Namespace) or keyword arguments of RecipeOptions.  Safe to call from
+        many threads at once; messages go to options.logger.
+    """
+
+    options = _options(options, overrides)
+    with log_to(getattr(options, 'logger', DEFAULT_LOGGER)):
+        return Recipe(url2recipe_json(options, url))
+
+def render(recipe, format='rst', options=None, stream=None, **overrides):
+    """ Returns recipe as JSON, Markdown ('md') or reStructuredText ('rst'),
+        scaled and converted by options.scale and options.units.  The text is
+        also written to stream if given.
+    """
+
+    if not format in FORMATS:
+        raise ValueError("Unknown format '%s', expected one of %s" % (format, ', '.join(FORMATS)))
+
+    options = _options(options, overrides)
+    with log_to(getattr(options, 'logger', DEFAULT_LOGGER)):
+        text = recipe_json2text(options, convert_recipe(recipe, getattr(options, 'scale', 1), getattr(options, 'units', None)), format)
+    if not stream is None:
+        stream.write(text)
+    return text
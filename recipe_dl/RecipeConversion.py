@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import argparse
+import re
+
+from fractions import Fraction
+
+from .IngredientParser import parse_ingredients
+
+# (dimension, size in millilitres or grams) of each canonical unit
+UNIT_SIZES = {
+    'teaspoon': ('volume', Fraction('4.92892159375')),
+    'tablespoon': ('volume', Fraction('14.78676478125')),
+    'fluid ounce': ('volume', Fraction('29.5735295625')),
+    'cup': ('volume', Fraction('236.5882365')),
+    'pint': ('volume', Fraction('473.176473')),
+    'quart': ('volume', Fraction('946.352946')),
+    'gallon': ('volume', Fraction('3785.411784')),
+    'milliliter': ('volume', Fraction(1)),
+    'centiliter': ('volume', Fraction(10)),
+    'deciliter': ('volume', Fraction(100)),
+    'liter': ('volume', Fraction(1000)),
+    'milligram': ('weight', Fraction(1, 1000)),
+    'gram': ('weight', Fraction(1)),
+    'kilogram': ('weight', Fraction(1000)),
+    'ounce': ('weight', Fraction('28.349523125')),
+    'pound': ('weight', Fraction('453.59237')),
+}
+
+# Units to convert to for each system, largest first, with the smallest
+# amount of the unit worth writing
+TARGET_UNITS = {
+    'metric': {
+        'volume': [('liter', Fraction(1)), ('milliliter', Fraction(0))],
+        'weight': [('kilogram', Fraction(1)), ('gram', Fraction(0))],
+    },
+    'us': {
+        'volume': [('gallon', Fraction(2)), ('quart', Fraction(2)), ('cup', Fraction(1, 4)), ('tablespoon', Fraction(1)), ('teaspoon', Fraction(0))],
+        'weight': [('pound', Fraction(1)), ('ounce', Fraction(0))],
+    },
+}
+
+METRIC_UNITS = ('milliliter', 'centiliter', 'deciliter', 'liter', 'milligram', 'gram', 'kilogram')
+
+UNIT_PLURALS = {
+    'inch': 'inches',
+    'pinch': 'pinches',
+    'dash': 'dashes',
+    'bunch': 'bunches',
+}
+
+# Denominators written as fractions, anything else is written as a decimal
+FRACTION_DENOMINATORS = (1, 2, 3, 4, 8)
+
+_NUMBER_RE = re.compile(r'(\d+\s+\d+/\d+|\d+/\d+|\d+(?:\.\d+)?)')
+
+def parse_quantity(text):
+    """ Returns the quantity text ('1 1/2', '0.5', '3/4') as a Fraction """
+
+    value = Fraction(0)
+    for part in text.split():
+        value += Fraction(part)
+    return value
+
+def positive_fraction(text):
+    """ Returns the scale factor text ('2', '0.5', '1/2') as a Fraction,
+        raising argparse.ArgumentTypeError unless it is a number above 0
+    """
+
+    try:
+        value = Fraction(str(text))
+    except (ValueError, ZeroDivisionError):
+        raise argparse.ArgumentTypeError("invalid scale factor %r, use a number such as 2, 0.5 or 1/2" % (text,))
+    if value <= 0:
+        raise argparse.ArgumentTypeError("scale factor %r must be greater than 0" % (text,))
+    return value
+
+def format_quantity(value, metric=False):
+    """ Formats a Fraction as a mixed number ('1 1/2') or, when no small
+        denominator fits, as a rounded decimal
+    """
+
+    if metric:
+        if value >= 10:
+            return str(int(round(value)))
+        return ('%.1f' % value).rstrip('0').rstrip('.')
+
+    for denominator in FRACTION_DENOMINATORS:
+        rounded = Fraction(round(value * denominator), denominator)
+        if abs(rounded - value) <= value / 50:
+            whole, remainder = divmod(rounded.numerator, rounded.denominator)
+            if remainder == 0:
+                return str(whole)
+            fraction = '%d/%d' % (remainder, rounded.denominator)
+            return fraction if whole == 0 else '%d %s' % (whole, fraction)
+    return ('%.2f' % value).rstrip('0').rstrip('.')
+
+def convert_amount(value, unit, system):
+    """ Converts value of unit into the best unit of system.  Returns
+        (value, unit), unchanged when unit has no size.
+    """
+
+    if not unit in UNIT_SIZES:
+        return value, unit
+    dimension, size = UNIT_SIZES[unit]
+    base = value * size
+    for target, minimum in TARGET_UNITS[system][dimension]:
+        target_value = base / UNIT_SIZES[target][1]
+        if target_value >= minimum:
+            return target_value, target
+    return value, unit
+
+def unit_text(unit, value):
+    """ Returns unit pluralized to match value """
+
+    if unit == '' or value <= 1:
+        return unit
+    return UNIT_PLURALS.get(unit, unit + 's')
+
+def convert_ingredient(ingredient, factor=1, system=None):
+    """ Scales and converts a parsed ingredient.  Returns the new parsed
+        ingredient and its text, or None when there is nothing to change.
+    """
+
+    if ingredient['quantity'] == '':
+        return None
+
+    try:
+        values = [parse_quantity(part) * factor for part in ingredient['quantity'].split('-')]
+    except (ValueError, ZeroDivisionError):
+        # Not a number after all, leave the line as written
+        return None
+    unit = ingredient['unit']
+    if not system is None and unit in UNIT_SIZES:
+        # The top of a range picks the unit for both ends
+        unit = convert_amount(values[-1], unit, system)[1]
+        values = [value * UNIT_SIZES[ingredient['unit']][1] / UNIT_SIZES[unit][1] for value in values]
+
+    parsed = dict(ingredient)
+    parsed['quantity'] = '-'.join(format_quantity(value, unit in METRIC_UNITS) for value in values)
+    parsed['unit'] = unit
+
+    if unit in UNIT_SIZES:
+        parts = (parsed['quantity'], unit_text(unit, values[-1]), parsed['size'], parsed['item'])    # 1 cup (2 sticks) butter
+    else:
+        parts = (parsed['quantity'], parsed['size'], unit_text(unit, values[-1]), parsed['item'])    # 1 (14-ounce) can tomatoes
+    text = ' '.join(part for part in parts if part != '')
+    if parsed['modifier'] != '':
+        if parsed['modifier'].startswith('(') or parsed['modifier'].split(' ')[0] in ('to', 'as', 'for', 'optional'):
+            text += ' ' + parsed['modifier']
+        else:
+            text += ', ' + parsed['modifier']
+    return parsed, text
+
+def scale_yield(recipe_yield, factor):
+    """ Multiplies the numbers in a yield ('4 servings', '2-3 loaves') """
+
+    if factor == 1 or recipe_yield == '':
+        return recipe_yield
+    return _NUMBER_RE.sub(lambda match: format_quantity(parse_quantity(match.group(1)) * factor), str(recipe_yield))
+
+def convert_recipe(recipe_json, factor=1, system=None):
+    """ Returns a copy of recipe_json scaled by factor and, if system is
+        'metric' or 'us', with ingredient amounts converted to that system.
+        recipe_json itself is not changed.
+    """
+
+    if factor == 1 and system is None:
+        return recipe_json
+
+    converted_json = dict(recipe_json)
+    converted_json['yield'] = scale_yield(recipe_json.get('yield', ''), factor)
+    converted_json['ingredient_groups'] = []
+    for group in recipe_json.get('ingredient_groups') or []:
+        ingredients = group.get('ingredients') or []
+        parsed_ingredients = group.get('ingredients_parsed')
+        if parsed_ingredients is None:
+            parsed_ingredients = parse_ingredients(ingredients)
+
+        converted_group = dict(group)
+        converted_group['ingredients'] = []
+        converted_group['ingredients_parsed'] = []
+        for ingredient, parsed in zip(ingredients, parsed_ingredients):
+            converted = convert_ingredient(parsed, factor, system)
+            if converted is None:
+                converted_group['ingredients'].append(ingredient)
+                converted_group['ingredients_parsed'].append(parsed)
+            else:
+                converted_group['ingredients_parsed'].append(converted[0])
+                converted_group['ingredients'].append(converted[1])
+        converted_json['ingredient_groups'].append(converted_group)
+
+    return converted_json
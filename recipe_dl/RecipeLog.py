@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import contextvars
+
+from contextlib import contextmanager
+
+import CustomPrint
+
+# Logger messages go to in the current context, None prints through
+# CustomPrint as the command line does
+_logger = contextvars.ContextVar('recipe_dl_logger', default=None)
+
+@contextmanager
+def log_to(logger):
+    """ Sends messages in this context (thread) to logger, any object with
+        debug/info/warning/error methods such as a logging.Logger
+    """
+
+    token = _logger.set(logger)
+    try:
+        yield logger
+    finally:
+        _logger.reset(token)
+
+def print_info(message):
+    logger = _logger.get()
+    if logger is None:
+        CustomPrint.print_info(message)
+    else:
+        logger.info(message)
+
+def print_debug(message):
+    logger = _logger.get()
+    if logger is None:
+        CustomPrint.print_debug(message)
+    else:
+        logger.debug(message)
+
+def print_warning(message):
+    logger = _logger.get()
+    if logger is None:
+        CustomPrint.print_warning(message)
+    else:
+        logger.warning(message)
+
+def print_error(message):
+    logger = _logger.get()
+    if logger is None:
+        CustomPrint.print_error(message)
+    else:
+        logger.error(message)
+
+def print_to_console(message):
+    """ Prompts for the user always go to the console """
+
+    CustomPrint.print_to_console(message)
@@ -1,156 +1,193 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import os
 import re
-import json
+from . import JsonCodec
+import hashlib
 import textwrap
 
-from CustomPrint import custom_print_init, print_info, print_debug, print_error, print_warning
+from .RecipeLog import print_info, print_debug, print_error, print_warning
 
-from UtilityFunctions import url2domain, json_clean_value
+from .UtilityFunctions import url2domain, json_clean_value
+from .RecipeStore import open_store
+from .RecipeConversion import convert_recipe
+from .Dedup import find_duplicate
+from .OutputWriter import output_path, write_file, when_written
+from .Archive import get_archive
+from .Images import add_image_file
 
-def recipe_output(args, recipe_json):
-    """ Output recipe_json document """
-
-    def recipe_output_file(args, recipe_json, format=""):
-        """ Output recipe_json document in the desired format """
-
-        def recipe_json2doc(args, recipe_json, format='rst', base_level=1):
-            """ Build reStructuredText from recipe JSON """
+def recipe_json2doc(args, recipe_json, format='rst', base_level=1):
+    """ Build reStructuredText from recipe JSON """
 
-            def format2text(format):
-                """ Formats output ext to human readable format name """
+    def format2text(format):
+        """ Formats output ext to human readable format name """
 
-                format_text = ''
-                if format == 'json':
-                    format_text = 'JSON'
-                elif format == 'md':
-                    format_text = 'Markdown'
-                elif format == 'rst':
-                    format_text = 'reStructuredText'
+        format_text = ''
+        if format == 'json':
+            format_text = 'JSON'
+        elif format == 'md':
+            format_text = 'Markdown'
+        elif format == 'rst':
+            format_text = 'reStructuredText'
+        else:
+            format_text = "Unknown format [%s]" % (format)
+            print_warning("Unknown format [%s]" % (format))
+            #raise ("ERROR: Unknown format [%s]" % (format))
+        return format_text
+
+    def output_header(header_text, format='rst', level=1):
+        """ returns string containg formated header """
+
+        out_string = ''
+        if format == 'md':
+            out_string += '#' * (level + 1)
+            out_string += ' '
+        out_string += header_text + '\n'
+        if format == 'rst':
+            level_chars = ['=', '-', '^']
+            level_char = level_chars[level - 1]
+            out_string += re.sub('.', level_char, header_text) + '\n'
+        out_string += '\n'
+
+        return out_string
+
+    def output_group(json_obj, group_key, item_key, item_prefix, item_wrap = False, format='rst', base_level=2):
+        """ returns string containg formated groups/lists """
+
+        out_string = ''
+        group_count = len(json_clean_value(recipe_json, group_key))
+        for group_index, group in enumerate(json_clean_value(recipe_json, group_key)):
+            group_title = json_clean_value(group, 'title')
+
+            if group_title != '':
+                if group_index > 0:
+                    out_string += '\n'
+                out_string += output_header(group_title, format=format, level=(base_level+1))
+
+            for item_count, item in enumerate(json_clean_value(group, item_key), 1):
+                if item_prefix == '#':
+                    prefix = str(item_count).strip() + '. '
                 else:
-                    format_text = "Unknown format [%s]" % (format)
-                    print_warning("Unknown format [%s]" % (format))
-                    #raise ("ERROR: Unknown format [%s]" % (format))
-                return format_text
-
-            def output_header(header_text, format='rst', level=1):
-                """ returns string containg formated header """
-
-                out_string = ''
-                if format == 'md':
-                    out_string += '#' * (level + 1)
-                    out_string += ' '
-                out_string += header_text + '\n'
-                if format == 'rst':
-                    level_chars = ['=', '-', '^']
-                    level_char = level_chars[level - 1]
-                    out_string += re.sub('.', level_char, header_text) + '\n'
-                out_string += '\n'
-
-                return out_string
-
-            def output_group(json_obj, group_key, item_key, item_prefix, item_wrap = False, format='rst', base_level=2):
-                """ returns string containg formated groups/lists """
-
-                out_string = ''
-                group_count = len(json_clean_value(recipe_json, group_key))
-                for group_index, group in enumerate(json_clean_value(recipe_json, group_key)):
-                    group_title = json_clean_value(group, 'title')
-
-                    if group_title != '':
-                        if group_index > 0:
-                            out_string += '\n'
-                        out_string += output_header(group_title, format=format, level=(base_level+1))
-
-                    for item_count, item in enumerate(json_clean_value(group, item_key), 1):
-                        if item_prefix == '#':
-                            prefix = str(item_count).strip() + '. '
-                        else:
-                            prefix = item_prefix.strip() + ' '
-                        if item_wrap:
-                            item_lines = textwrap.wrap(item, width = 75, initial_indent = prefix, subsequent_indent = re.sub('.', ' ', prefix))
-                            for line in item_lines:
-                                out_string += line + '\n'
-                        else:
-                            out_string += prefix.strip() + ' ' + str(item) + '\n'
-
-                return out_string
-
-            format_prefix = '-'
-            if format == 'md':
-                format_prefix = '*'
-
-            print_debug("Building " + format2text(format) + " from recipe JSON...")
-            print_debug(recipe_json)
-
-            output = output_header(json_clean_value(recipe_json, 'title'), format)
-
-            recipe_yield = json_clean_value(recipe_json, 'yield')
-            preptime = json_clean_value(recipe_json, 'preptime')
-            cooktime = json_clean_value(recipe_json, 'cooktime')
-            totaltime = json_clean_value(recipe_json, 'totaltime')
-
-            info = "| "
-            if preptime != '':
-                info += 'Prep: ' + preptime + ' | '
-            if totaltime != '':
-                info += 'Total: ' + totaltime + ' | '
-            if recipe_yield != '':
-                info += 'Yield: ' + str(recipe_yield) + ' | '
-            info = info.strip()
-
-            if info != '|':
-                divider_line = re.sub('[^|]', '-', info)
-                if format == 'rst':
-                    divider_line = re.sub('[|]', '+', divider_line)
-                output += divider_line + '\n' + info +'\n' + divider_line + '\n\n'
-
-            # TODO: make this work with markdown and missing URL
-            url = json_clean_value(recipe_json, 'url')
-            author = json_clean_value(recipe_json, 'author')
-            if url is None or url == '':
-                if not author is None and author != '':
-                    output += 'Source: ' + author + '\n\n'
-            else:
-                if author is None or author == '':
-                    author = url2domain(url)
-                if format == 'md':
-                    output += 'Source: [' + author + '](' + url + ')\n\n'
-                elif format == 'rst':
-                    output += 'Source: `' + author + ' <' + url + '>`__\n\n'
+                    prefix = item_prefix.strip() + ' '
+                if item_wrap:
+                    item_lines = textwrap.wrap(item, width = 75, initial_indent = prefix, subsequent_indent = re.sub('.', ' ', prefix))
+                    for line in item_lines:
+                        out_string += line + '\n'
                 else:
-                    output += 'Source: ' + author + '\n\n'
+                    out_string += prefix.strip() + ' ' + str(item) + '\n'
+
+        return out_string
+
+    format_prefix = '-'
+    if format == 'md':
+        format_prefix = '*'
+
+    print_debug("Building " + format2text(format) + " from recipe JSON...")
+    if args.debug:
+        print_debug(recipe_json)
+
+    output = output_header(json_clean_value(recipe_json, 'title'), format)
+
+    recipe_yield = json_clean_value(recipe_json, 'yield')
+    preptime = json_clean_value(recipe_json, 'preptime')
+    cooktime = json_clean_value(recipe_json, 'cooktime')
+    totaltime = json_clean_value(recipe_json, 'totaltime')
+
+    info = "| "
+    if preptime != '':
+        info += 'Prep: ' + preptime + ' | '
+    if totaltime != '':
+        info += 'Total: ' + totaltime + ' | '
+    if recipe_yield != '':
+        info += 'Yield: ' + str(recipe_yield) + ' | '
+    info = info.strip()
+
+    if info != '|':
+        divider_line = re.sub('[^|]', '-', info)
+        if format == 'rst':
+            divider_line = re.sub('[|]', '+', divider_line)
+        output += divider_line + '\n' + info +'\n' + divider_line + '\n\n'
+
+    # TODO: make this work with markdown and missing URL
+    url = json_clean_value(recipe_json, 'url')
+    author = json_clean_value(recipe_json, 'author')
+    if url is None or url == '':
+        if not author is None and author != '':
+            output += 'Source: ' + author + '\n\n'
+    else:
+        if author is None or author == '':
+            author = url2domain(url)
+        if format == 'md':
+            output += 'Source: [' + author + '](' + url + ')\n\n'
+        elif format == 'rst':
+            output += 'Source: `' + author + ' <' + url + '>`__\n\n'
+        else:
+            output += 'Source: ' + author + '\n\n'
+
+    description = textwrap.wrap(json_clean_value(recipe_json, 'description'), width = 75)
+    for line in description:
+        output += line + '\n'
+
+    output += '\n'
+    output += output_header('Ingredients', format=format, level=2)
+    output += output_group(recipe_json, 'ingredient_groups', 'ingredients', format_prefix, format=format, base_level=2)
+
+    output += '\n'
+    output += output_header('Directions', format=format, level=2)
+    output += output_group(recipe_json, 'direction_groups', 'directions', '#', item_wrap = True, format=format, base_level=2)
+
+    notes = json_clean_value(recipe_json, 'notes')
+    if not notes is None and notes != '':
+        output += '\n'
+        output += output_header('Notes', format=format, level=2)
+
+        for note in notes:
+            note = re.sub('\*\*\*', '', note)
+            if len(notes) > 1:
+                not_prefic = format_prefix.strip() + ' '
+                for line in textwrap.wrap(note, width = 75, initial_indent = note_prefix, subsequent_indent = re.sub('.', ' ', note_prefix)):
+                    output += line + '\n'
+            else:
+                for line in textwrap.wrap(note, width = 75):
+                    output += line + '\n'
+            output += '\n'
 
-            description = textwrap.wrap(json_clean_value(recipe_json, 'description'), width = 75)
-            for line in description:
-                output += line + '\n'
+    return output
 
-            output += '\n'
-            output += output_header('Ingredients', format=format, level=2)
-            output += output_group(recipe_json, 'ingredient_groups', 'ingredients', format_prefix, format=format, base_level=2)
+def recipe_json2text(args, recipe_json, format='rst'):
+    """ Returns recipe_json as JSON, Markdown or reStructuredText """
 
-            output += '\n'
-            output += output_header('Directions', format=format, level=2)
-            output += output_group(recipe_json, 'direction_groups', 'directions', '#', item_wrap = True, format=format, base_level=2)
-
-            notes = json_clean_value(recipe_json, 'notes')
-            if not notes is None and notes != '':
-                output += '\n'
-                output += output_header('Notes', format=format, level=2)
-
-                for note in notes:
-                    note = re.sub('\*\*\*', '', note)
-                    if len(notes) > 1:
-                        not_prefic = format_prefix.strip() + ' '
-                        for line in textwrap.wrap(note, width = 75, initial_indent = note_prefix, subsequent_indent = re.sub('.', ' ', note_prefix)):
-                            output += line + '\n'
-                    else:
-                        for line in textwrap.wrap(note, width = 75):
-                            output += line + '\n'
-                    output += '\n'
-
-            return output
+    if format == 'json':
+        return JsonCodec.dumps(recipe_json, indent=None if getattr(args, 'compact_json', False) else 4)
+    elif format == 'md':
+        return recipe_json2doc(args, recipe_json, format='md')
+    elif format == 'rst':
+        return recipe_json2doc(args, recipe_json, format='rst')
+    else:
+        print_error("Unknown format [%s]" % (format))
+        raise ("ERROR: Unknown format [%s]" % (format))
+
+def output_key(args):
+    """ Returns a hash of the options that change the output of a recipe,
+        so incremental runs redo pages whose last output used other options
+    """
+
+    options = [getattr(args, name, None) for name in ('output_json', 'output_md', 'output_rst', 'compact_json', 'save_to_file', 'outfile', 'output_dir', 'archive', 'scale', 'units', 'dedup', 'dedup_threshold')]
+    return hashlib.sha256(JsonCodec.dumps([str(option) for option in options]).encode('utf-8')).hexdigest()
+
+def recipe_output(args, recipe_json):
+    """ Output recipe_json document.  Returns a future whose result is the
+        list of files written once they are all written (or which raises
+        the error of any that failed).  The recipe is saved to the store
+        only then, without holding up the next recipe.
+    """
+
+    def recipe_output_file(args, recipe_json, format=""):
+        """ Output recipe_json document in the desired format.  Returns the
+            file written (or the future of the queued write) or None when
+            output went to stdout.
+        """
 
         def output_filename(filename, ext=""):
             """ Ensures filename has proper extension. """
@@ -160,7 +197,7 @@ def recipe_output(args, recipe_json):
                 ret_value = (filename + "." + ext).replace("." + ext + "." + ext, "." + ext)
             return ret_value
 
-        ret_value = 0
+        ret_value = None
 
         title = json_clean_value(recipe_json, "title")
         if format == '':
@@ -170,15 +207,7 @@ def recipe_output(args, recipe_json):
                 except:
                     pass
 
-        if format == 'json':
-            output = json.dumps(recipe_json, indent=4)
-        elif format == 'md':
-            output = recipe_json2doc(args, recipe_json, format='md')
-        elif format == 'rst':
-            output = recipe_json2doc(args, recipe_json, format='rst')
-        else:
-            print_error("Unknown format [%s]" % (format))
-            raise ("ERROR: Unknown format [%s]" % (format))
+        output = recipe_json2text(args, recipe_json, format)
 
         if output is None or output.strip() == "":
             print_error("Problem output is empty")
@@ -188,25 +217,61 @@ def recipe_output(args, recipe_json):
                     savefile = output_filename(re.sub(r'\W+', '', title), format)
                 else:
                     savefile = output_filename(args.outfile, format)
-                print_info("Writing output to %s..." % savefile)
-                text_file = open(savefile, "w")
-                ret_value = text_file.write(output)
-                text_file.close()
+                url = json_clean_value(recipe_json, 'url')
+                savefile = output_path(savefile, url)
+                archive = get_archive()
+                if archive is None:
+                    print_info("Writing output to %s..." % savefile)
+                    ret_value = write_file(savefile, output)
+                else:
+                    print_info("Adding %s to %s..." % (savefile, archive.filename))
+                    ret_value = archive.add(savefile, output, url, title, format)
             else:
                 print (output)
 
         return ret_value
 
-    custom_print_init (quiet=args.quiet, debug=args.debug)
-
+    saved_files = []
+    recipe_hash = None
     title = json_clean_value(recipe_json, "title")
+    if title != "" and not args.dedup is None:
+        duplicate = find_duplicate(recipe_json, args.dedup_threshold)
+        if not duplicate is None:
+            if args.dedup == 'skip':
+                print_info ("   Skipping duplicate of %s (%.0f%% similar): %s" % (duplicate[0], duplicate[1] * 100, title))
+                return when_written(saved_files)
+            recipe_json['duplicate_of'] = duplicate[0]
+
+    if title != "" and args.incremental:
+        recipe_hash = hashlib.sha256(JsonCodec.dumps(recipe_json, sort_keys=True).encode('utf-8')).hexdigest()
+        fetch_state = open_store(args.store).get_fetch_state(json_clean_value(recipe_json, 'url'))
+        if not fetch_state is None and fetch_state['recipe_hash'] == recipe_hash and fetch_state['output_key'] == output_key(args):
+            print_info ("   Recipe unchanged: %s" % (title))
+            open_store(args.store).save_recipe_hash(json_clean_value(recipe_json, 'url'), recipe_hash, output_key(args))
+            return when_written(saved_files)
+
+    def saved(paths):
+        """ Records the recipe once its files exist """
+
+        if not args.store is None:
+            print_debug ("Saving to recipe store %s..." % args.store)
+            open_store(args.store).save(recipe_json)
+        if not recipe_hash is None:
+            open_store(args.store).save_recipe_hash(json_clean_value(recipe_json, 'url'), recipe_hash, output_key(args))
+
     if title != "":
         print_info ("   Processing complete: %s" % (title))
+        if not getattr(args, 'images', None) is None:
+            add_image_file(recipe_json)
+        output_json = convert_recipe(recipe_json, args.scale, args.units)
         if args.output_json:
-            recipe_output_file (args, recipe_json, "json")
+            saved_files.append(recipe_output_file (args, output_json, "json"))
         if args.output_md:
-            recipe_output_file (args, recipe_json, "md")
+            saved_files.append(recipe_output_file (args, output_json, "md"))
         if args.output_rst:
-            recipe_output_file (args, recipe_json, "rst")
-    else:
-        print_warning ("Unable to retrieve title from json")
+            saved_files.append(recipe_output_file (args, output_json, "rst"))
+        # Nothing is recorded for the recipe until its files exist
+        return when_written([saved_file for saved_file in saved_files if not saved_file is None], saved)
+
+    print_warning ("Unable to retrieve title from json")
+    return when_written(saved_files)
@@ -0,0 +1,303 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from . import JsonCodec
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from .UtilityFunctions import url2publisher, json_clean_value
+
+DEFAULT_STORE = os.path.expanduser('~') + "/.config/recipe-dl/recipes.sqlite"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS recipes (
+    url TEXT PRIMARY KEY,
+    title TEXT,
+    publisher TEXT,
+    author TEXT,
+    yield TEXT,
+    preptime TEXT,
+    cooktime TEXT,
+    totaltime TEXT,
+    recipe_json TEXT NOT NULL,
+    updated REAL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS recipes_fts USING fts5(
+    url UNINDEXED, title, description, ingredients, directions
+);
+CREATE TABLE IF NOT EXISTS ingredient_index (
+    term TEXT NOT NULL,
+    url TEXT NOT NULL,
+    PRIMARY KEY (term, url)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS ingredient_index_url ON ingredient_index (url);
+CREATE TABLE IF NOT EXISTS fetch_state (
+    url TEXT PRIMARY KEY,
+    etag TEXT,
+    last_modified TEXT,
+    body_hash TEXT,
+    recipe_hash TEXT,
+    output_key TEXT,
+    pending_etag TEXT,
+    pending_last_modified TEXT,
+    pending_body_hash TEXT,
+    checked REAL
+);
+CREATE TABLE IF NOT EXISTS failed_urls (
+    url TEXT PRIMARY KEY,
+    error_class TEXT,
+    message TEXT,
+    failed REAL,
+    expires REAL
+);
+"""
+
+# Words in ingredient lines that say nothing about the ingredient itself
+INGREDIENT_STOPWORDS = frozenset("""
+    a an and or of to the for in into on with without about plus more less
+    cup cups tablespoon tablespoons tbsp tbs teaspoon teaspoons tsp ounce ounces oz
+    pound pounds lb lbs gram grams g kg kilogram kilograms ml milliliter milliliters
+    liter liters l pint pints quart quarts gallon gallons pinch dash can cans
+    large small medium whole fresh freshly finely coarsely roughly thinly chopped
+    minced diced sliced divided optional taste needed such as each inch inches
+""".split())
+
+_lock = threading.Lock()
+_stores = {}
+_commit_every = 100
+
+def ingredient_terms(text):
+    """ Returns the set of index terms for an ingredient line or query """
+
+    terms = set()
+    for word in re.findall(r'[a-z]+', text.lower()):
+        if len(word) < 2 or word in INGREDIENT_STOPWORDS:
+            continue
+        if len(word) > 3 and word.endswith('s') and not word.endswith('ss'):
+            word = word[:-1]
+        terms.add(word)
+    return terms
+
+def stores_init(commit_every=100):
+    """ Sets how many writes the stores opened with open_store batch into
+        one commit.  A store file shared by several processes needs 1, as
+        writes not yet committed lock the others out of it.
+    """
+
+    global _commit_every
+
+    with _lock:
+        _commit_every = commit_every
+        for store in _stores.values():
+            store.commit_every = commit_every
+            store.commit()
+
+def open_store(filename):
+    """ Returns the (cached) RecipeStore for filename.  Worker threads
+        share the one store (and connection) per file, as a second
+        connection is locked out by the first one's uncommitted writes.
+    """
+
+    with _lock:
+        store = _stores.get(filename)
+        if store is None:
+            store = RecipeStore(filename, _commit_every)
+            _stores[filename] = store
+    return store
+
+def close_stores():
+    """ Commits and closes every store opened with open_store """
+
+    with _lock:
+        for store in _stores.values():
+            store.close()
+        _stores.clear()
+
+class RecipeStore:
+    """ SQLite store of recipe JSON keyed by URL, with a full-text index over
+        title, description, ingredients and directions plus an inverted
+        ingredient index.
+    """
+
+    def __init__(self, filename=DEFAULT_STORE, commit_every=100):
+        path = os.path.dirname(os.path.abspath(filename))
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        self.filename = filename
+        self.commit_every = commit_every
+        self.uncommitted = 0
+        self.lock = threading.RLock()
+        self.connection = sqlite3.connect(filename, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.executescript(SCHEMA)
+
+    def save(self, recipe_json):
+        """ Inserts or replaces recipe_json (keyed by its url) """
+
+        url = json_clean_value(recipe_json, 'url')
+        ingredients = [ingredient for group in json_clean_value(recipe_json, 'ingredient_groups', []) for ingredient in json_clean_value(group, 'ingredients', [])]
+        directions = [direction for group in json_clean_value(recipe_json, 'direction_groups', []) for direction in json_clean_value(group, 'directions', [])]
+        terms = set()
+        for ingredient in ingredients:
+            terms.update(ingredient_terms(str(ingredient)))
+
+        with self.lock:
+            self._save(url, recipe_json, ingredients, directions, terms)
+
+    def _save(self, url, recipe_json, ingredients, directions, terms):
+        cursor = self.connection.cursor()
+        cursor.execute(
+            'INSERT OR REPLACE INTO recipes (url, title, publisher, author, yield, preptime, cooktime, totaltime, recipe_json, updated) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (
+                url,
+                json_clean_value(recipe_json, 'title'),
+                url2publisher(url),
+                str(json_clean_value(recipe_json, 'author')),
+                str(json_clean_value(recipe_json, 'yield')),
+                json_clean_value(recipe_json, 'preptime'),
+                json_clean_value(recipe_json, 'cooktime'),
+                json_clean_value(recipe_json, 'totaltime'),
+                JsonCodec.dumps(recipe_json),
+                time.time(),
+            )
+        )
+        cursor.execute('DELETE FROM recipes_fts WHERE url = ?', (url,))
+        cursor.execute(
+            'INSERT INTO recipes_fts (url, title, description, ingredients, directions) VALUES (?, ?, ?, ?, ?)',
+            (url, json_clean_value(recipe_json, 'title'), str(json_clean_value(recipe_json, 'description')), '\n'.join(map(str, ingredients)), '\n'.join(map(str, directions)))
+        )
+        cursor.execute('DELETE FROM ingredient_index WHERE url = ?', (url,))
+        cursor.executemany('INSERT INTO ingredient_index (term, url) VALUES (?, ?)', [(term, url) for term in terms])
+        self._committed()
+
+    def get(self, url):
+        """ Returns the stored recipe JSON for url or None """
+
+        with self.lock:
+            row = self.connection.execute('SELECT recipe_json FROM recipes WHERE url = ?', (url,)).fetchone()
+        return None if row is None else JsonCodec.loads(row[0])
+
+    def search(self, query=None, ingredients=None, limit=20):
+        """ Returns (url, title, publisher, totaltime) rows matching the full
+            text query and containing every one of the ingredients.  Raises
+            ValueError if query is not valid FTS5 syntax.
+        """
+
+        conditions = []
+        parameters = []
+        if query:
+            conditions.append('r.url IN (SELECT url FROM recipes_fts WHERE recipes_fts MATCH ?)')
+            parameters.append(query)
+        for ingredient in ingredients or []:
+            for term in ingredient_terms(ingredient):
+                conditions.append('r.url IN (SELECT url FROM ingredient_index WHERE term = ?)')
+                parameters.append(term)
+
+        sql = 'SELECT r.url, r.title, r.publisher, r.totaltime FROM recipes r'
+        if conditions:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        sql += ' ORDER BY r.title LIMIT ?'
+        parameters.append(limit)
+
+        with self.lock:
+            try:
+                return self.connection.execute(sql, parameters).fetchall()
+            except sqlite3.OperationalError as err:
+                if not query:
+                    raise
+                raise ValueError('Invalid query %s (%s).' % (query, err))
+
+    def get_fetch_state(self, url):
+        """ Returns the fetch metadata (etag, last_modified, body_hash,
+            recipe_hash, output_key) recorded for url by the last run whose
+            output succeeded, or None
+        """
+
+        with self.lock:
+            row = self.connection.execute('SELECT etag, last_modified, body_hash, recipe_hash, output_key FROM fetch_state WHERE url = ?', (url,)).fetchone()
+        if row is None:
+            return None
+        return dict(zip(('etag', 'last_modified', 'body_hash', 'recipe_hash', 'output_key'), row))
+
+    def save_fetch_state(self, url, etag=None, last_modified=None, body_hash=None):
+        """ Records the fetch metadata of the page url was parsed from.  It
+            is kept pending, and not used to skip the page, until
+            save_recipe_hash records that the recipe was output.
+        """
+
+        with self.lock:
+            self.connection.execute(
+                'INSERT INTO fetch_state (url, pending_etag, pending_last_modified, pending_body_hash, checked) VALUES (?, ?, ?, ?, ?) '
+                'ON CONFLICT(url) DO UPDATE SET pending_etag = excluded.pending_etag, pending_last_modified = excluded.pending_last_modified, pending_body_hash = excluded.pending_body_hash, checked = excluded.checked',
+                (url, etag, last_modified, body_hash, time.time())
+            )
+            self._committed()
+
+    def save_recipe_hash(self, url, recipe_hash, output_key=None):
+        """ Records the hash of the recipe JSON output for url with the
+            output options output_key, confirming the pending fetch metadata
+        """
+
+        with self.lock:
+            self.connection.execute(
+                'INSERT INTO fetch_state (url, recipe_hash, output_key, checked) VALUES (?, ?, ?, ?) '
+                'ON CONFLICT(url) DO UPDATE SET recipe_hash = excluded.recipe_hash, output_key = excluded.output_key, checked = excluded.checked, '
+                'etag = CASE WHEN pending_body_hash IS NULL THEN etag ELSE pending_etag END, '
+                'last_modified = CASE WHEN pending_body_hash IS NULL THEN last_modified ELSE pending_last_modified END, '
+                'body_hash = COALESCE(pending_body_hash, body_hash), '
+                'pending_etag = NULL, pending_last_modified = NULL, pending_body_hash = NULL',
+                (url, recipe_hash, output_key, time.time())
+            )
+            self._committed()
+
+    def get_failure(self, url):
+        """ Returns the failure (error_class, message, failed, expires)
+            recorded for url if it has not expired, or None
+        """
+
+        with self.lock:
+            row = self.connection.execute('SELECT error_class, message, failed, expires FROM failed_urls WHERE url = ? AND expires > ?', (url, time.time())).fetchone()
+        if row is None:
+            return None
+        return dict(zip(('error_class', 'message', 'failed', 'expires'), row))
+
+    def save_failure(self, url, error_class, message, ttl):
+        """ Records that url failed with error_class, to be skipped for ttl
+            seconds
+        """
+
+        now = time.time()
+        with self.lock:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO failed_urls (url, error_class, message, failed, expires) VALUES (?, ?, ?, ?, ?)',
+                (url, error_class, message, now, now + ttl)
+            )
+            self._committed()
+
+    def clear_failure(self, url):
+        """ Forgets any failure recorded for url """
+
+        with self.lock:
+            # Counted even when nothing was deleted, the DELETE still opened
+            # a write transaction
+            self.connection.execute('DELETE FROM failed_urls WHERE url = ?', (url,))
+            self._committed()
+
+    def _committed(self):
+        self.uncommitted += 1
+        if self.uncommitted >= self.commit_every:
+            self.commit()
+
+    def commit(self):
+        with self.lock:
+            self.connection.commit()
+            self.uncommitted = 0
+
+    def close(self):
+        with self.lock:
+            self.commit()
+            self.connection.close()
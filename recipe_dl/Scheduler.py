@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+
+from .UtilityFunctions import url2domain
+
+class TokenBucket:
+    """ Token bucket allowing rate requests per second with bursts of up to
+        burst requests
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """ Blocks until a token is available and takes it """
+
+        if self.rate <= 0:
+            return
+
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+class DomainScheduler:
+    """ Politeness scheduler keeping each domain within its own request rate,
+        concurrency cap and backoff window
+    """
+
+    def __init__(self, rate=1.0, burst=2, concurrency=2, backoff=5.0, max_backoff=300.0):
+        self.rate = rate
+        self.burst = burst
+        self.concurrency = concurrency
+        self.backoff_base = backoff
+        self.max_backoff = max_backoff
+        self.lock = threading.Lock()
+        self.domains = {}
+
+    def _domain(self, domain):
+        """ Returns (creating if needed) the state kept for domain """
+
+        with self.lock:
+            state = self.domains.get(domain)
+            if state is None:
+                state = {
+                    'bucket': TokenBucket(self.rate, self.burst),
+                    'slots': threading.BoundedSemaphore(self.concurrency),
+                    'failures': 0,
+                    'resume_at': 0.0,
+                }
+                self.domains[domain] = state
+            return state
+
+    @contextmanager
+    def slot(self, url):
+        """ Waits until a request to url's domain is allowed and holds one of
+            the domain's concurrency slots for the duration of the block
+        """
+
+        state = self._domain(url2domain(url))
+        with state['slots']:
+            wait = state['resume_at'] - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            state['bucket'].acquire()
+            yield
+
+    def backoff(self, url, retry_after=None):
+        """ Pauses url's domain after a 429/503, honouring Retry-After when
+            given and backing off exponentially otherwise
+        """
+
+        state = self._domain(url2domain(url))
+        with self.lock:
+            state['failures'] += 1
+            if retry_after is None:
+                delay = self.backoff_base * (2 ** (state['failures'] - 1))
+            else:
+                delay = retry_after
+            delay = min(self.max_backoff, delay)
+            state['resume_at'] = max(state['resume_at'], time.monotonic() + delay)
+        return delay
+
+    def success(self, url):
+        """ Resets the backoff for url's domain """
+
+        state = self._domain(url2domain(url))
+        with self.lock:
+            state['failures'] = 0
+
+def retry_after_seconds(value):
+    """ Parses a Retry-After header (seconds or HTTP date) into seconds """
+
+    if value is None or value == '':
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def interleave_by_domain(urls, window=100):
+    """ Yields urls round-robin across domains, buffering at most window urls
+        so a run of urls from one site is spread out over the batch
+    """
+
+    pending = OrderedDict()
+    buffered = 0
+
+    def take():
+        domain, queue = next(iter(pending.items()))
+        url = queue.popleft()
+        if queue:
+            pending.move_to_end(domain)
+        else:
+            del pending[domain]
+        return url
+
+    for url in urls:
+        pending.setdefault(url2domain(url), deque()).append(url)
+        buffered += 1
+        if buffered >= window:
+            buffered -= 1
+            yield take()
+
+    while pending:
+        yield take()
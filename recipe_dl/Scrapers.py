@@ -2,19 +2,42 @@
 # -*- coding: utf-8 -*-
 
 import os
+import functools
+import hashlib
 import requests
 import re
 import json
 
 import iso8601
-from CustomPrint import custom_print_init, print_info, print_debug, print_to_console
-
-from CustomExceptions import Error, UrlError
-from UtilityFunctions import url2domain, url2publisher, json_clean_value, strip_tags
+from . import JsonCodec
+from .RecipeLog import print_info, print_debug, print_to_console
+
+from .CustomExceptions import Error, UrlError, UnsupportedError, NotModifiedError
+from .Profiler import profile_stage, profiled_stage
+from .Fetcher import fetch
+from .RecipeStore import open_store
+from .RecipeOutput import output_key
+from .CircuitBreaker import failure_guard
+from .SiteDefinitions import site_definition, TIME_FIELDS
+from .IngredientParser import add_parsed_ingredients, canonical_unit, normalize_quantity
+from .UtilityFunctions import url2domain, url2publisher, json_clean_value, strip_tags
 
 from lxml import html
 from bs4 import BeautifulSoup
 
+# Name of the strategy that last succeeded for each domain
+_domain_strategies = {}
+
+# Body of each application/ld+json script block.  Script contents are raw
+# text in html so they can be sliced out without building a DOM.
+_LD_JSON_SCRIPT_RE = re.compile(r'<script[^>]*type=.?application/ld\+json.?[^>]*>(.*?)</script', re.DOTALL)
+
+# Keys leading to the recipe documents in the Cook's Illustrated
+# __NEXT_DATA__ script, and the paywall flags anywhere in it
+_CI_DOCUMENTS_PATH = ('initialState', 'content', 'documents')
+_CI_PAYWALL_RE = re.compile(r'"paywall"\s*:\s*')
+_json_decoder = json.JSONDecoder()
+
 def url2recipe_json(args, url):
     """ Loads recipe JSON from URL """
 
@@ -69,6 +92,24 @@ def url2recipe_json(args, url):
 
         return return_time
 
+    def image_url(image):
+        """ Returns the first image URL of a JSON-LD/Contentful style image
+            value (URL string, ImageObject or list of either)
+        """
+
+        if isinstance(image, list):
+            image = image[0] if image else ''
+        if isinstance(image, dict):
+            if 'fields' in image:
+                image = json_clean_value(image['fields'], 'file', image['fields'])
+            image = json_clean_value(image, 'url', json_clean_value(image, 'contentUrl'))
+        if not isinstance(image, str):
+            return ''
+        if image.startswith('//'):
+            image = 'https:' + image
+        return image
+
+    @profiled_stage('scraper:ci')
     def ci2json(args, url):
         """ Loads Cook's Illustrated (and affiliated) URL and checks for
             authentication and then builds Recipe JSON
@@ -80,19 +121,45 @@ def url2recipe_json(args, url):
             import pickle
 
             def find_script(source_html):
+                """ Returns the text of the __NEXT_DATA__ script, sliced
+                    out of the page bytes without parsing the page
+                """
+
                 if source_html is None:
                     return None
-                else:
-                    tree = html.fromstring(source_html)
-                    script_element = tree.xpath('//script[@id="__NEXT_DATA__"]')[0]
-                    return json.loads(script_element.text)
+                start = source_html.find(b'id="__NEXT_DATA__"')
+                if start < 0:
+                    raise UrlError(url, 'Recipe data (__NEXT_DATA__) not found.')
+                start = source_html.find(b'>', start) + 1
+                end = source_html.find(b'</script>', start)
+                return source_html[start:end].decode('utf-8')
+
+            def find_documents(script):
+                """ Decodes only props.initialState.content.documents,
+                    falling back to the whole script if the keys can not be
+                    found in order
+                """
+
+                with profile_stage('parse:json'):
+                    try:
+                        index = 0
+                        for key in _CI_DOCUMENTS_PATH:
+                            index = re.compile(r'"%s"\s*:\s*' % key).search(script, index).end()
+                        documents = _json_decoder.raw_decode(script, index)[0]
+                        if isinstance(documents, dict):
+                            return documents
+                    except (AttributeError, ValueError):
+                        pass
+                    return JsonCodec.loads(script)['props']['initialState']['content']['documents']
 
-            def found_paywall(source_json):
-                ret_value = False
-                paywall_json = list(json_find_key(source_json, 'paywall'))
+            def found_paywall(script):
+                """ True if any paywall flag in the script is set """
 
-                if paywall_json or paywall_json[0] == 'TRUE' or json_clean_value(paywall_json[1], 'status') == "READY":
-                    ret_value = True
+                for match in _CI_PAYWALL_RE.finditer(script):
+                    paywall = _json_decoder.raw_decode(script, match.end())[0]
+                    if paywall is True or paywall == 'TRUE' or (isinstance(paywall, dict) and paywall.get('status') == 'READY'):
+                        return True
+                return False
 
             def cookie_filename(url):
                 return '.' + url2domain(url) + '.cookies'
@@ -176,7 +243,7 @@ def url2recipe_json(args, url):
 
                 if not cookies is None:
                     print_debug ('cookies = ' + str(requests.utils.dict_from_cookiejar(cookies)))
-                    recipe_page = requests.get(url, cookies=cookies).text
+                    recipe_page = fetch(url, cookies=cookies).content
 
                 return recipe_page
 
@@ -184,6 +251,10 @@ def url2recipe_json(args, url):
 
                 print_debug ("Getting page using sessions...")
 
+                if not args.interactive:
+                    # No one to answer the prompt (server, library use)
+                    raise UnsupportedError(url, 'Signing in needs credentials, run recipe-dl --authorize for this site to save its cookies first.')
+
                 auth_json = get_credentials()
 
                 session_requests = requests.session()
@@ -192,7 +263,7 @@ def url2recipe_json(args, url):
                 signin_url = "https://" + domain +"/sign_in?next=%2F"
 
                 signin_page = session_requests.get(signin_url)
-                tree = html.fromstring(signin_page.text)
+                tree = html.fromstring(signin_page.content)
                 action = tree.xpath('//form[@class="appForm"]/@action')[0]
 
                 payload={}
@@ -210,26 +281,22 @@ def url2recipe_json(args, url):
                 save_cookies(session_requests.cookies, url)
 
                 # Grab page
-                recipe_page = session_requests.get(url, headers = dict(referer = url))
+                with profile_stage('fetch'):
+                    recipe_page = session_requests.get(url, headers = dict(referer = url))
 
-                return recipe_page.text
+                return recipe_page.content
 
-            raw_json = json.loads('{ "paywall": true }')
+            script = None
             if not args.authorize_ci:
                 # Getting file using cookies
-                raw_html = get_page_using_cookie(args, url)
-                if not raw_html is None:
-                    raw_json = find_script(raw_html)
+                script = find_script(get_page_using_cookie(args, url))
 
-            if args.authorize_ci or raw_html is None or found_paywall(raw_json):
+            if args.authorize_ci or script is None or found_paywall(script):
                 'Getting page using full authentication'
-                raw_html = get_page_using_session(args, url)
-                raw_json = find_script(raw_html)
-
-            raw_json = raw_json['props']['initialState']['content']['documents']
-            raw_json = raw_json[list(json.loads(json.dumps(raw_json)))[0]]
+                script = find_script(get_page_using_session(args, url))
 
-            return raw_json
+            documents = find_documents(script)
+            return next(iter(documents.values()))
 
         print_debug("Using Cook's Illustrated scraper...")
         recipe_json={}
@@ -238,7 +305,8 @@ def url2recipe_json(args, url):
         source_json = get_json(args, url)
 
         if not source_json is None:
-            print_debug(str(source_json))
+            if args.debug:
+                print_debug(str(source_json))
             recipe_json['title'] = json_clean_value(source_json, 'title')
             recipe_json['description'] = strip_tags(json_clean_value(source_json['metaData']['fields'], 'description'), strip_newline = True)
             recipe_json['yield'] = json_clean_value(source_json, 'yields')
@@ -256,25 +324,36 @@ def url2recipe_json(args, url):
                 author = url2publisher(url)
             recipe_json['author'] = author
 
+            image = image_url(source_json.get('photo') or source_json.get('image'))
+            if image != '':
+                recipe_json['image'] = image
+
             # Ingredients
             recipe_json['ingredient_groups'] = []
             ingredient_groups = json_clean_value(source_json, "ingredientGroups")
             for group in ingredient_groups:
-                group_json = json.loads('{"title":"","ingredients":[]}')
+                group_json = {'title': '', 'ingredients': [], 'ingredients_parsed': []}
                 if len(ingredient_groups) > 1:
                     group_json['title'] = json_clean_value(group['fields'], 'title')
                 ingredients = json_clean_value(group['fields'], "recipeIngredientItems")
                 for ingredient in ingredients:
                     qty  = json_clean_value(ingredient['fields'], "qty")
                     unit  = json_clean_value(ingredient['fields'], "preText")
-                    item  = json_clean_value(json_clean_value(ingredient['fields'], "ingredient", json.loads('{"fields": ""}'))['fields'], 'title')
+                    item  = json_clean_value(json_clean_value(ingredient['fields'], "ingredient", {'fields': ''})['fields'], 'title')
                     modifier  = json_clean_value(ingredient['fields'], "postText")
                     group_json['ingredients'].append(strip_tags("%s %s %s%s" % (qty, unit, item, modifier), strip_newline = True))
+                    group_json['ingredients_parsed'].append({
+                        'quantity': normalize_quantity(strip_tags(qty)),
+                        'unit': canonical_unit(strip_tags(unit)),
+                        'size': '',
+                        'item': strip_tags(item),
+                        'modifier': strip_tags(modifier).lstrip(', '),
+                    })
                 recipe_json['ingredient_groups'].append(group_json)
 
             # Directions
             recipe_json['direction_groups'] = []
-            group_json = json.loads('{"group":"","directions":[]}')
+            group_json = {'group': '', 'directions': []}
             steps = json_clean_value(source_json, "instructions")
             for step in steps:
                 group_json['directions'].append(strip_tags(json_clean_value(step['fields'], "content"), strip_newline = True))
@@ -288,116 +367,58 @@ def url2recipe_json(args, url):
 
         return recipe_json
 
-    def saveur2json(args, url):
-        """ Loads Saveur URL and builds recipe JSON """
-
-        print_debug("Using Saveur scraper...")
-        recipe_json={}
-        recipe_json['url'] = url
-
-        page = BeautifulSoup(requests.get(url).text.replace("\u2014"," "), 'html5lib')
-
-        recipe_json['title'] = page.select_one('.entry-title').text
-        #recipe_json['description'] = page.select_one('p.paragraph:first-child').text
-        recipe_json['description'] = page.find("div", {'property':'description'}).text
-        recipe_json['yield'] = page.select_one('div.yield span').text
-
-        # Parse Times
-        minutes_prep = 0
-        minutes_cook = iso8601.to_minutes(page.select_one('div.cook-time meta')['content'])
-        minutes_total = minutes_prep + minutes_cook
-        if minutes_prep == 0 and minutes_total > 0 and minutes_cook > 0:
-            minutes_prep = minutes_total - minutes_cook
-        recipe_json['preptime'] = minutes2time(minutes_prep, '')
-        recipe_json['cooktime'] = minutes2time(minutes_cook, '')
-        recipe_json['totaltime'] = minutes2time(minutes_total)
-
-        recipe_json['author'] = url2publisher(url)
-
-        # Ingredients
-        recipe_json['ingredient_groups'] = []
-        recipe_json['ingredient_groups'].append(json.loads('{"title":"","ingredients":[]}'))
-        for ingredient in page.find_all("li", class_="ingredient"):
-            recipe_json['ingredient_groups'][0]['ingredients'].append(ingredient.text.replace("\n","").strip())
+    def site2json(site, args, url, page_html):
+        """ Builds recipe JSON from a page of a site with a site definition """
 
-        # Directions
-        out_instruction=[]
-        for instruction in page.find_all("li", class_="instruction"):
-            try:
-                instruction_json = instruction
-                out_instruction.append(instruction_json['text'].text.replace("\n","").strip())
-            except:
-                out_instruction.append(instruction.text.replace("\n","").strip())
-        recipe_json['direction_groups'] = []
-        recipe_json['direction_groups'].append(json.loads('{"group":"","directions":[]}'))
-        recipe_json['direction_groups'][0]['directions'] = out_instruction
-        #raise UrlError(url, 'URL not supported.')
-        return recipe_json
+        print_debug("Using %s site definition..." % site.name)
+        with profile_stage('scraper:' + site.name):
+            values = site.extract(page_html)
 
-    def stcg2json(args, url):
-        """ Loads Saveur URL and builds recipe JSON """
+        if values.get('title', '') == '':
+            raise UrlError(url, 'No title found with the %s site definition.' % site.name)
 
-        print_debug("Using Sam the Cooking Guy scraper...")
         recipe_json={}
         recipe_json['url'] = url
-
-        page = BeautifulSoup(requests.get(url).text.replace("\u2014"," "), 'html5lib')
-
-        title = page.select_one('title').text
-        recipe_json['title'] = re.sub('. SAM THE COOKING GUY', '', title)
-        recipe_json['yield'] = page.select_one('div.sqs-block-content p').text
-        if page.select('div.sqs-block-content p')[1]:
-            recipe_json['description'] = page.select('div.sqs-block-content p')[1].text
+        recipe_json['title'] = values['title']
+        recipe_json['description'] = values.get('description', '')
+        recipe_json['yield'] = values.get('yield', '')
+        if values.get('image', '') != '':
+            recipe_json['image'] = values['image']
 
         # Parse Times
-        minutes_prep = 0
-        minutes_cook = 0
-        #minutes_cook = iso8601.to_minutes(page.select_one('div.cook-time meta')['content'])
-        minutes_total = minutes_prep + minutes_cook
-        if minutes_prep == 0 and minutes_total > 0 and minutes_cook > 0:
-            minutes_prep = minutes_total - minutes_cook
-        # recipe_json['preptime'] = minutes2time(minutes_prep, '')
-        # recipe_json['cooktime'] = minutes2time(minutes_cook, '')
-        # recipe_json['totaltime'] = minutes2time(minutes_total)
-
-        recipe_json['author'] = url2publisher(url)
+        if any(field in site.selectors for field in TIME_FIELDS):
+            minutes_prep = iso8601.to_minutes(values.get('preptime', ''))
+            minutes_cook = iso8601.to_minutes(values.get('cooktime', ''))
+            minutes_total = iso8601.to_minutes(values.get('totaltime', ''))
+            if minutes_prep == 0 and minutes_total > 0 and minutes_cook > 0:
+                minutes_prep = minutes_total - minutes_cook
+            if minutes_total == 0 and (minutes_prep > 0 or minutes_cook > 0):
+                minutes_total = minutes_prep + minutes_cook
+            recipe_json['preptime'] = minutes2time(minutes_prep, '')
+            recipe_json['cooktime'] = minutes2time(minutes_cook, '')
+            recipe_json['totaltime'] = minutes2time(minutes_total)
+
+        recipe_json['author'] = values.get('author', url2publisher(url))
 
         # Ingredients
         recipe_json['ingredient_groups'] = []
-        recipe_json['ingredient_groups'].append(json.loads('{"title":"","ingredients":[]}'))
-        ingredients = page.select_one('div.sqs-block div.sqs-block-content').find_all('p', attrs={'class': None, 'style': 'white-space:pre-wrap'})
-        ingredients = page.select('div.sqs-layout div.row div.sqs-block div.sqs-block-content p')
-        if not ingredients:
-            ingredients = page.select_one('div.sqs-block-content ul').find_all('li', attrs={'class': None})
-        for ingredient in ingredients:
-            recipe_json['ingredient_groups'][0]['ingredients'].append(ingredient.text.replace("\n","").strip())
+        recipe_json['ingredient_groups'].append({'title': '', 'ingredients': values.get('ingredients', [])})
 
         # Directions
-        out_instruction=[]
-        instructions = page.select_one('div.sqs-block-content ul').find_all('li', attrs={'class': None})
-        if not instructions:
-            instructions = page.select_one('div.sqs-block-content').find('ul', attrs={'data-rte-list': 'default'}).find_all('li', attrs={'class': None})
-        for instruction in instructions:
-            try:
-                instruction_json = instruction
-                out_instruction.append(instruction_json['text'].text.replace("\n","").strip())
-            except:
-                out_instruction.append(instruction.text.replace("\n","").strip())
         recipe_json['direction_groups'] = []
-        recipe_json['direction_groups'].append(json.loads('{"group":"","directions":[]}'))
-        recipe_json['direction_groups'][0]['directions'] = out_instruction
+        recipe_json['direction_groups'].append({'group': '', 'directions': values.get('directions', [])})
 
         return recipe_json
 
-    def epicurious2json(args, url):
-        """ Loads Epicurious URL and builds recipe JSON """
+    @profiled_stage('scraper:epicurious')
+    def epicurious2json(args, url, page_html):
+        """ Builds recipe JSON from an Epicurious page """
 
-        def get_json(args, url):
+        def get_json(page_html):
             """ Find and load "standardized" json document containing recipe """
             return_value = None
-            page = requests.get(url)
-
-            page = BeautifulSoup(requests.get(url).text, 'html5lib')
+            with profile_stage('parse:html5lib'):
+                page = BeautifulSoup(page_html, 'html5lib')
             scripts = page.findAll('script')
             for script in scripts:
                 match = re.search(r'root\.__INITIAL_STATE__\.store', script.text)
@@ -409,21 +430,22 @@ def url2recipe_json(args, url):
                             raw_json_text = re.sub('^[^{]*', '', raw_json_text)
                             raw_json_text = re.sub('"email":{"regExp":.*,"password"', '"email":{"regExp":"","password"', raw_json_text)
                             raw_json_text = re.sub('"password":{"regExp":.*,"messages"', '"password":{"regExp":""},"messages"', raw_json_text)
-                            raw_json = json.loads(raw_json_text)
-                            return_value = json_clean_value(raw_json, 'content', json.loads('{}'))
+                            raw_json = JsonCodec.loads(raw_json_text)
+                            return_value = json_clean_value(raw_json, 'content', {})
                             #print_debug(json.dumps(return_value, indent=4))
+            page.decompose()
             return return_value
 
         print_debug("Using Epicurious scraper...")
         recipe_json={}
         recipe_json['url'] = url
 
-        source_json = get_json(args, url)
+        source_json = get_json(page_html)
 
         if not source_json is None:
             recipe_json['title'] = json_clean_value(source_json, 'hed')
             recipe_json['description'] = strip_tags(json_clean_value(source_json, 'dek'))
-            recipe_json['yield'] = json_clean_value(json_clean_value(source_json, 'servingSizeInfo',json.loads('{}')), 'servingSizeDescription')
+            recipe_json['yield'] = json_clean_value(json_clean_value(source_json, 'servingSizeInfo',{}), 'servingSizeDescription')
 
             # Parse Times
             minutes_prep = iso8601.to_minutes(json_clean_value(source_json, 'formattedPrepTime'))
@@ -455,7 +477,7 @@ def url2recipe_json(args, url):
             recipe_json['ingredient_groups'] = []
             ingredient_groups = json_clean_value(source_json, "ingredientGroups")
             for group in ingredient_groups:
-                group_json = json.loads('{"title":"","ingredients":[]}')
+                group_json = {'title': '', 'ingredients': []}
                 if len(ingredient_groups) > 1:
                     group_json['title'] = json_clean_value(group_json, "hed")
                 ingredients = json_clean_value(group, "ingredients")
@@ -467,7 +489,7 @@ def url2recipe_json(args, url):
             recipe_json['direction_groups'] = []
             direction_groups = json_clean_value(source_json, "preparationGroups")
             for group in direction_groups:
-                group_json = json.loads('{"group":"","directions":[]}')
+                group_json = {'group': '', 'directions': []}
                 if len(direction_groups) > 1:
                     group_json['group'] = strip_tags(json_clean_value(group_json, "hed"))
                 steps = json_clean_value(group, "steps")
@@ -480,8 +502,16 @@ def url2recipe_json(args, url):
 
         return recipe_json
 
-    def recipe_scraper2json(args, url):
-        from recipe_scrapers import scrape_me
+    @profiled_stage('scraper:recipe-scrapers')
+    def recipe_scraper2json(args, url, page_html):
+        """ Builds recipe JSON from a page using the recipe-scrapers module """
+
+        try:
+            from recipe_scrapers import scrape_html
+        except ImportError:
+            # recipe-scrapers before v14 can only fetch the page itself
+            from recipe_scrapers import scrape_me
+            scrape_html = None
 
         print_debug("Using recipe-scraper module...")
 
@@ -489,7 +519,11 @@ def url2recipe_json(args, url):
         recipe_json['url'] = url
 
         try:
-            scraper = scrape_me(url)
+            if scrape_html is None:
+                with profile_stage('fetch'):
+                    scraper = scrape_me(url)
+            else:
+                scraper = scrape_html(page_html, org_url=url)
 
             recipe_json['title'] = scraper.title()
             recipe_json['description'] = ''
@@ -497,87 +531,89 @@ def url2recipe_json(args, url):
             recipe_json['preptime'] = ''
             recipe_json['cooktime'] = ''
             recipe_json['totaltime'] = minutes2time(scraper.total_time())
+            try:
+                image = image_url(scraper.image())
+            except Exception:
+                image = ''
+            if image != '':
+                recipe_json['image'] = image
             recipe_json['ingredient_groups'] = []
-            recipe_json['ingredient_groups'].append(json.loads('{"title":"","ingredients":[]}'))
+            recipe_json['ingredient_groups'].append({'title': '', 'ingredients': []})
             recipe_json['ingredient_groups'][0]['ingredients'] = scraper.ingredients()
             recipe_json['direction_groups'] = []
-            recipe_json['direction_groups'].append(json.loads('{"group":"","directions":[]}'))
+            recipe_json['direction_groups'].append({'group': '', 'directions': []})
             instructions = scraper.instructions().split('\n')
             recipe_json['direction_groups'][0]['directions'] = instructions
 
-        except:
+        except Exception as err:
+            if type(err).__name__ == 'WebsiteNotImplementedError':
+                raise UnsupportedError(url, 'URL not supported.')
             raise UrlError(url, 'URL not supported.')
 
         return recipe_json
 
-    def generic2json(args, url):
-        """ Loads generic URL and builds recipe JSON """
+    @profiled_stage('scraper:generic')
+    def generic2json(args, url, page_html):
+        """ Builds recipe JSON from the application/ld+json of a page """
 
-        def get_json(url):
+        def get_json(page_html, url):
             """ Find and load "standardized" json document containing recipe """
 
             return_value = None
 
-            user_agent = {'User-agent': 'Mozilla/5.0'}
-            page = requests.get(url, headers = user_agent)
-
-            match = re.search(r'<script[^>]*type=.?application/ld\+json.?[^>]*>', page.text)
-            if match:
+            for script in _LD_JSON_SCRIPT_RE.finditer(page_html):
                 print_debug("Found an occurance of 'application/ld+json'")
-                soup = BeautifulSoup(page.text, 'html5lib')
-                scripts = soup.findAll('script', attrs = {'type':'application/ld+json'})
-                for script in scripts:
-                    json_stripped=re.sub('^[^\{\[]*', '', script.text)
-                    raw_json = json.loads(json_stripped)
-                    if type(raw_json) == list:
-                        return_value = json_find_array_element(raw_json, '@type', 'Recipe')
-                        try:
-                            return_value['publisher'] = json_clean_value(json_clean_value(source_json, 'publisher', json.loads('{}'), 'name', ''))
-                            if return_value['publisher'] == '':
-                                return_value['publisher'] = json_clean_value(json_find_array_element(raw_json, '@type', 'Organization'), 'name', url2publisher(url))
-                        except:
-                            if not return_value is None:
-                                return_value['publisher'] = url2publisher(url)
-                    elif '@graph' in raw_json and type(raw_json['@graph']) == list:
-                        return_value = json_find_array_element(raw_json['@graph'], '@type', 'Recipe')
+                json_stripped=re.sub('^[^\{\[]*', '', script.group(1))
+                raw_json = JsonCodec.loads(json_stripped)
+                if type(raw_json) == list:
+                    return_value = json_find_array_element(raw_json, '@type', 'Recipe')
+                    try:
+                        return_value['publisher'] = json_clean_value(json_clean_value(source_json, 'publisher', {}, 'name', ''))
+                        if return_value['publisher'] == '':
+                            return_value['publisher'] = json_clean_value(json_find_array_element(raw_json, '@type', 'Organization'), 'name', url2publisher(url))
+                    except:
+                        if not return_value is None:
+                            return_value['publisher'] = url2publisher(url)
+                elif '@graph' in raw_json and type(raw_json['@graph']) == list:
+                    return_value = json_find_array_element(raw_json['@graph'], '@type', 'Recipe')
+                    try:
+                        return_value['publisher'] = json_clean_value(json_clean_value(source_json, 'publisher', {}, 'name', ''))
+                        if return_value['publisher'] == '':
+                            return_value['publisher'] = json_clean_value(json_find_array_element(raw_json['@graph'], '@type', 'Organization'), 'name', url2publisher(url))
+                    except:
+                        if not return_value is None:
+                            return_value['publisher']=url2publisher(url)
+                else:
+                    if return_value is None:
                         try:
-                            return_value['publisher'] = json_clean_value(json_clean_value(source_json, 'publisher', json.loads('{}'), 'name', ''))
-                            if return_value['publisher'] == '':
-                                return_value['publisher'] = json_clean_value(json_find_array_element(raw_json['@graph'], '@type', 'Organization'), 'name', url2publisher(url))
-                        except:
-                            if not return_value is None:
-                                return_value['publisher']=url2publisher(url)
-                    else:
-                        if return_value is None:
-                            try:
-                                if raw_json['@type'] == 'Recipe' and 'recipeIngredient' in raw_json:
-                                    return_value = raw_json
-                                else:
-                                    return_value = None
-                            except:
+                            if raw_json['@type'] == 'Recipe' and 'recipeIngredient' in raw_json:
+                                return_value = raw_json
+                            else:
                                 return_value = None
-                        try:
-                            return_value['publisher'] = json_clean_value(json_clean_value(source_json, 'publisher', json.loads('{}')), 'name', url2publisher(url))
                         except:
-                            if not return_value is None:
-                                return_value['publisher']=url2publisher(url)
+                            return_value = None
+                    try:
+                        return_value['publisher'] = json_clean_value(json_clean_value(source_json, 'publisher', {}), 'name', url2publisher(url))
+                    except:
+                        if not return_value is None:
+                            return_value['publisher']=url2publisher(url)
 
-                    if (not return_value is None) and ('recipeIngredient' in return_value):
-                        pass
-                    else:
-                        return_value = None
+                if (not return_value is None) and ('recipeIngredient' in return_value):
+                    pass
+                else:
+                    return_value = None
             return return_value
 
         print_debug("Using generic scraper...")
         recipe_json={}
         recipe_json['url'] = url
-        source_json = get_json(url)
+        source_json = get_json(page_html, url)
 
         if source_json is None:
-            print_info("No application+ld json attempting to use recipe-scrapers...")
-            recipe_json = recipe_scraper2json(args, url)
+            raise UrlError(url, 'No application+ld json found.')
         else:
-            print_debug(json.dumps(source_json))
+            if args.debug:
+                print_debug(JsonCodec.dumps(source_json))
 
             recipe_json['title'] = json_clean_value(source_json, 'headline', json_clean_value(source_json, 'name'))
             recipe_json['description'] = json_clean_value(source_json, 'description')
@@ -614,10 +650,14 @@ def url2recipe_json(args, url):
                         author = publisher + ' (' + author + ')'
             recipe_json['author'] = author
 
+            image = image_url(json_clean_value(source_json, 'image'))
+            if image != '':
+                recipe_json['image'] = image
+
             # Ingredients
             ingredients = list(json_find_key(source_json, "recipeIngredient"))[0]
             recipe_json['ingredient_groups'] = []
-            recipe_json['ingredient_groups'].append(json.loads('{"title":"","ingredients":[]}'))
+            recipe_json['ingredient_groups'].append({'title': '', 'ingredients': []})
             out_ingredients = []
             for ingredient in ingredients:
                 out_ingredients.append(strip_tags(ingredient))
@@ -630,7 +670,8 @@ def url2recipe_json(args, url):
                 instructions=list(json_find_key(source_json, 'itemListElement'))[0]
             except IndexError:
                 instructions=instructionsSection
-            print_debug(str(instructions))
+            if args.debug:
+                print_debug(str(instructions))
             if str(instructions)[0] == '[':
 
                 for instruction in instructions:
@@ -643,38 +684,98 @@ def url2recipe_json(args, url):
                 out_instruction.append(strip_tags(str(instructions)))
 
             recipe_json['direction_groups'] = []
-            recipe_json['direction_groups'].append(json.loads('{"group":"","directions":[]}'))
+            recipe_json['direction_groups'].append({'group': '', 'directions': []})
             recipe_json['direction_groups'][0]['directions'] = out_instruction
 
         return recipe_json
 
-    custom_print_init (quiet=args.quiet, debug=args.debug)
+    def strategies2json(args, url, strategies):
+        """ Fetches the page once and hands it to each strategy in turn,
+            starting with the strategy that last succeeded for the domain
+            (unless --force-recipe-scraper put recipe-scrapers first)
+        """
+
+        domain = url2domain(url)
+        if not args.force_recipe_scraper:
+            preferred = _domain_strategies.get(domain)
+            strategies = sorted(strategies, key=lambda strategy: strategy[0] != preferred)
+
+        fetch_state = None
+        headers = None
+        if args.incremental:
+            store = open_store(args.store)
+            fetch_state = store.get_fetch_state(url)
+            # Pages are only skipped once their recipe was output with the
+            # same output options
+            if not fetch_state is None and (fetch_state['recipe_hash'] is None or fetch_state['output_key'] != output_key(args)):
+                fetch_state = None
+            if not fetch_state is None:
+                headers = {}
+                if fetch_state['etag']:
+                    headers['If-None-Match'] = fetch_state['etag']
+                if fetch_state['last_modified']:
+                    headers['If-Modified-Since'] = fetch_state['last_modified']
+
+        response = fetch(url, headers=headers)
+        if response.status_code == 304:
+            raise NotModifiedError(url, 'Page not modified.')
+        if response.status_code >= 500 or response.status_code == 429:
+            # A network error (requests.HTTPError), counted against the site
+            response.raise_for_status()
+        if response.status_code >= 400:
+            raise UnsupportedError(url, 'HTTP status %d.' % response.status_code)
+
+        body_hash = None
+        if args.incremental:
+            body_hash = hashlib.sha256(response.content).hexdigest()
+            if not fetch_state is None and fetch_state['body_hash'] == body_hash:
+                raise NotModifiedError(url, 'Page content unchanged.')
+        page_html = response.text
+
+        last_error = None
+        for index, (name, strategy) in enumerate(strategies):
+            if index > 0:
+                print_info("Attempting to use %s scraper..." % name)
+            try:
+                recipe_json = strategy(args, url, page_html)
+            except Exception as err:
+                print_debug("%s scraper failed: %s" % (name, err))
+                # A strategy that failed to extract the recipe says more
+                # than one that does not support the site
+                if last_error is None or not isinstance(err, UnsupportedError):
+                    last_error = err
+            else:
+                _domain_strategies[domain] = name
+                if args.incremental:
+                    store.save_fetch_state(url, response.headers.get('ETag'), response.headers.get('Last-Modified'), body_hash)
+                return recipe_json
+
+        raise last_error
 
     print_info ("Processsing %s..." % (url))
 
-    # Branch based on domain
-    domain = url2domain(url)
-    print_debug ("Branching based on domain (%s)..." % domain)
-    if domain in [ 'www.americastestkitchen.com','www.cookscountry.com','www.cooksillustrated.com' ]:
-        recipe_json = ci2json(args, url)
-    elif domain == 'www.epicurious.com':
-        if args.force_recipe_scraper:
-            try:
-                recipe_json = recipe_scraper2json(args, url)
-            except:
-                recipe_json = epicurious2json(args, url)
-        else:
-            recipe_json = epicurious2json(args, url)
-    elif domain == 'www.saveur.com':
-        recipe_json = saveur2json(args, url)
-    elif domain == 'www.thecookingguy.com':
-        recipe_json = stcg2json(args, url)
-    else:
-        if args.force_recipe_scraper:
-            try:
-                recipe_json = recipe_scraper2json(args, url)
-            except:
-                recipe_json = generic2json(args, url)
+    # Sites that keep failing and URLs that failed recently are skipped
+    store = None if args.store is None else open_store(args.store)
+    with failure_guard(url, store, args.retry_failed):
+        # Branch based on domain
+        domain = url2domain(url)
+        print_debug ("Branching based on domain (%s)..." % domain)
+        if domain in [ 'www.americastestkitchen.com','www.cookscountry.com','www.cooksillustrated.com' ]:
+            recipe_json = ci2json(args, url)
         else:
-            recipe_json = generic2json(args, url)
+            site = site_definition(domain)
+            if domain == 'www.epicurious.com':
+                strategies = [('epicurious', epicurious2json)]
+            elif not site is None:
+                strategies = [(site.name, functools.partial(site2json, site))]
+            else:
+                strategies = [('generic', generic2json), ('recipe-scrapers', recipe_scraper2json)]
+
+            if args.force_recipe_scraper:
+                strategies = [('recipe-scrapers', recipe_scraper2json)] + [strategy for strategy in strategies if strategy[0] != 'recipe-scrapers']
+
+            recipe_json = strategies2json(args, url, strategies)
+
+    with profile_stage('parse:ingredients'):
+        add_parsed_ingredients(recipe_json)
     return recipe_json
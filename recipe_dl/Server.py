@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import argparse
+
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, as_completed, wait
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from . import JsonCodec
+
+from .RecipeLog import print_info, print_debug, print_error
+
+from .Scrapers import url2recipe_json
+from .RecipeOutput import recipe_json2text
+from .RecipeConversion import convert_recipe, positive_fraction
+from .RecipeStore import open_store
+from .Scheduler import interleave_by_domain
+from .UrlInput import unique_urls
+
+from .CustomExceptions import UrlError, NotModifiedError, SkippedError
+
+FORMATS = ('json', 'md', 'rst')
+UNITS = ('metric', 'us')
+
+class RequestError(Exception):
+    """ A request the server can not process (sent back as 400) """
+    pass
+
+class RecipeServer(ThreadingHTTPServer):
+    """ HTTP server keeping the fetch session, caches and worker threads warm
+        between requests
+    """
+
+    daemon_threads = True
+
+    def __init__(self, args, address):
+        ThreadingHTTPServer.__init__(self, address, RecipeRequestHandler)
+        self.args = args
+        self.executor = ThreadPoolExecutor(max_workers=max(1, args.jobs))
+
+    def request_args(self, request):
+        """ Returns a copy of the server args with the per-request options
+            (scale, units, force_recipe_scraper) applied
+        """
+
+        args = argparse.Namespace(**vars(self.args))
+        args.output_json = args.output_md = args.output_rst = False
+        args.save_to_file = False
+        if 'scale' in request:
+            try:
+                args.scale = positive_fraction(request['scale'])
+            except argparse.ArgumentTypeError as err:
+                raise RequestError('Invalid scale: %s.' % err)
+        if 'units' in request:
+            if not request['units'] in UNITS:
+                raise RequestError('units must be one of %s.' % ', '.join(UNITS))
+            args.units = request['units']
+        if 'force_recipe_scraper' in request:
+            args.force_recipe_scraper = bool(request['force_recipe_scraper'])
+        return args
+
+    def process(self, args, url, formats):
+        """ Scrapes url and returns the response record for it """
+
+        try:
+            recipe_json = url2recipe_json(args, url)
+        except NotModifiedError as err:
+            return {'url': url, 'status': 'not_modified', 'message': err.message}
+        except UrlError as err:
+            return {'url': url, 'status': 'unsupported', 'error': err.message}
+        except SkippedError as err:
+            return {'url': url, 'status': 'skipped', 'error': err.message}
+        except Exception as err:
+            print_error ("%s: %s" % (url, getattr(err, 'message', err)))
+            return {'url': url, 'status': 'error', 'error': '%s: %s' % (type(err).__name__, getattr(err, 'message', err))}
+
+        if not args.store is None:
+            open_store(args.store).save(recipe_json)
+
+        output_json = convert_recipe(recipe_json, args.scale, args.units)
+        record = {'url': url, 'status': 'ok', 'recipe': output_json}
+        for format in formats:
+            if format != 'json':
+                record[format] = recipe_json2text(args, output_json, format)
+        return record
+
+class RecipeRequestHandler(BaseHTTPRequestHandler):
+    """ JSON API:
+
+        GET  /health  -> {"status": "ok"}
+        POST /recipe  {"url": URL, "formats": [...], "scale": ..., "units": ...}
+                      -> one result record
+        POST /batch   {"urls": [URL, ...], ...same options...}
+                      -> newline delimited result records, streamed as each
+                         URL completes
+    """
+
+    server_version = 'recipe-dl'
+
+    def log_message(self, format, *args):
+        print_debug ("%s - %s" % (self.address_string(), format % args))
+
+    def send_json(self, status, document):
+        body = (JsonCodec.dumps(document) + '\n').encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_request(self):
+        length = self.headers.get('Content-Length') or '0'
+        if not length.isdigit():
+            # Where the body ends is unknown, so is the next request
+            self.close_connection = True
+            raise RequestError('Invalid Content-Length %r.' % length)
+        length = int(length)
+        try:
+            request = JsonCodec.loads(self.rfile.read(length))
+        except ValueError as err:
+            raise RequestError('Invalid JSON: %s' % err)
+        if not isinstance(request, dict):
+            raise RequestError('Request must be a JSON object.')
+
+        formats = request.get('formats', [])
+        if isinstance(formats, str):
+            formats = [formats]
+        for format in formats:
+            if not format in FORMATS:
+                raise RequestError('formats must be from %s.' % ', '.join(FORMATS))
+        return request, formats
+
+    def do_GET(self):
+        if self.path == '/health':
+            self.send_json(200, {'status': 'ok'})
+        else:
+            self.send_json(404, {'error': 'Not found.'})
+
+    def do_POST(self):
+        try:
+            if self.path == '/recipe':
+                self.post_recipe()
+            elif self.path == '/batch':
+                self.post_batch()
+            else:
+                self.send_json(404, {'error': 'Not found.'})
+        except RequestError as err:
+            self.send_json(400, {'error': str(err)})
+
+    def post_recipe(self):
+        request, formats = self.read_request()
+        if not isinstance(request.get('url'), str):
+            raise RequestError('url is required.')
+        args = self.server.request_args(request)
+
+        record = self.server.executor.submit(self.server.process, args, request['url'], formats).result()
+        self.send_json(200 if record['status'] in ('ok', 'not_modified') else 422, record)
+
+    def post_batch(self):
+        request, formats = self.read_request()
+        urls = request.get('urls')
+        if not isinstance(urls, list) or not all(isinstance(url, str) for url in urls):
+            raise RequestError('urls must be a list of URLs.')
+        args = self.server.request_args(request)
+
+        # Records are streamed as they complete, the end of the response is
+        # marked by closing the connection
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+
+        executor = self.server.executor
+        jobs = max(1, args.jobs)
+        pending = set()
+        for url in interleave_by_domain(unique_urls(urls)):
+            pending.add(executor.submit(self.server.process, args, url, formats))
+            if len(pending) >= jobs * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    self.write_record(future.result())
+        for future in as_completed(pending):
+            self.write_record(future.result())
+
+    def write_record(self, record):
+        self.wfile.write((JsonCodec.dumps(record) + '\n').encode('utf-8'))
+        self.wfile.flush()
+
+def serve(args):
+    """ Runs the server until interrupted """
+
+    server = RecipeServer(args, (args.host, args.port))
+    print_info ("Serving on http://%s:%d/" % server.server_address[:2])
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.executor.shutdown()
@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import re
+import threading
+
+from lxml import etree, html
+
+from . import JsonCodec
+
+# cssselect is optional, only needed for "css" selectors
+try:
+    from lxml.cssselect import CSSSelector
+except ImportError:
+    CSSSelector = None
+
+# Fields holding one value, the text of the first match
+TEXT_FIELDS = ('title', 'description', 'yield', 'image', 'author')
+# Fields holding ISO 8601 durations
+TIME_FIELDS = ('preptime', 'cooktime', 'totaltime')
+# Fields holding the text of every match
+LIST_FIELDS = ('ingredients', 'directions')
+
+FIELDS = TEXT_FIELDS + TIME_FIELDS + LIST_FIELDS
+
+# Image used when a definition has no image selector
+OG_IMAGE = '//meta[@property="og:image"]/@content'
+
+def has_class(name):
+    """ XPath condition matching elements with the class name """
+
+    return "contains(concat(' ', normalize-space(@class), ' '), ' %s ')" % name
+
+# Site definitions by domain.  Each field is a selector or a list of
+# selectors tried in turn until one matches.  A selector is an XPath
+# expression string or a dict with "xpath" or "css" (needs cssselect) and
+# optionally "replace": [pattern, replacement] applied to the text.
+# Attribute values are selected with XPath (.../@content).
+SITE_DEFINITIONS = {
+    'www.saveur.com': {
+        'name': 'saveur',
+        'title': '//*[%s]' % has_class('entry-title'),
+        'description': '//div[@property="description"]',
+        'yield': '//div[%s]//span' % has_class('yield'),
+        'cooktime': '//div[%s]//meta/@content' % has_class('cook-time'),
+        'ingredients': '//li[%s]' % has_class('ingredient'),
+        'directions': '//li[%s]' % has_class('instruction'),
+    },
+    'www.thecookingguy.com': {
+        'name': 'thecookingguy',
+        'title': {'xpath': '//title', 'replace': ['. SAM THE COOKING GUY', '']},
+        'yield': '(//div[%s]//p)[1]' % has_class('sqs-block-content'),
+        'description': '(//div[%s]//p)[2]' % has_class('sqs-block-content'),
+        'ingredients': [
+            '//div[%s]//div[%s]//div[%s]//div[%s]//p' % (has_class('sqs-layout'), has_class('row'), has_class('sqs-block'), has_class('sqs-block-content')),
+            '(//div[%s]//ul)[1]//li[not(@class)]' % has_class('sqs-block-content'),
+        ],
+        'directions': [
+            '(//div[%s]//ul)[1]//li[not(@class)]' % has_class('sqs-block-content'),
+            '((//div[%s])[1]//ul[@data-rte-list="default"])[1]//li[not(@class)]' % has_class('sqs-block-content'),
+        ],
+    },
+}
+
+_lock = threading.Lock()
+_compiled = {}
+
+class Selector:
+    """ Compiled XPath (or CSS) selector returning the text of its matches """
+
+    def __init__(self, spec):
+        if isinstance(spec, str):
+            spec = {'xpath': spec}
+        if not isinstance(spec, dict) or not ('xpath' in spec or 'css' in spec):
+            raise ValueError("Selector %r needs an 'xpath' or 'css' expression" % (spec,))
+        if not isinstance(spec.get('xpath', spec.get('css')), str):
+            raise ValueError("Selector %r expression is not a string" % (spec,))
+        if 'css' in spec:
+            if CSSSelector is None:
+                raise ValueError("cssselect is not installed, use 'xpath' for selector %s" % spec['css'])
+            self.evaluate = CSSSelector(spec['css'], translator='html')
+        else:
+            self.evaluate = etree.XPath(spec['xpath'])
+        self.replace = None
+        if 'replace' in spec:
+            replace = spec['replace']
+            if not isinstance(replace, list) or len(replace) != 2 or not all(isinstance(part, str) for part in replace):
+                raise ValueError("Selector %r replace is not a [pattern, replacement] list" % (spec,))
+            try:
+                self.replace = (re.compile(replace[0]), replace[1])
+            except re.error as err:
+                raise ValueError("Selector %r replace pattern: %s" % (spec, err))
+
+    def texts(self, tree):
+        """ Returns the text of every match in tree """
+
+        texts = []
+        for match in self.evaluate(tree):
+            text = match if isinstance(match, str) else match.text_content()
+            text = text.replace("\u2014", " ").replace("\n", "")
+            if not self.replace is None:
+                text = self.replace[0].sub(self.replace[1], text)
+            text = text.strip()
+            if text != '':
+                texts.append(text)
+        return texts
+
+class SiteDefinition:
+    """ Site definition with its selectors compiled """
+
+    def __init__(self, domain, definition):
+        if not isinstance(definition, dict):
+            raise ValueError("The site definition of %s is not an object" % domain)
+        self.domain = domain
+        self.name = definition.get('name', domain)
+        self.selectors = {}
+        for field, specs in definition.items():
+            if field == 'name':
+                continue
+            if not field in FIELDS:
+                raise ValueError("Unknown field '%s' in the site definition of %s" % (field, domain))
+            if not isinstance(specs, list):
+                specs = [specs]
+            self.selectors[field] = [Selector(spec) for spec in specs]
+        if not 'image' in self.selectors:
+            self.selectors['image'] = [Selector(OG_IMAGE)]
+
+    def extract(self, page_html):
+        """ Returns {field: text} for the text fields and time fields and
+            {field: [text, ...]} for the list fields found in page_html
+        """
+
+        try:
+            tree = html.document_fromstring(page_html)
+        except ValueError:
+            # lxml refuses str documents with an XML encoding declaration
+            tree = html.document_fromstring(page_html.encode('utf-8'))
+
+        values = {}
+        for field, selectors in self.selectors.items():
+            for selector in selectors:
+                texts = selector.texts(tree)
+                if texts:
+                    values[field] = texts if field in LIST_FIELDS else texts[0]
+                    break
+        return values
+
+def site_definition(domain):
+    """ Returns the compiled SiteDefinition for domain or None.  Definitions
+        are compiled on first use and kept for the life of the process.
+    """
+
+    site = _compiled.get(domain)
+    if site is None and domain in SITE_DEFINITIONS:
+        with _lock:
+            site = _compiled.get(domain)
+            if site is None:
+                site = SiteDefinition(domain, SITE_DEFINITIONS[domain])
+                _compiled[domain] = site
+    return site
+
+def load_site_definitions(filename):
+    """ Adds the site definitions (a JSON object of definitions by domain)
+        in filename, replacing any built in definition of the same domain
+    """
+
+    with open(filename, 'rb') as definitions_file:
+        definitions = JsonCodec.load(definitions_file)
+    if not isinstance(definitions, dict):
+        raise ValueError("Site definitions must be a JSON object of definitions by domain")
+
+    # Compile them all now so mistakes are reported before the run
+    compiled = dict((domain, SiteDefinition(domain, definition)) for domain, definition in definitions.items())
+    with _lock:
+        SITE_DEFINITIONS.update(definitions)
+        _compiled.update(compiled)
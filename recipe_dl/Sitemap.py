@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import argparse
+import gzip
+import re
+
+from lxml import etree
+
+from .RecipeLog import print_info, print_debug, print_warning
+
+from .Fetcher import fetch, fetch_stream
+from .CustomExceptions import UrlError
+from .UtilityFunctions import url2domain
+
+# Path of the recipe pages on each site the scrapers support
+SITE_PATTERNS = {
+    'www.americastestkitchen.com': r'^/recipes/\d+',
+    'www.cookscountry.com': r'^/recipes/\d+',
+    'www.cooksillustrated.com': r'^/recipes/\d+',
+    'www.epicurious.com': r'^/recipes/food/views/',
+    'www.bonappetit.com': r'^/recipe/',
+    'www.foodnetwork.com': r'^/recipes/.+-\d+',
+    'cooking.nytimes.com': r'^/recipes/\d+',
+    'www.food.com': r'^/recipe/.+-\d+',
+    'www.saveur.com': r'(-recipe/?$|^/recipes/[^/]+/?$)',
+    'www.thecookingguy.com': r'^/recipes/.+',
+    'www.thechunkychef.com': r'recipe[^/]*/?$',
+    'www.allrecipes.com': r'^/recipe/\d+',
+}
+
+GZIP_MAGIC = b'\x1f\x8b'
+
+# Parents of the <loc> of the sitemap protocol, whatever its namespace (0.9
+# or none).  The image:loc, video:loc... of its extensions sit in their own
+# elements.
+SITEMAP_ENTRIES = ('url', 'sitemap')
+
+_PATH_RE = re.compile(r'^[a-z][a-z0-9+.-]*://[^/]+(/[^?#]*)?', re.IGNORECASE)
+
+def site_pattern(domain):
+    """ Returns the compiled recipe path pattern for domain or None """
+
+    pattern = SITE_PATTERNS.get(domain)
+    return None if pattern is None else re.compile(pattern)
+
+def path_pattern(text):
+    """ Returns the --pattern regular expression compiled, raising
+        argparse.ArgumentTypeError if it is not a valid one
+    """
+
+    try:
+        return re.compile(text)
+    except re.error as err:
+        raise argparse.ArgumentTypeError("invalid regular expression %r: %s" % (text, err))
+
+def url_path(url):
+    match = _PATH_RE.match(url)
+    return (match.group(1) or '/') if match else url
+
+def robots_sitemaps(domain):
+    """ Returns the sitemaps listed in the site's robots.txt, or the
+        conventional /sitemap.xml when it lists none
+    """
+
+    sitemaps = []
+    try:
+        response = fetch('https://' + domain + '/robots.txt')
+        if response.status_code == 200:
+            for line in response.text.splitlines():
+                name, _, value = line.partition(':')
+                if name.strip().lower() == 'sitemap' and value.strip() != '':
+                    sitemaps.append(value.strip())
+    except Exception as err:
+        print_debug("Unable to read robots.txt of %s: %s" % (domain, err))
+    return sitemaps or ['https://' + domain + '/sitemap.xml']
+
+def sitemap_entries(sitemap_url):
+    """ Yields ('sitemap', url) for each child of a sitemap index and
+        ('url', url) for each page of a sitemap.  The document is parsed as
+        it is downloaded and each entry is dropped once read, so memory does
+        not grow with the size of the sitemap.
+    """
+
+    with fetch_stream(sitemap_url) as stream:
+        if stream.peek(2)[:2] == GZIP_MAGIC:
+            stream = gzip.GzipFile(fileobj=stream)
+
+        for event, element in etree.iterparse(stream, events=('end',), tag='{*}loc', resolve_entities=False, no_network=True):
+            parent = element.getparent()
+            kind = etree.QName(parent).localname
+            if kind in SITEMAP_ENTRIES and element.text:
+                yield kind, element.text.strip()
+            element.clear()
+            while parent.getprevious() is not None:
+                del parent.getparent()[0]
+
+def discover_urls(domain, sitemaps=None, pattern=None, limit=None):
+    """ Yields the recipe URLs of domain found in its sitemaps (or the given
+        sitemaps), following sitemap indexes.  pattern is a regular
+        expression matched against each URL path, by default the site's
+        entry in SITE_PATTERNS.  URLs on other hosts are left out.
+    """
+
+    if pattern is None:
+        pattern = site_pattern(domain)
+        if pattern is None:
+            raise UrlError(domain, 'No recipe URL pattern known for this site.  Use --pattern.')
+    elif isinstance(pattern, str):
+        pattern = re.compile(pattern)
+
+    queue = list(sitemaps or robots_sitemaps(domain))
+    seen = set(queue)
+    count = 0
+    while queue:
+        sitemap_url = queue.pop(0)
+        print_info ("Reading sitemap %s..." % sitemap_url)
+        try:
+            for kind, url in sitemap_entries(sitemap_url):
+                if kind == 'sitemap':
+                    if not url in seen:
+                        seen.add(url)
+                        queue.append(url)
+                elif url2domain(url).lower() != domain.lower():
+                    print_debug ("Skipping %s, not on %s" % (url, domain))
+                elif pattern.search(url_path(url)):
+                    yield url
+                    count += 1
+                    if not limit is None and count >= limit:
+                        return
+        except (UrlError, etree.XMLSyntaxError, OSError) as err:
+            print_warning ("Skipping sitemap %s: %s" % (sitemap_url, getattr(err, 'message', err)))
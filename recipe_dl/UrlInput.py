@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import hashlib
+import sys
+
+from .UtilityFunctions import normalize_url
+
+def read_url_lines(lines):
+    """ Yields the URLs in an iterable of lines, skipping blanks and # comments """
+
+    for line in lines:
+        line = line.strip()
+        if line != '' and not line.startswith('#'):
+            yield line
+
+def read_url_file(filename):
+    """ Lazily yields the URLs in filename ('-' reads stdin) """
+
+    if filename == '-':
+        yield from read_url_lines(sys.stdin)
+    else:
+        with open(filename) as url_file:
+            yield from read_url_lines(url_file)
+
+def read_urls(urls, url_files=None):
+    """ Yields the command line urls followed by the contents of each url
+        file.  A url of '-' reads urls from stdin.
+    """
+
+    for url in urls:
+        if url == '-':
+            yield from read_url_file('-')
+        else:
+            yield url
+    for filename in url_files or []:
+        yield from read_url_file(filename)
+
+def unique_urls(urls):
+    """ Yields urls dropping any whose normalized form was already seen.
+        Only a short digest of each normalized url is kept.
+    """
+
+    seen = set()
+    for url in urls:
+        digest = hashlib.blake2b(normalize_url(url).encode('utf-8'), digest_size=8).digest()
+        if not digest in seen:
+            seen.add(digest)
+            yield url
@@ -3,12 +3,42 @@
 
 import re
 
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+# Fractions written as html entities and unicode characters
+FRACTION_ENTITIES = [
+    ('&frac14;', '1/4'),
+    ('&frac12;', '1/2'),
+    ('&frac34;', '3/4'),
+    ('&frac13;', '1/3'),
+    ('&frac23;', '2/3'),
+]
+UNICODE_FRACTIONS = [
+    (u"¼", u"1/4"),
+    (u"½", u"1/2"),
+    (u"¾", u"3/4"),
+    (u"⅓", u"1/3"),
+    (u"⅔", u"2/3"),
+]
+
 def url2domain(url):
     """ Returns domain portion of URL """
 
     domain = re.sub('/.*$', '', re.sub('[^/]*//', '', url.rstrip()))
     return domain
 
+def normalize_url(url):
+    """ Returns a canonical form of url for duplicate detection """
+
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    netloc = parts.netloc.lower()
+    if (scheme == 'http' and netloc.endswith(':80')) or (scheme == 'https' and netloc.endswith(':443')):
+        netloc = netloc.rsplit(':', 1)[0]
+    path = parts.path.rstrip('/') or '/'
+    query = urlencode([(key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True) if not key.startswith('utm_')])
+    return urlunsplit(('https' if scheme == 'http' else scheme, netloc, path, query, ''))
+
 def url2publisher(url):
     """ Extracts a human readable Publisher name from a URL """
 
@@ -70,16 +100,10 @@ def strip_tags(str, strip_newline = False):
     ret_value = re.sub('\&nbsp\;', ' ', ret_value)
     ret_value = re.sub('\&\#8217\;', '\'', ret_value)
     ret_value = re.sub('\&\#39\;', '\'', ret_value)
-    ret_value = re.sub('\&frac14\;', '1/4', ret_value)
-    ret_value = re.sub('\&frac12\;', '1/2', ret_value)
-    ret_value = re.sub('\&frac34\;', '3/4', ret_value)
-    ret_value = re.sub('\&frac13\;', '1/3', ret_value)
-    ret_value = re.sub('\&frac23\;', '2/3', ret_value)
-    ret_value = ret_value.replace(u"¼", u" 1/4")
-    ret_value = ret_value.replace(u"½", u" 1/2")
-    ret_value = ret_value.replace(u"¾", u" 3/4")
-    ret_value = ret_value.replace(u"⅓", u" 1/3")
-    ret_value = ret_value.replace(u"⅔", u" 2/3")
+    for entity, fraction in FRACTION_ENTITIES:
+        ret_value = ret_value.replace(entity, fraction)
+    for character, fraction in UNICODE_FRACTIONS:
+        ret_value = ret_value.replace(character, u" " + fraction)
     ret_value = ret_value.replace(u"Â", u" ")
     ret_value = re.sub('\r', '', ret_value)
     ret_value = re.sub('\t', ' ', ret_value)
@@ -0,0 +1,4 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from .RecipeApi import RecipeOptions, Recipe, fetch_recipe, render
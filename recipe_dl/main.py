@@ -2,24 +2,56 @@
 # -*- coding: utf-8 -*-
 
 import sys, os
-sys.path.append(os.path.dirname(__file__))
+
+if not __package__:
+    # Run as a script (python recipe_dl/main.py): import the package rather
+    # than its modules from the script's directory
+    package_path = os.path.dirname(os.path.abspath(__file__))
+    sys.path = [os.path.dirname(package_path)] + [path for path in sys.path if os.path.abspath(path) != package_path]
+    import recipe_dl
+    __package__ = 'recipe_dl'
 
 import argparse
+import atexit
+import re
+
+import multiprocessing
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 
 from CustomPrint import custom_print_init, print_info, print_debug, print_error, print_warning
 
-from Scrapers import url2recipe_json
-from RecipeOutput import recipe_output
+from .Scrapers import url2recipe_json
+from .RecipeOutput import recipe_output
+from .Profiler import profile_start, profile_stop, profile_report, profile_stage, profile_thread_start
+from .Fetcher import fetch_init, fetch_close, TRANSPORTS
+from .CircuitBreaker import breaker_init
+from .SiteDefinitions import load_site_definitions
+from .FetchArchive import FetchArchive
+from .Scheduler import interleave_by_domain
+from .Journal import BatchJournal
+from .UrlInput import read_urls, unique_urls
+from .RecipeStore import DEFAULT_STORE, stores_init, open_store, close_stores
+from .Server import serve
+from .OutputWriter import writer_init, writer_close
+from .RecipeConversion import positive_fraction
+from .Archive import archive_init, archive_close
+from .Sitemap import discover_urls, site_pattern, path_pattern
+from .Images import images_init, start_image, images_close
 
-from CustomExceptions import UrlError
+from .CustomExceptions import UrlError, NotModifiedError, SkippedError
+from . import JsonCodec
 
 __version__ = '0.3.1'
 __author__ = u'Rodney Shupe'
 
-def parse_arguments(print_usage = False, detail = False):
-    """ Creates a new argument parser. """
+def parse_arguments(print_usage = False, detail = False, argv = None, crawl = False):
+    """ Creates a new argument parser.  With crawl the parser is for the
+        crawl command, which takes a domain instead of URLs.
+    """
 
-    parser = argparse.ArgumentParser('recipe-dl')
+    parser = argparse.ArgumentParser('recipe-dl crawl' if crawl else 'recipe-dl')
     version = '%(prog)s v' + __version__
     parser.add_argument(
         '--version',
@@ -34,6 +66,13 @@ def parse_arguments(print_usage = False, detail = False):
         default=False,
         help='Force authorization of Cook Illustrated sites',
     )
+    parser.add_argument(
+        '--non-interactive',
+        action="store_false",
+        dest="interactive",
+        default=True,
+        help="Never prompt for Cook's Illustrated credentials, its pages without saved cookies are reported as unsupported.",
+    )
     parser.add_argument(
         "-d",
         "--debug",
@@ -67,6 +106,13 @@ def parse_arguments(print_usage = False, detail = False):
         default=False,
         help="Output results in JSON format.",
     )
+    parser.add_argument(
+        "--compact-json",
+        action="store_true",
+        dest="compact_json",
+        default=False,
+        help="Write JSON output on one line without indentation.",
+    )
     parser.add_argument(
         "-m",
         "--output-md",
@@ -105,6 +151,87 @@ def parse_arguments(print_usage = False, detail = False):
         default=False,
         help="Save output file(s).",
     )
+    parser.add_argument(
+        "--output-dir",
+        action="store",
+        dest="output_dir",
+        default=None,
+        metavar="DIR",
+        help="Save output files under DIR, spread over hashed subdirectories.",
+    )
+    parser.add_argument(
+        "--archive",
+        action="store",
+        dest="archive",
+        default=None,
+        metavar="FILE",
+        help="Save all output files into the zip archive FILE.",
+    )
+    parser.add_argument(
+        "--images",
+        action="store",
+        dest="images",
+        default=None,
+        metavar="DIR",
+        help="Download recipe images into DIR, stored once per distinct image.",
+    )
+    parser.add_argument(
+        "--thumbnail-size",
+        action="store",
+        dest="thumbnail_size",
+        type=int,
+        default=None,
+        metavar="PIXELS",
+        help="Also make JPEG thumbnails of at most PIXELS of the images (requires Pillow).",
+    )
+    parser.add_argument(
+        "--scale",
+        action="store",
+        dest="scale",
+        type=positive_fraction,
+        default=1,
+        metavar="FACTOR",
+        help="Scale the recipe yield and ingredients by FACTOR (e.g. 2, 0.5 or 1/2).",
+    )
+    parser.add_argument(
+        "--units",
+        action="store",
+        dest="units",
+        choices=['metric', 'us'],
+        default=None,
+        help="Convert ingredient amounts to metric or US units.",
+    )
+    parser.add_argument(
+        "--dedup",
+        action="store",
+        dest="dedup",
+        choices=['flag', 'skip'],
+        default=None,
+        help="Detect recipes duplicated across sites in the run and flag them (duplicate_of) or skip them.",
+    )
+    parser.add_argument(
+        "--dedup-threshold",
+        action="store",
+        dest="dedup_threshold",
+        type=float,
+        default=0.8,
+        help="Similarity (0-1) at which recipes are considered duplicates (Default: 0.8).",
+    )
+    parser.add_argument(
+        "--store",
+        action="store",
+        dest="store",
+        default=None,
+        metavar="FILE",
+        help="Save recipes to the local recipe store FILE.",
+    )
+    parser.add_argument(
+        "--default-store",
+        action="store_const",
+        dest="store",
+        const=DEFAULT_STORE,
+        help="Save recipes to the local recipe store %s." % DEFAULT_STORE,
+    )
     parser.add_argument(
         "-f",
         "--force-recipe-scraper",
@@ -113,6 +240,143 @@ def parse_arguments(print_usage = False, detail = False):
         default=False,
         help="For the use of the recipe scraper where applicable.",
     )
+    parser.add_argument(
+        "-u",
+        "--url-file",
+        action="append",
+        dest="url_files",
+        default=[],
+        metavar="FILE",
+        help="Read URLs, one per line, from FILE ('-' for stdin).  May be repeated.",
+    )
+    parser.add_argument(
+        "-J",
+        "--jobs",
+        action="store",
+        dest="jobs",
+        type=int,
+        default=1,
+        help="Number of URLs to process concurrently (Default: 1).",
+    )
+    parser.add_argument(
+        "--rate-limit",
+        action="store",
+        dest="rate_limit",
+        type=float,
+        default=1.0,
+        help="Maximum requests per second to any one site (Default: 1.0).",
+    )
+    parser.add_argument(
+        "--domain-concurrency",
+        action="store",
+        dest="domain_concurrency",
+        type=int,
+        default=2,
+        help="Maximum concurrent requests to any one site (Default: 2).",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        dest="incremental",
+        default=False,
+        help="Skip pages and recipes unchanged since they were last output with the same output options (uses the --store file).",
+    )
+    parser.add_argument(
+        "--retry-failed",
+        action="store_true",
+        dest="retry_failed",
+        default=False,
+        help="Retry URLs that failed recently instead of skipping them (the failures are kept in the --store file).",
+    )
+    parser.add_argument(
+        "--max-page-size",
+        action="store",
+        dest="max_page_size",
+        type=int,
+        default=None,
+        metavar="BYTES",
+        help="Skip pages larger than BYTES.",
+    )
+    parser.add_argument(
+        "--transport",
+        action="store",
+        dest="transport",
+        choices=TRANSPORTS,
+        default="http1",
+        help="Fetch pages over HTTP/1.1 (requests) or HTTP/2 (httpx, sharing one connection per site) (Default: http1).",
+    )
+    parser.add_argument(
+        "--dns-ttl",
+        action="store",
+        dest="dns_ttl",
+        type=int,
+        default=0,
+        metavar="SECONDS",
+        help="Cache host name lookups for SECONDS (Default: 0, not cached).",
+    )
+    parser.add_argument(
+        "--breaker",
+        action="store",
+        dest="breaker",
+        type=int,
+        default=5,
+        metavar="N",
+        help="Skip a site's URLs for a while after N of them fail in a row, 0 to never skip them (Default: 5).",
+    )
+    parser.add_argument(
+        "--sites",
+        action="store",
+        dest="sites",
+        default=None,
+        metavar="FILE",
+        help="Read additional site definitions (selectors by domain) from the JSON file FILE.",
+    )
+    parser.add_argument(
+        "--record",
+        action="store",
+        dest="record",
+        default=None,
+        metavar="FILE",
+        help="Also save every fetched response in the fetch archive FILE.",
+    )
+    parser.add_argument(
+        "--replay",
+        action="store",
+        dest="replay",
+        default=None,
+        metavar="FILE",
+        help="Take responses from the fetch archive FILE instead of the network.  Without URLs every page in FILE is processed.",
+    )
+    parser.add_argument(
+        "--journal",
+        action="store",
+        dest="journal",
+        default=None,
+        metavar="FILE",
+        help="Record batch progress in FILE.  Failed URLs are retried in a second pass instead of stopping the run.",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        dest="resume",
+        default=False,
+        help="Resume the run recorded in the --journal file, skipping URLs already done.",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        dest="profile",
+        default=False,
+        help="Profile the run and write the profile to PREFIX.prof and PREFIX.txt.",
+    )
+    parser.add_argument(
+        "--profile-prefix",
+        action="store",
+        dest="profile_prefix",
+        default="recipe-dl-profile",
+        metavar="PREFIX",
+        help="File name prefix of the --profile output (Default: recipe-dl-profile).",
+    )
     parser.add_argument(
         "--quick-tests",
         action="store_true",
@@ -121,7 +385,37 @@ def parse_arguments(print_usage = False, detail = False):
         default=False
     )
 
-    parser.add_argument('URL', nargs='*', action="append", default=[],)
+    if crawl:
+        parser.add_argument(
+            "--sitemap",
+            action="append",
+            dest="sitemaps",
+            default=[],
+            metavar="URL",
+            help="Read this sitemap instead of the ones listed in the site's robots.txt.  May be repeated.",
+        )
+        parser.add_argument(
+            "--pattern",
+            action="store",
+            dest="pattern",
+            type=path_pattern,
+            default=None,
+            metavar="REGEX",
+            help="Only process URLs whose path matches REGEX (Default: the site's recipe URL pattern).",
+        )
+        parser.add_argument(
+            "--limit",
+            action="store",
+            dest="limit",
+            type=int,
+            default=None,
+            help="Stop after LIMIT recipe URLs.",
+        )
+        parser.add_argument('crawl', metavar='DOMAIN', help="Site to crawl (e.g. www.saveur.com).")
+        parser.set_defaults(URL=[[]])
+    else:
+        parser.add_argument('URL', nargs='*', action="append", default=[], help="URL(s) to process ('-' reads URLs from stdin).")
+        parser.set_defaults(crawl=None)
 
     if print_usage:
         if detail:
@@ -129,7 +423,7 @@ def parse_arguments(print_usage = False, detail = False):
         else:
             parser.print_usage()
     else:
-        args = parser.parse_args()
+        args = parser.parse_args(argv)
 
         if args.quiet is None:
             args.quiet = not args.verbose
@@ -149,7 +443,7 @@ def parse_arguments(print_usage = False, detail = False):
             filetype_count += 1
 
         print_debug("filetype_count=%s" % filetype_count)
-        if filetype_count == 0:
+        if filetype_count == 0 and args.store is None:
             args.output_rst = True
         elif filetype_count > 1:
             print_warning ("More than one output file type select. Assuming 'Save to File'")
@@ -158,12 +452,249 @@ def parse_arguments(print_usage = False, detail = False):
         if not args.save_to_file and not args.outfile is None and args.outfile != '':
             args.save_to_file = True
 
+        if not args.output_dir is None or not args.archive is None:
+            args.save_to_file = True
+        writer_init(output_dir=args.output_dir, workers=max(4, args.jobs))
+
+        if args.incremental and args.store is None:
+            args.store = DEFAULT_STORE
+
+        if not args.crawl is None and args.pattern is None and site_pattern(args.crawl) is None:
+            print_error ("No recipe URL pattern known for %s.  Use --pattern." % args.crawl)
+            parser.print_usage()
+            sys.exit (os.EX_USAGE)
+
+        if not args.record is None and not args.replay is None:
+            print_error ("--record and --replay can not be used together.")
+            parser.print_usage()
+            sys.exit (os.EX_USAGE)
+
+        if args.profile and not args.replay is None and args.jobs > 1:
+            # Replays are parsed in worker processes the profiler does not see
+            print_error ("--profile with --replay needs --jobs 1.")
+            parser.print_usage()
+            sys.exit (os.EX_USAGE)
+
+        if args.resume and args.journal is None:
+            print_error ("--resume requires a --journal file.")
+            parser.print_usage()
+            sys.exit (os.EX_USAGE)
+
         return args
 
+def parse_search_arguments(argv):
+    """ Creates the argument parser for the search command. """
+
+    parser = argparse.ArgumentParser('recipe-dl search')
+    parser.add_argument(
+        "--store",
+        action="store",
+        dest="store",
+        default=DEFAULT_STORE,
+        metavar="FILE",
+        help="Recipe store to search (Default: %s)." % DEFAULT_STORE,
+    )
+    parser.add_argument(
+        "-i",
+        "--ingredient",
+        action="append",
+        dest="ingredients",
+        default=[],
+        help="Only recipes containing INGREDIENT.  May be repeated.",
+    )
+    parser.add_argument(
+        "-n",
+        "--limit",
+        action="store",
+        dest="limit",
+        type=int,
+        default=20,
+        help="Maximum number of results (Default: 20).",
+    )
+    parser.add_argument(
+        "-j",
+        "--output-json",
+        action="store_true",
+        dest="output_json",
+        default=False,
+        help="Output the matching recipes as JSON.",
+    )
+    parser.add_argument('QUERY', nargs='*', help="Full text query (SQLite FTS5 syntax).")
+
+    return parser.parse_args(argv)
+
+def parse_serve_arguments(argv):
+    """ Creates the argument parser for the serve command. """
+
+    parser = argparse.ArgumentParser('recipe-dl serve')
+    parser.add_argument(
+        "--host",
+        action="store",
+        dest="host",
+        default="127.0.0.1",
+        help="Address to listen on (Default: 127.0.0.1).",
+    )
+    parser.add_argument(
+        "-p",
+        "--port",
+        action="store",
+        dest="port",
+        type=int,
+        default=8080,
+        help="Port to listen on (Default: 8080).",
+    )
+    parser.add_argument(
+        "-d",
+        "--debug",
+        action="store_true",
+        dest="debug",
+        default=False,
+        help="Add additional Output",
+    )
+    parser.add_argument(
+        "-v",
+        "--verbose",
+        action="store_true",
+        dest="verbose",
+        default=False,
+        help="Make output verbose",
+    )
+    parser.add_argument(
+        "-f",
+        "--force-recipe-scraper",
+        action="store_true",
+        dest="force_recipe_scraper",
+        default=False,
+        help="For the use of the recipe scraper where applicable.",
+    )
+    parser.add_argument(
+        "-J",
+        "--jobs",
+        action="store",
+        dest="jobs",
+        type=int,
+        default=4,
+        help="Number of URLs to process concurrently (Default: 4).",
+    )
+    parser.add_argument(
+        "--rate-limit",
+        action="store",
+        dest="rate_limit",
+        type=float,
+        default=1.0,
+        help="Maximum requests per second to any one site (Default: 1.0).",
+    )
+    parser.add_argument(
+        "--domain-concurrency",
+        action="store",
+        dest="domain_concurrency",
+        type=int,
+        default=2,
+        help="Maximum concurrent requests to any one site (Default: 2).",
+    )
+    parser.add_argument(
+        "--max-page-size",
+        action="store",
+        dest="max_page_size",
+        type=int,
+        default=None,
+        metavar="BYTES",
+        help="Skip pages larger than BYTES.",
+    )
+    parser.add_argument(
+        "--transport",
+        action="store",
+        dest="transport",
+        choices=TRANSPORTS,
+        default="http1",
+        help="Fetch pages over HTTP/1.1 (requests) or HTTP/2 (httpx, sharing one connection per site) (Default: http1).",
+    )
+    parser.add_argument(
+        "--dns-ttl",
+        action="store",
+        dest="dns_ttl",
+        type=int,
+        default=0,
+        metavar="SECONDS",
+        help="Cache host name lookups for SECONDS (Default: 0, not cached).",
+    )
+    parser.add_argument(
+        "--breaker",
+        action="store",
+        dest="breaker",
+        type=int,
+        default=5,
+        metavar="N",
+        help="Skip a site's URLs for a while after N of them fail in a row, 0 to never skip them (Default: 5).",
+    )
+    parser.add_argument(
+        "--sites",
+        action="store",
+        dest="sites",
+        default=None,
+        metavar="FILE",
+        help="Read additional site definitions (selectors by domain) from the JSON file FILE.",
+    )
+    parser.add_argument(
+        "--store",
+        action="store",
+        dest="store",
+        default=None,
+        metavar="FILE",
+        help="Save recipes to the local recipe store FILE.",
+    )
+    parser.add_argument(
+        "--default-store",
+        action="store_const",
+        dest="store",
+        const=DEFAULT_STORE,
+        help="Save recipes to the local recipe store %s." % DEFAULT_STORE,
+    )
+    # Options of the main command that do not apply to the server
+    parser.set_defaults(
+        authorize_ci=False,
+        interactive=False,
+        incremental=False,
+        retry_failed=False,
+        scale=1,
+        units=None,
+        dedup=None,
+        outfile=None,
+        profile=False,
+        compact_json=False,
+    )
+
+    args = parser.parse_args(argv)
+    args.quiet = not (args.verbose or args.debug)
+    custom_print_init (quiet=args.quiet, debug=args.debug)
+    return args
+
+def search(args):
+    """ Searches the local recipe store """
+
+    if not os.path.isfile(args.store):
+        print_error ("Recipe store %s does not exist." % args.store)
+        sys.exit (os.EX_NOINPUT)
+
+    store = open_store(args.store)
+    query = ' '.join(args.QUERY)
+    try:
+        results = store.search(query, args.ingredients, args.limit)
+    except ValueError as err:
+        print_error ("%s  Put words with punctuation in double quotes, e.g. '\"half-and-half\"'." % err)
+        close_stores()
+        sys.exit (os.EX_USAGE)
+    for url, title, publisher, totaltime in results:
+        if args.output_json:
+            print (JsonCodec.dumps(store.get(url)))
+        else:
+            print ("%s | %s | %s | %s" % (title, publisher, totaltime, url))
+    close_stores()
+
 def quick_tests(args):
     """ some quick tests """
 
-    from UtilityFunctions import url2domain
+    from .UtilityFunctions import url2domain
     url2domain("https://www.finecooking.com/recipe/herbed-grill-roasted-lamb")
 
     tests=[
@@ -176,41 +707,275 @@ def quick_tests(args):
         custom_print_init (quiet=args.quiet, debug=args.debug)
 
         print_info ("==========================")
-        recipe_output(args, url2recipe_json(args, test_url))
+        recipe_output(args, url2recipe_json(args, test_url)).result()
         print_info ("==========================")
 
+def process_url(args, url):
+    """ Returns (url, recipe_json, error) for url """
+
+    try:
+        recipe_json = url2recipe_json(args, url)
+        # Downloaded while other pages are scraped, recipe_output waits
+        # for it
+        start_image(recipe_json)
+        return url, recipe_json, None
+    except Exception as err:
+        return url, None, err
+
+def sites_init(args):
+    """ Loads the site definitions of args.sites """
+
+    if args.sites is None:
+        return
+    try:
+        load_site_definitions(args.sites)
+    except (OSError, ValueError, SyntaxError, re.error) as err:
+        print_error ("Unable to load site definitions %s: %s" % (args.sites, err))
+        sys.exit (os.EX_DATAERR)
+
+def replay_worker_init(args):
+    """ Sets up a process pool worker replaying args.replay (it only runs
+        url2recipe_json, see process_url)
+    """
+
+    custom_print_init (quiet=args.quiet, debug=args.debug)
+    sites_init(args)
+    fetch_init(max_page_size=args.max_page_size, replay=args.replay)
+    breaker_init(args.breaker)
+    # Images, dedup and output stay in the main process.  The negative
+    # cache and fetch state the worker records go to the store file it
+    # shares with the main process.
+    stores_init(commit_every=1)
+    atexit.register(close_stores)
+
+def process_urls(args, urls):
+    """ Yields (url, recipe_json, error) for each url, processing up to
+        args.jobs urls concurrently.  Results are yielded in the order the
+        urls were submitted, so output file names do not depend on which
+        page loads first.  Replays are parsed in worker processes, as they
+        have no network to wait on.
+    """
+
+    if args.jobs <= 1:
+        for url in urls:
+            yield process_url(args, url)
+        return
+
+    if getattr(args, 'replay', None) is None:
+        executor = ThreadPoolExecutor(max_workers=args.jobs, initializer=profile_thread_start)
+        urls = interleave_by_domain(urls)
+    else:
+        stores_init(commit_every=1)
+        executor = ProcessPoolExecutor(max_workers=args.jobs, mp_context=multiprocessing.get_context('spawn'), initializer=replay_worker_init, initargs=(args,))
+    with executor:
+        pending = deque()
+        for url in urls:
+            pending.append(executor.submit(process_url, args, url))
+            if len(pending) >= args.jobs * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+def journal_pass(args, journal, urls):
+    """ Processes urls recording each one in the journal.  Returns the list
+        of urls that failed.
+    """
+
+    def submit(urls):
+        for url in urls:
+            journal.pending(url)
+            yield url
+
+    def fail(url, err):
+        print_error ("%s: %s" % (url, getattr(err, 'message', err)))
+        journal.failed(url, err)
+        failed.append(url)
+
+    def settle(url, outputs):
+        try:
+            journal.done(url, outputs.result())
+        except Exception as err:
+            fail(url, err)
+
+    failed = []
+    # (url, future of its files) in output order, journaled once written
+    written = deque()
+    for url, recipe_json, err in process_urls(args, submit(urls)):
+        while written and written[0][1].done():
+            settle(*written.popleft())
+        if isinstance(err, NotModifiedError):
+            print_info ("   Skipping %s: %s" % (url, err.message))
+            journal.done(url)
+            continue
+        if err is None:
+            try:
+                with profile_stage('output'):
+                    written.append((url, recipe_output(args, recipe_json)))
+                continue
+            except Exception as output_err:
+                err = output_err
+        fail(url, err)
+    while written:
+        settle(*written.popleft())
+    return failed
+
+def with_left_pending(urls, left_pending):
+    """ Yields urls followed by the URLs left pending by the resumed run
+        that were not among them
+    """
+
+    seen = set()
+    for url in urls:
+        seen.add(url)
+        yield url
+    for url in left_pending:
+        if not url in seen:
+            yield url
+
+def journal_run(args, urls):
+    """ Processes urls as a resumable batch.  URLs already done in the
+        journal are skipped and failures are retried in a second pass.
+    """
+
+    journal = BatchJournal(args.journal, resume=args.resume)
+    try:
+        previous = journal.state
+        left_pending = [url for url, status in previous.items() if status == 'pending']
+        if urls is None:
+            urls = left_pending
+        elif left_pending:
+            urls = with_left_pending(urls, left_pending)
+        retry = [url for url, status in previous.items() if status == 'failed']
+
+        failed = journal_pass(args, journal, (url for url in urls if previous.get(url, 'pending') == 'pending'))
+        retry.extend(failed)
+        if retry:
+            print_info ("Retrying %d failed URL(s)..." % len(retry))
+            # The URLs just failed (or failed in the resumed run), so the
+            # negative cache would only turn them away again
+            retry_args = argparse.Namespace(**vars(args))
+            retry_args.retry_failed = True
+            failed = journal_pass(retry_args, journal, retry)
+    finally:
+        journal.close()
+
+    if failed:
+        print_error ("%d URL(s) failed.  See %s" % (len(failed), args.journal))
+        sys.exit (os.EX_TEMPFAIL)
+
 def main(args=None):
     if args is None:
-        args = parse_arguments()
+        if sys.argv[1:2] == ['search']:
+            search(parse_search_arguments(sys.argv[2:]))
+            return
+        if sys.argv[1:2] == ['serve']:
+            args = parse_serve_arguments(sys.argv[2:])
+            sites_init(args)
+            fetch_init(rate_limit=args.rate_limit, domain_concurrency=args.domain_concurrency, pool_size=max(10, args.jobs), max_page_size=args.max_page_size, transport=args.transport, dns_ttl=args.dns_ttl)
+            breaker_init(args.breaker)
+            try:
+                serve(args)
+            finally:
+                close_stores()
+                fetch_close()
+            return
+        if sys.argv[1:2] == ['crawl']:
+            args = parse_arguments(argv=sys.argv[2:], crawl=True)
+        else:
+            args = parse_arguments()
 
     print_debug (args)
+    sites_init(args)
+    if not getattr(args, 'archive', None) is None:
+        archive_init(args.archive, resume=getattr(args, 'resume', False))
+    if not getattr(args, 'images', None) is None:
+        images_init(args.images, args.thumbnail_size, workers=max(8, args.jobs))
+    try:
+        if not args.profile:
+            run(args)
+        else:
+            profile_start()
+            try:
+                run(args)
+            finally:
+                profile_stop()
+                stats_filename, report_filename = profile_report(args.profile_prefix)
+                print_info ("Profile written to %s and %s" % (stats_filename, report_filename))
+    finally:
+        images_close()
+        fetch_close()
+        writer_close()
+        archive_close()
+        close_stores()
+
+def run(args):
+    """ Processes the URL(s) or input file specified in args """
+
     if args.quick_tests:
         quick_tests(args)
     else:
-        if not args.URL == [[]]:
-            for url in args.URL[0]:
+        has_urls = not args.URL == [[]] or args.url_files or not args.crawl is None
+        if not args.replay is None and not has_urls and not args.resume:
+            # Replay every page in the archive
+            has_urls = True
+            archive = FetchArchive(args.replay)
+            urls = archive.urls('text/html')
+            archive.close()
+        elif args.crawl is None:
+            urls = unique_urls(read_urls(args.URL[0], args.url_files))
+        else:
+            # Sitemaps list each page once, skipping unique_urls keeps
+            # memory flat however many pages the site has
+            urls = discover_urls(args.crawl, args.sitemaps, args.pattern, args.limit)
+        if not args.journal is None and (args.resume or has_urls):
+            fetch_init(rate_limit=args.rate_limit, domain_concurrency=args.domain_concurrency, pool_size=max(10, args.jobs), max_page_size=args.max_page_size, record=args.record, replay=args.replay, transport=args.transport, dns_ttl=args.dns_ttl)
+            breaker_init(args.breaker)
+            journal_run(args, urls if has_urls else None)
+        elif has_urls:
+            fetch_init(rate_limit=args.rate_limit, domain_concurrency=args.domain_concurrency, pool_size=max(10, args.jobs), max_page_size=args.max_page_size, record=args.record, replay=args.replay, transport=args.transport, dns_ttl=args.dns_ttl)
+            breaker_init(args.breaker)
+            write_errors = 0
+            written = deque()
+
+            def settle(url, outputs):
+                nonlocal write_errors
                 try:
-                    recipe_json = url2recipe_json(args, url)
-                except UrlError as err:
+                    outputs.result()
+                except OSError as output_err:
+                    print_error ("Unable to write %s: %s" % (url, output_err))
+                    write_errors += 1
+
+            for url, recipe_json, err in process_urls(args, urls):
+                while written and written[0][1].done():
+                    settle(*written.popleft())
+                if isinstance(err, (NotModifiedError, SkippedError)):
+                    print_info ("   Skipping %s: %s" % (url, err.message))
+                    continue
+                elif isinstance(err, UrlError):
                     print_error ("Specified URL Not suported!")
                     sys.exit (os.EX_SOFTWARE)
-                except Exception as err:
-                    print_error (err.args[1])     # arguments stored in .args
+                elif not err is None:
+                    print_error ("%s: %s" % (url, getattr(err, 'message', err)))
                     sys.exit (os.EX_TEMPFAIL)
-                recipe_output(args, recipe_json)
+                with profile_stage('output'):
+                    written.append((url, recipe_output(args, recipe_json)))
+            while written:
+                settle(*written.popleft())
+            if write_errors:
+                print_error ("%d recipe(s) could not be written." % write_errors)
+                sys.exit (os.EX_IOERR)
         else:
             if not args.infile is None and args.infile != "":
                 print_info ("Processsing %s..." % args.infile)
                 with open(args.infile) as json_file:
-                    recipe_json = json.load(json_file)
-                    recipe_output(args, recipe_json)
+                    recipe_json = JsonCodec.load(json_file)
+                    recipe_output(args, recipe_json).result()
             else:
                 print_error ("You must specify an input URL or input JSON file.")
                 parse_arguments(print_usage=True)
                 sys.exit (os.EX_USAGE)
 
 if __name__ == '__main__':
-    args = parse_arguments()
-    main(args)
+    main()
 
 #quick_tests()
@@ -0,0 +1,168 @@
+#!/usr/bin/env bash
+# Tests of the recipe-dl command line against the local stand-in site (fixture-server.py)
+set -u
+
+### Exit Constants
+declare -r -i EX_OK=0            # successful termination
+declare -r -i EX_OSFILE=72       # critical OS file missing
+declare -r -i EX_SOFTWARE=70     # internal software error
+
+declare SCRIPT_PATH=$(dirname $(readlink $0) 2>/dev/null || dirname $0)           # relative
+SCRIPT_PATH="`( cd \"${SCRIPT_PATH}\" && pwd )`"  # absolutized and normalized
+declare -r PROJECT_PATH="`( cd \"${SCRIPT_PATH}/..\" && pwd )`"  # absolutized and normalized
+
+declare -r PYTHON_FILE="${PROJECT_PATH}/recipe_dl/main.py"
+declare -r FIXTURE_SERVER_FILE="${SCRIPT_PATH}/fixture-server.py"
+declare -r COMMAND="python3"
+
+declare -r -i FIXTURE_PORT=${FIXTURE_PORT:-8710}
+declare -r FIXTURE_URL="http://127.0.0.1:${FIXTURE_PORT}"
+
+declare -r -a RECIPE_URLS=(
+  "${FIXTURE_URL}/roast-lamb.html"
+  "${FIXTURE_URL}/rice-pilaf.html"
+  "${FIXTURE_URL}/tomato-soup.html"
+  "${FIXTURE_URL}/lemon-tart.html"
+)
+
+declare -i COUNT_PASS=0
+declare -i COUNT_FAIL=0
+
+declare -a PIDS=()
+declare WORK_PATH=""
+declare OUTPUT=""
+declare -i RC=0
+
+function command_exists() {
+  command -v "$@" > /dev/null 2>&1
+}
+
+function cleanup() {
+  for PID in "${PIDS[@]}"; do
+    kill ${PID} 2>/dev/null
+  done
+  [ -n "${WORK_PATH}" ] && rm -rf "${WORK_PATH}"
+}
+
+function wait_for() {
+  local _URL="${1}"
+  for _ in $(seq 50); do
+    curl --silent --max-time 1 "${_URL}" >/dev/null 2>&1 && return 0
+    sleep 0.1
+  done
+  echo "ERROR: ${_URL} did not come up." >&2
+  exit ${EX_SOFTWARE}
+}
+
+# Runs recipe-dl with the arguments, keeping its output in OUTPUT and its exit code in RC
+function run_recipe_dl() {
+  OUTPUT="$($COMMAND "${PYTHON_FILE}" "$@" 2>&1)"
+  RC=$?
+}
+
+function exit_code_is() {
+  [ ${RC} -eq ${1} ]
+}
+
+function output_has() {
+  grep -q -F -- "${1}" <<< "${OUTPUT}"
+}
+
+function output_lacks() {
+  ! grep -q -F -- "${1}" <<< "${OUTPUT}"
+}
+
+function line_count_is() {
+  [ $(grep -c . <<< "${OUTPUT}") -eq ${1} ]
+}
+
+# check DESCRIPTION CONDITION [ARGUMENTS...], the condition tests the last run
+function check() {
+  local _DESCRIPTION="${1}"
+  shift
+
+  printf 'Test: %-60s ' "${_DESCRIPTION}"
+  if "$@"; then
+    ((COUNT_PASS++))
+    echo "[PASS]"
+  else
+    ((COUNT_FAIL++))
+    echo "[FAIL]"
+    echo "  Condition: $*"
+    echo "  Exit code: ${RC}"
+    echo "  Output:    ${OUTPUT}"
+  fi
+}
+
+if ! command_exists curl; then
+  echo "Script requires curl which is not installed.  Aborting." >&2
+  exit ${EX_OSFILE}
+fi
+
+trap cleanup EXIT
+
+WORK_PATH="$(mktemp -d)"
+cd "${WORK_PATH}"
+
+$COMMAND "${FIXTURE_SERVER_FILE}" --port ${FIXTURE_PORT} >/dev/null 2>&1 &
+PIDS+=($!)
+wait_for "${FIXTURE_URL}/roast-lamb.html"
+
+run_recipe_dl -m "${FIXTURE_URL}/roast-lamb.html"
+check "Markdown output" output_has "## Herbed Roast Leg of Lamb"
+
+# Worker threads share the store, a connection each would lock the others out
+run_recipe_dl -m -s --output-dir out -J 4 --store store.sqlite "${RECIPE_URLS[@]}"
+check "-J 4 --store" exit_code_is 0
+run_recipe_dl search --store store.sqlite
+check "-J 4 --store saves every recipe" line_count_is 4
+
+# The fetch state of --incremental goes through the same shared store
+run_recipe_dl -v -m -s --output-dir incremental -J 4 --store incremental.sqlite --incremental "${RECIPE_URLS[@]}"
+check "-J 4 --incremental" exit_code_is 0
+run_recipe_dl -v -m -s --output-dir incremental -J 4 --store incremental.sqlite --incremental "${RECIPE_URLS[@]}"
+check "-J 4 --incremental skips unchanged pages" output_has "lemon-tart.html: Page content unchanged."
+check "-J 4 --incremental writes no unchanged recipe" output_lacks "Writing output"
+run_recipe_dl -v -j -s --output-dir incremental -J 4 --store incremental.sqlite --incremental "${RECIPE_URLS[@]}"
+check "-J 4 --incremental writes again for new output options" output_has "Writing output to incremental/"
+
+# The journal retries its failures even though the store's negative cache has them
+run_recipe_dl -m -s --store journal.sqlite --journal batch.journal "${FIXTURE_URL}/roast-lamb.html" "${FIXTURE_URL}/no-recipe.html"
+check "--journal --store retry pass" output_lacks "not retrying"
+run_recipe_dl -m -s --store journal.sqlite --journal batch.journal --resume
+check "--journal --store --resume retries the failure" output_has "no-recipe.html: No application+ld json found."
+check "--journal --store --resume ignores the negative cache" output_lacks "not retrying"
+
+# Pages whose recipe cannot be extracted trip the circuit breaker, 4xx pages do not
+run_recipe_dl -m --breaker 2 --journal breaker.journal "${FIXTURE_URL}/no-recipe.html?1" "${FIXTURE_URL}/no-recipe.html?2" "${FIXTURE_URL}/no-recipe.html?3"
+check "--breaker 2 trips after 2 extraction failures" output_has "no-recipe.html?3: 127.0.0.1:${FIXTURE_PORT} failed 2 times in a row"
+run_recipe_dl -m --breaker 2 --journal breaker.journal "${FIXTURE_URL}/status/404?1" "${FIXTURE_URL}/status/404?2" "${FIXTURE_URL}/status/404?3" "${FIXTURE_URL}/roast-lamb.html"
+check "--breaker 2 ignores 4xx pages" output_lacks "in a row"
+check "--breaker 2 processes the page after 4xx pages" output_has "## Herbed Roast Leg of Lamb"
+
+# --scale takes positive numbers only
+run_recipe_dl -m --scale 1/2 "${FIXTURE_URL}/roast-lamb.html"
+check "--scale 1/2" output_has "Yield: 3 servings"
+run_recipe_dl -m --scale 1/0 "${FIXTURE_URL}/roast-lamb.html"
+check "--scale 1/0 is a usage error" exit_code_is 2
+check "--scale 1/0 is reported" output_has "argument --scale: invalid scale factor"
+run_recipe_dl -m --scale 0 "${FIXTURE_URL}/roast-lamb.html"
+check "--scale 0 is a usage error" output_has "must be greater than 0"
+
+# Crawl a sitemap index whose children have the 0.9 namespace and none.  The
+# pattern also matches the image:loc (roast-lamb.jpg), which is not a page.
+run_recipe_dl crawl "127.0.0.1:${FIXTURE_PORT}" --sitemap "${FIXTURE_URL}/sitemap-index.xml" --pattern '^/(roast|rice|tomato|lemon)' -J 2 --store crawl.sqlite
+check "crawl" exit_code_is 0
+run_recipe_dl search --store crawl.sqlite
+check "crawl finds every recipe page" line_count_is 4
+check "crawl reads sitemaps without a namespace" output_has "rice-pilaf.html"
+check "crawl leaves out other hosts" output_lacks "other.example.com"
+run_recipe_dl crawl "127.0.0.1:${FIXTURE_PORT}" --sitemap "${FIXTURE_URL}/sitemap-index.xml" --pattern '('
+check "crawl --pattern ( is a usage error" exit_code_is 2
+check "crawl --pattern ( is reported" output_has "argument --pattern: invalid regular expression"
+
+echo ""
+echo "Results: ${COUNT_PASS} Passed  ${COUNT_FAIL} Failed"
+
+[ ${COUNT_FAIL} -eq 0 ] && exit ${EX_OK}
+exit 1
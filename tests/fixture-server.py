@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Stand-in site for testing recipe-dl without the network.
+
+    Serves the pages in tests/fixtures at http://127.0.0.1:PORT/NAME and
+    answers /status/CODE with that HTTP status, so the scrapers, the
+    command line and recipe-dl serve can be tried against known pages.
+    @BASE_URL@ in the sitemaps is replaced with http://127.0.0.1:PORT.
+
+    python tests/fixture-server.py --port 8700
+    python recipe_dl/main.py -m http://127.0.0.1:8700/roast-lamb.html
+"""
+
+import sys, os
+
+import argparse
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FIXTURE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+CONTENT_TYPES = {
+    '.html': 'text/html; charset=utf-8',
+    '.json': 'application/json',
+    '.xml': 'application/xml',
+    '.jpg': 'image/jpeg',
+}
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    """ Serves the fixture files and /status/CODE responses """
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        path = self.path.split('?', 1)[0]
+        if path.startswith('/status/'):
+            try:
+                status = int(path[len('/status/'):])
+            except ValueError:
+                status = 400
+            self.send_body(status, b'<html><body>Status %d</body></html>' % status)
+            return
+
+        name = os.path.basename(path)
+        filename = os.path.join(self.server.fixture_path, name)
+        if name == '' or not os.path.isfile(filename):
+            self.send_body(404, b'<html><body>Not found</body></html>')
+            return
+        with open(filename, 'rb') as fixture_file:
+            body = fixture_file.read()
+        if name.endswith('.xml'):
+            body = body.replace(b'@BASE_URL@', ('http://127.0.0.1:%d' % self.server.server_address[1]).encode('ascii'))
+        self.send_body(200, body, CONTENT_TYPES.get(os.path.splitext(name)[1], 'application/octet-stream'))
+
+    def send_body(self, status, body, content_type='text/html; charset=utf-8'):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+def parse_arguments():
+    parser = argparse.ArgumentParser('fixture-server', description='Serve the recipe-dl test fixtures locally.')
+    parser.add_argument(
+        "--port",
+        action="store",
+        dest="port",
+        type=int,
+        default=8700,
+        help="Port to listen on (Default: 8700).",
+    )
+    parser.add_argument(
+        "--fixtures",
+        action="store",
+        dest="fixture_path",
+        default=FIXTURE_PATH,
+        metavar="DIR",
+        help="Directory of the pages to serve (Default: tests/fixtures).",
+    )
+    parser.add_argument(
+        "-v",
+        "--verbose",
+        action="store_true",
+        dest="verbose",
+        default=False,
+        help="Log every request.",
+    )
+    return parser.parse_args()
+
+def main():
+    args = parse_arguments()
+
+    if not os.path.isdir(args.fixture_path):
+        print ("Fixture directory %s does not exist." % args.fixture_path, file=sys.stderr)
+        sys.exit(os.EX_NOINPUT)
+
+    server = ThreadingHTTPServer(('127.0.0.1', args.port), FixtureHandler)
+    server.daemon_threads = True
+    server.fixture_path = args.fixture_path
+    server.verbose = args.verbose
+    print ("Serving %s at http://127.0.0.1:%d/" % (args.fixture_path, args.port), flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env bash
+# Tests of recipe-dl serve against the local stand-in site (fixture-server.py)
+set -u
+
+### Exit Constants
+declare -r -i EX_OK=0            # successful termination
+declare -r -i EX_OSFILE=72       # critical OS file missing
+declare -r -i EX_SOFTWARE=70     # internal software error
+
+declare SCRIPT_PATH=$(dirname $(readlink $0) 2>/dev/null || dirname $0)           # relative
+SCRIPT_PATH="`( cd \"${SCRIPT_PATH}\" && pwd )`"  # absolutized and normalized
+declare -r PROJECT_PATH="`( cd \"${SCRIPT_PATH}/..\" && pwd )`"  # absolutized and normalized
+
+declare -r PYTHON_FILE="${PROJECT_PATH}/recipe_dl/main.py"
+declare -r FIXTURE_SERVER_FILE="${SCRIPT_PATH}/fixture-server.py"
+declare -r COMMAND="python3"
+
+declare -r -i FIXTURE_PORT=${FIXTURE_PORT:-8700}
+declare -r -i SERVER_PORT=${SERVER_PORT:-8701}
+declare -r FIXTURE_URL="http://127.0.0.1:${FIXTURE_PORT}"
+declare -r SERVER_URL="http://127.0.0.1:${SERVER_PORT}"
+
+declare -i COUNT_PASS=0
+declare -i COUNT_FAIL=0
+
+declare -a PIDS=()
+declare WORK_PATH=""
+
+function command_exists() {
+  command -v "$@" > /dev/null 2>&1
+}
+
+function cleanup() {
+  for PID in "${PIDS[@]}"; do
+    kill ${PID} 2>/dev/null
+  done
+  [ -n "${WORK_PATH}" ] && rm -rf "${WORK_PATH}"
+}
+
+function wait_for() {
+  local _URL="${1}"
+  for _ in $(seq 50); do
+    curl --silent --max-time 1 "${_URL}" >/dev/null 2>&1 && return 0
+    sleep 0.1
+  done
+  echo "ERROR: ${_URL} did not come up." >&2
+  exit ${EX_SOFTWARE}
+}
+
+# check DESCRIPTION EXPECTED_TEXT CURL_ARGUMENTS...
+function check() {
+  local _DESCRIPTION="${1}"
+  local _EXPECTED="${2}"
+  shift 2
+
+  printf 'Test: %-60s ' "${_DESCRIPTION}"
+  local RESPONSE="$(curl --silent --max-time 20 "$@")"
+  if grep -q -F -- "${_EXPECTED}" <<< "${RESPONSE}"; then
+    ((COUNT_PASS++))
+    echo "[PASS]"
+  else
+    ((COUNT_FAIL++))
+    echo "[FAIL]"
+    echo "  Expected: ${_EXPECTED}"
+    echo "  Response: ${RESPONSE}"
+  fi
+}
+
+if ! command_exists curl; then
+  echo "Script requires curl which is not installed.  Aborting." >&2
+  exit ${EX_OSFILE}
+fi
+
+trap cleanup EXIT
+
+# Run from an empty home directory so no saved Cook's Illustrated cookies are found
+WORK_PATH="$(mktemp -d)"
+cd "${WORK_PATH}"
+
+$COMMAND "${FIXTURE_SERVER_FILE}" --port ${FIXTURE_PORT} >/dev/null 2>&1 &
+PIDS+=($!)
+HOME="${WORK_PATH}" $COMMAND "${PYTHON_FILE}" serve --port ${SERVER_PORT} --jobs 4 --breaker 0 --store store.sqlite >/dev/null 2>&1 &
+PIDS+=($!)
+
+wait_for "${FIXTURE_URL}/roast-lamb.html"
+wait_for "${SERVER_URL}/health"
+
+check "GET /health" '{"status":"ok"}' "${SERVER_URL}/health"
+check "POST /recipe" '"title":"Herbed Roast Leg of Lamb"' \
+  --data "{\"url\": \"${FIXTURE_URL}/roast-lamb.html\", \"formats\": [\"md\"]}" "${SERVER_URL}/recipe"
+check "POST /recipe (md)" '"md":"## Herbed Roast Leg of Lamb' \
+  --data "{\"url\": \"${FIXTURE_URL}/roast-lamb.html\", \"formats\": [\"md\"]}" "${SERVER_URL}/recipe"
+check "POST /recipe (scaled)" '"yield":"12 servings"' \
+  --data "{\"url\": \"${FIXTURE_URL}/roast-lamb.html\", \"scale\": 2}" "${SERVER_URL}/recipe"
+check "POST /recipe (scale 0)" 'HTTP 400' --write-out ' HTTP %{http_code}' \
+  --data "{\"url\": \"${FIXTURE_URL}/roast-lamb.html\", \"scale\": 0}" "${SERVER_URL}/recipe"
+check "POST /recipe (scale 1/0)" 'HTTP 400' --write-out ' HTTP %{http_code}' \
+  --data "{\"url\": \"${FIXTURE_URL}/roast-lamb.html\", \"scale\": \"1/0\"}" "${SERVER_URL}/recipe"
+check "POST /recipe (bad Content-Length)" 'HTTP 400' --write-out ' HTTP %{http_code}' \
+  --header 'Content-Length: abc' --data '{}' "${SERVER_URL}/recipe"
+check "POST /recipe (page without recipe)" '"status":"unsupported"' \
+  --data "{\"url\": \"${FIXTURE_URL}/no-recipe.html\"}" "${SERVER_URL}/recipe"
+check "POST /recipe (server error)" '"status":"error"' \
+  --data "{\"url\": \"${FIXTURE_URL}/status/500\"}" "${SERVER_URL}/recipe"
+check "POST /recipe (sign in without cookies)" '"status":"unsupported"' \
+  --data '{"url": "https://www.cooksillustrated.com/recipes/1-fixture"}' "${SERVER_URL}/recipe"
+check "POST /batch" "\"url\":\"${FIXTURE_URL}/no-recipe.html\"" \
+  --data "{\"urls\": [\"${FIXTURE_URL}/roast-lamb.html\", \"${FIXTURE_URL}/no-recipe.html\"]}" "${SERVER_URL}/batch"
+check "POST /batch (--store)" "\"url\":\"${FIXTURE_URL}/lemon-tart.html\",\"status\":\"ok\"" \
+  --data "{\"urls\": [\"${FIXTURE_URL}/rice-pilaf.html\", \"${FIXTURE_URL}/tomato-soup.html\", \"${FIXTURE_URL}/lemon-tart.html\"]}" "${SERVER_URL}/batch"
+
+echo ""
+echo "Results: ${COUNT_PASS} Passed  ${COUNT_FAIL} Failed"
+
+[ ${COUNT_FAIL} -eq 0 ] && exit ${EX_OK}
+exit 1
@@ -0,0 +1,349 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Load test of the recipe-dl scrape pipeline.
+
+    Starts a local stand-in server (one port per simulated host) serving
+    synthetic recipe pages, plus any pages recorded with recipe-dl --record,
+    with configurable latency, error rate and page size.  Then, for each
+    concurrency level, runs fetch_recipe (url2recipe_json) over the pages in
+    a fresh worker process and reports pages/sec, p50/p95/p99 latency, CPU
+    use and peak RSS of that process.
+
+    python tools/loadtest.py --jobs 1,2,4,8,16 --pages 400 --hosts 4 --latency 50
+"""
+
+import sys, os
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import argparse
+import logging
+import multiprocessing
+import random
+import resource
+import statistics
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from recipe_dl import JsonCodec
+from recipe_dl.RecipeApi import RecipeOptions, fetch_recipe
+from recipe_dl.Fetcher import fetch_init, fetch_close, TRANSPORTS
+from recipe_dl.CircuitBreaker import breaker_init
+from recipe_dl.FetchArchive import FetchArchive
+from recipe_dl.Scheduler import interleave_by_domain
+
+INGREDIENTS = [
+    '1 1/2 cups olive oil',
+    '2 tablespoons chopped fresh rosemary, divided',
+    '3 1/2 pounds leg of lamb',
+    '1 (14-ounce) can diced tomatoes',
+    '4 cloves garlic, minced',
+    '1 teaspoon kosher salt',
+    '1/2 teaspoon freshly ground black pepper',
+    '250 g basmati rice',
+    '2 cups chicken stock',
+    '1 large onion, finely chopped',
+    '3 tablespoons unsalted butter',
+    '1/4 cup chopped fresh parsley',
+]
+
+DIRECTIONS = [
+    'Preheat oven to 400 degrees F.',
+    'Rub the meat with oil, garlic and rosemary and season well.',
+    'Roast for 90 minutes, basting now and then.',
+    'Meanwhile cook the onion in the butter until soft, then add the rice.',
+    'Pour in the stock, cover and simmer for 18 minutes.',
+    'Rest the meat for 15 minutes before carving and serve with the rice.',
+]
+
+FILLER = '<p class="story">This paragraph stands in for the story, comments, navigation and advertising that surround the recipe on a real page.</p>\n'
+
+def synthetic_page(number, page_size):
+    """ Returns a recipe page with JSON-LD recipe data padded with filler
+        to about page_size bytes
+    """
+
+    rng = random.Random(number)
+    recipe = {
+        '@context': 'https://schema.org',
+        '@type': 'Recipe',
+        'name': 'Load Test Recipe %d' % number,
+        'description': 'Synthetic recipe %d.' % number,
+        'recipeYield': '%d servings' % rng.randint(2, 8),
+        'prepTime': 'PT%dM' % rng.randint(5, 40),
+        'cookTime': 'PT%dM' % rng.randint(10, 120),
+        'author': {'@type': 'Person', 'name': 'Load Tester'},
+        'recipeIngredient': rng.sample(INGREDIENTS, rng.randint(5, len(INGREDIENTS))),
+        'recipeInstructions': [{'@type': 'HowToStep', 'text': text} for text in DIRECTIONS[:rng.randint(3, len(DIRECTIONS))]],
+    }
+    head = '<html><head><meta charset="utf-8"><title>%s</title>\n<script type="application/ld+json">%s</script>\n</head><body><h1>%s</h1>\n' % (recipe['name'], JsonCodec.dumps(recipe), recipe['name'])
+    tail = '</body></html>\n'
+    filler = max(0, page_size - len(head) - len(tail)) // len(FILLER)
+    return (head + FILLER * filler + tail).encode('utf-8')
+
+def recorded_pages(filename):
+    """ Returns the bodies of the HTML pages in a recipe-dl --record archive """
+
+    archive = FetchArchive(filename)
+    try:
+        return [archive.read(url)[1] for url in archive.urls('text/html')]
+    finally:
+        archive.close()
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """ Serves page number N of the server's pages at /recipe/N.html """
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server = self.server
+        delay = server.latency + random.uniform(0, server.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+        try:
+            number = int(self.path.rsplit('/', 1)[-1].split('.')[0])
+        except ValueError:
+            number = None
+        if number is None or not self.path.startswith('/recipe/'):
+            self.send_body(404, b'Not found')
+        elif random.random() < server.error_rate:
+            self.send_body(server.error_status, b'<html><body>Server error</body></html>')
+        else:
+            self.send_body(200, server.pages[number % len(server.pages)])
+
+    def send_body(self, status, body):
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_servers(args, pages):
+    """ Starts one stand-in server per simulated host and returns them """
+
+    servers = []
+    for _ in range(args.hosts):
+        server = ThreadingHTTPServer(('127.0.0.1', 0), StandInHandler)
+        server.daemon_threads = True
+        server.pages = pages
+        server.latency = args.latency / 1000.0
+        server.jitter = args.jitter / 1000.0
+        server.error_rate = args.error_rate
+        server.error_status = args.error_status
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+    return servers
+
+def page_urls(servers, count):
+    """ Returns count page URLs spread evenly over the servers """
+
+    return ['http://127.0.0.1:%d/recipe/%d.html' % (servers[number % len(servers)].server_address[1], number) for number in range(count)]
+
+def run_level(jobs, urls, transport):
+    """ Scrapes urls with jobs threads and returns the measurements (run in
+        a fresh process per concurrency level)
+    """
+
+    logger = logging.getLogger('recipe_dl.loadtest')
+    logger.addHandler(logging.NullHandler())
+    logger.propagate = False
+
+    # No politeness delay or breaker, the point is to find the limits
+    fetch_init(rate_limit=0, domain_concurrency=jobs, pool_size=max(10, jobs), transport=transport)
+    breaker_init(0)
+    options = RecipeOptions(logger=logger)
+
+    def scrape(url):
+        start = time.perf_counter()
+        try:
+            fetch_recipe(url, options)
+            ok = True
+        except Exception:
+            ok = False
+        return ok, time.perf_counter() - start
+
+    latencies = []
+    errors = 0
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        for future in as_completed([executor.submit(scrape, url) for url in interleave_by_domain(urls)]):
+            ok, latency = future.result()
+            latencies.append(latency)
+            if not ok:
+                errors += 1
+    elapsed = time.perf_counter() - start
+    end_usage = resource.getrusage(resource.RUSAGE_SELF)
+    fetch_close()
+
+    cpu = (end_usage.ru_utime - usage.ru_utime) + (end_usage.ru_stime - usage.ru_stime)
+    percentiles = statistics.quantiles(latencies, n=100, method='inclusive') if len(latencies) > 1 else latencies * 99
+    return {
+        'jobs': jobs,
+        'pages': len(urls) - errors,
+        'errors': errors,
+        'seconds': round(elapsed, 3),
+        'pages_per_second': round((len(urls) - errors) / elapsed, 2),
+        'p50_ms': round(percentiles[49] * 1000, 1),
+        'p95_ms': round(percentiles[94] * 1000, 1),
+        'p99_ms': round(percentiles[98] * 1000, 1),
+        'cpu_percent': round(100 * cpu / elapsed, 1),
+        # ru_maxrss is in KiB on Linux and bytes on macOS
+        'max_rss_mb': round(end_usage.ru_maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1),
+    }
+
+def print_table(results):
+    columns = ('jobs', 'pages', 'errors', 'pages_per_second', 'p50_ms', 'p95_ms', 'p99_ms', 'cpu_percent', 'max_rss_mb')
+    headings = ('jobs', 'pages', 'errors', 'pages/s', 'p50 ms', 'p95 ms', 'p99 ms', 'cpu %', 'rss MB')
+    print (' '.join('%9s' % heading for heading in headings))
+    for result in results:
+        print (' '.join('%9s' % result[column] for column in columns))
+
+def parse_arguments():
+    parser = argparse.ArgumentParser('loadtest', description='Measure how the recipe-dl scrape pipeline scales with concurrency.')
+    parser.add_argument(
+        "-J",
+        "--jobs",
+        action="store",
+        dest="jobs",
+        default="1,2,4,8,16",
+        help="Comma separated concurrency levels to sweep (Default: 1,2,4,8,16).",
+    )
+    parser.add_argument(
+        "-n",
+        "--pages",
+        action="store",
+        dest="pages",
+        type=int,
+        default=200,
+        help="Pages scraped at each concurrency level (Default: 200).",
+    )
+    parser.add_argument(
+        "--hosts",
+        action="store",
+        dest="hosts",
+        type=int,
+        default=4,
+        help="Number of simulated hosts the pages are spread over (Default: 4).",
+    )
+    parser.add_argument(
+        "--latency",
+        action="store",
+        dest="latency",
+        type=float,
+        default=50.0,
+        metavar="MS",
+        help="Server response delay in milliseconds (Default: 50).",
+    )
+    parser.add_argument(
+        "--jitter",
+        action="store",
+        dest="jitter",
+        type=float,
+        default=20.0,
+        metavar="MS",
+        help="Random extra delay of up to MS milliseconds (Default: 20).",
+    )
+    parser.add_argument(
+        "--error-rate",
+        action="store",
+        dest="error_rate",
+        type=float,
+        default=0.0,
+        help="Fraction (0-1) of requests answered with an error (Default: 0).",
+    )
+    parser.add_argument(
+        "--error-status",
+        action="store",
+        dest="error_status",
+        type=int,
+        default=500,
+        help="HTTP status of error responses (Default: 500).",
+    )
+    parser.add_argument(
+        "--page-size",
+        action="store",
+        dest="page_size",
+        type=int,
+        default=100000,
+        metavar="BYTES",
+        help="Approximate size of the synthetic pages (Default: 100000).",
+    )
+    parser.add_argument(
+        "--synthetic",
+        action="store",
+        dest="synthetic",
+        type=int,
+        default=20,
+        help="Number of distinct synthetic pages (Default: 20).",
+    )
+    parser.add_argument(
+        "--recorded",
+        action="append",
+        dest="recorded",
+        default=[],
+        metavar="FILE",
+        help="Also serve the pages of a recipe-dl --record fetch archive FILE. May be repeated.",
+    )
+    parser.add_argument(
+        "--transport",
+        action="store",
+        dest="transport",
+        choices=TRANSPORTS,
+        default="http1",
+        help="Transport used to fetch the pages (Default: http1).",
+    )
+    parser.add_argument(
+        "--json",
+        action="store_true",
+        dest="json",
+        default=False,
+        help="Print one JSON result per line instead of a table.",
+    )
+    args = parser.parse_args()
+    args.jobs = [int(jobs) for jobs in args.jobs.split(',')]
+    return args
+
+def main():
+    args = parse_arguments()
+
+    pages = [synthetic_page(number, args.page_size) for number in range(args.synthetic)]
+    for filename in args.recorded:
+        pages.extend(recorded_pages(filename))
+    if not pages:
+        print ("No pages to serve.", file=sys.stderr)
+        sys.exit(os.EX_USAGE)
+
+    servers = start_servers(args, pages)
+    urls = page_urls(servers, args.pages)
+    if not args.json:
+        print ("%d pages (%d distinct) over %d hosts, latency %g+%g ms, error rate %g, transport %s" % (
+            args.pages, len(pages), args.hosts, args.latency, args.jitter, args.error_rate, args.transport))
+
+    results = []
+    context = multiprocessing.get_context('spawn')
+    try:
+        for jobs in args.jobs:
+            # A fresh process per level, so CPU and peak RSS are its own
+            with context.Pool(1) as pool:
+                result = pool.apply(run_level, (jobs, urls, args.transport))
+            result.update(hosts=args.hosts, latency_ms=args.latency, error_rate=args.error_rate, page_size=args.page_size, transport=args.transport)
+            results.append(result)
+            if args.json:
+                print (JsonCodec.dumps(result), flush=True)
+    finally:
+        for server in servers:
+            server.shutdown()
+
+    if not args.json:
+        print_table(results)
+
+if __name__ == '__main__':
+    main()